@@ -0,0 +1,510 @@
+"""
+Micro-benchmarks for the search engine in `core.py`.
+
+Run a benchmark by name, for example:
+
+    python benchmark.py parse --collection data/part1/testCollection.dat
+"""
+
+import argparse
+import bisect
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import intcodecs
+from core import Analyzer, BM25, Index, PhraseQuery, Scorer, TfIdf, WORD_RE
+from postings import PostingsBuilder, PostingsIndex
+from querycache import ResultCache
+from wildcard import PermutermIndex
+
+try:
+    from BTrees.OOBTree import OOBTree
+except ImportError:
+    OOBTree = None
+
+
+def _replicate_collection(collection_fp: str, scale: int, out_fp: str) -> None:
+    """Writes a collection containing every page of `collection_fp`
+    repeated `scale` times to `out_fp`.
+    """
+    with open(collection_fp) as f:
+        content = f.read()
+    start = content.find('<page>')
+    end = content.rfind('</page>') + len('</page>')
+    pages = content[start:end]
+    with open(out_fp, 'w') as f:
+        f.write(content[:start])
+        for _ in range(scale):
+            f.write(pages)
+            f.write('\n')
+        f.write(content[end:])
+
+
+def bench_parse(args) -> None:
+    """Times the streaming collection parser on growing copies of
+    the collection, to show that parsing scales linearly.
+    """
+    print('{:>6} {:>10} {:>10} {:>8} {:>10} {:>10}'.format(
+        'scale', 'MB', 'pages', 'secs', 'MB/s', 'peak MB'))
+    scale = 1
+    while scale <= args.max_scale:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fp = os.path.join(tmp_dir, 'collection.dat')
+            _replicate_collection(args.collection, scale, fp)
+            size = os.path.getsize(fp) / 2 ** 20
+            index = Index([])
+
+            start = time.perf_counter()
+            if args.index:
+                index.parse(fp, args.chunk_size)
+                pages = len(index.title_index)
+            else:
+                with open(fp) as f:
+                    pages = sum(1 for _ in index._parse_xml(f, args.chunk_size))
+            secs = time.perf_counter() - start
+
+            peak = float('nan')
+            if args.memory:
+                tracemalloc.start()
+                with open(fp) as f:
+                    for _ in index._parse_xml(f, args.chunk_size):
+                        pass
+                peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+
+        print('{:>6} {:>10.1f} {:>10} {:>8.2f} {:>10.1f} {:>10.2f}'.format(
+            scale, size, pages, secs, size / secs, peak))
+        scale *= 2
+
+
+def bench_build(args) -> None:
+    """Compares the serial index build with Index.build on an increasing
+    number of worker processes."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_fp = os.path.join(tmp_dir, 'index.bin')
+        title_fp = os.path.join(tmp_dir, 'titles.bin')
+
+        start = time.perf_counter()
+        index = Index([])
+        index.parse(args.collection, args.chunk_size)
+        index.write(index_fp, title_fp, binary=True)
+        serial = time.perf_counter() - start
+        print('{:>8} {:>8} {:>8}'.format('workers', 'secs', 'speedup'))
+        print('{:>8} {:>8.2f} {:>8.2f}'.format('serial', serial, 1))
+
+        workers = 1
+        while workers <= args.max_workers:
+            start = time.perf_counter()
+            Index([]).build(args.collection, index_fp, title_fp, workers,
+                            chunk_size=args.chunk_size)
+            secs = time.perf_counter() - start
+            print('{:>8} {:>8.2f} {:>8.2f}'.format(workers, secs, serial / secs))
+            workers *= 2
+
+
+def bench_analyze(args) -> None:
+    """Reports the tokens per second analysed by Analyzer.get_terms, one
+    page at a time, and by Analyzer.get_terms_many on the whole collection."""
+    with open(args.stopwords) as f:
+        stopwords = [line.rstrip('\n') for line in f]
+    with open(args.collection) as f:
+        streams = [page['stream'] for page in Index([])._parse_xml(f, args.chunk_size)]
+    tokens = sum(len(WORD_RE.findall(stream.lower())) for stream in streams)
+
+    print('{:>22} {:>10} {:>8} {:>12}'.format('method', 'tokens', 'secs', 'tokens/s'))
+    for name, analyze in (
+            ('get_terms', lambda analyzer: [list(analyzer.get_terms(s)) for s in streams]),
+            ('get_terms_many', lambda analyzer: analyzer.get_terms_many(streams))):
+        for cache in ('cold', 'warm'):
+            analyzer = Analyzer(stopwords)
+            if cache == 'warm':
+                analyze(analyzer)
+            start = time.perf_counter()
+            analyze(analyzer)
+            secs = time.perf_counter() - start
+            print('{:>22} {:>10} {:>8.2f} {:>12.0f}'.format(
+                '{} ({})'.format(name, cache), tokens, secs, tokens / secs))
+
+
+def bench_phrase(args) -> None:
+    """Reports the latency of a two-term phrase query as the number of
+    positions of its terms in every document grows."""
+    print('{:>10} {:>10} {:>12}'.format('positions', 'docs', 'ms/query'))
+    length = 10
+    while length <= args.max_postings:
+        # Both terms occur `length` times per document, but only once in sequence
+        index = Index([])
+        docs = {str(doc_id): list(range(0, 3 * length, 3)) for doc_id in range(10)}
+        inverted_index = {
+            'x': docs, 'y': {doc_id: [p + 2 for p in pos] for doc_id, pos in docs.items()}}
+        for positions in inverted_index['y'].values():
+            positions[-1] -= 1
+        index.inverted_index = PostingsIndex.from_mapping(inverted_index)
+        query = PhraseQuery('"x y"')
+
+        repeats = max(1, 100000 // length)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            assert len(query.match(index)) == len(docs)
+        secs = (time.perf_counter() - start) / repeats
+        print('{:>10} {:>10} {:>12.3f}'.format(length, len(docs), secs * 1000))
+        length *= 10
+
+
+class OOBTreePermuterms:
+    """The permuterm B-tree of final/queryIndex.py, which stores every
+    rotation of every term (see makePermuterms and singleWildcard)."""
+
+    def __init__(self, terms):
+        self.btree = OOBTree()
+        for term in terms:
+            rotation = term + '$'
+            for _ in range(len(rotation)):
+                self.btree[rotation] = term
+                rotation = rotation[1:] + rotation[:1]
+
+    def match(self, pattern: str) -> List[str]:
+        parts = pattern.split('*')
+        key = parts[-1] + '$' + parts[0]
+        return sorted(set(self.btree.values(min=key, max=key + '{', excludemax=True)))
+
+
+def bench_wildcard(args) -> None:
+    """Compares the memory and latency of PermutermIndex with a permuterm
+    OOBTree, on the vocabulary of the collection."""
+    index = Index([])
+    index.parse(args.collection, args.chunk_size)
+    terms = sorted(index.inverted_index)
+    # Patterns built from the prefixes and suffixes of every 97th term
+    patterns = [p for term in terms[::97] if len(term) > 3
+                for p in (term[:2] + '*', '*' + term[-3:], term[0] + '*' + term[-1])]
+
+    impls = [('PermutermIndex', PermutermIndex)]
+    if OOBTree is not None:
+        impls.append(('OOBTree', OOBTreePermuterms))
+    print('{} terms, {} patterns'.format(len(terms), len(patterns)))
+    print('{:>16} {:>10} {:>10} {:>12}'.format('index', 'build s', 'MB', 'us/pattern'))
+    results = []
+    for name, impl in impls:
+        tracemalloc.start()
+        start = time.perf_counter()
+        permuterms = impl(terms)
+        build = time.perf_counter() - start
+        size = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        results.append([permuterms.match(pattern) for pattern in patterns])
+        latency = (time.perf_counter() - start) / len(patterns)
+        print('{:>16} {:>10.2f} {:>10.1f} {:>12.1f}'.format(name, build, size, latency * 1e6))
+    assert all(result == results[0] for result in results)
+
+
+def _nested_postings(pages: List[Dict], page_terms: List[List[str]]) -> Dict:
+    """Builds the nested dictionaries of term to doc id to positions which
+    Index used before PostingsIndex."""
+    inverted_index = dict()
+    for page, terms in zip(pages, page_terms):
+        for pos, term in enumerate(terms):
+            inverted_index.setdefault(term, {}).setdefault(page['id'], []).append(pos)
+    return inverted_index
+
+
+def _compact_postings(pages: List[Dict], page_terms: List[List[str]]) -> Dict:
+    builder = PostingsBuilder()
+    for page, terms in zip(pages, page_terms):
+        builder.add(page['id'], terms)
+    return builder.build()
+
+
+def bench_postings(args) -> None:
+    """Compares the memory held by nested dictionaries of postings and by
+    a PostingsIndex, per posting (term and document) and per position."""
+    with open(args.collection) as f:
+        pages = list(Index([])._parse_xml(f, args.chunk_size))
+    page_terms = Analyzer([]).get_terms_many(page['stream'] for page in pages)
+    positions = sum(map(len, page_terms))
+    num_postings = sum(len(set(terms)) for terms in page_terms)
+
+    print('{} postings, {} positions'.format(num_postings, positions))
+    print('{:>10} {:>8} {:>10} {:>10} {:>14} {:>14}'.format(
+        'layout', 'secs', 'MB', 'peak MB', 'B/posting', 'B/position'))
+    for name, build in (('nested', _nested_postings), ('compact', _compact_postings)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        inverted_index = build(pages, page_terms)
+        secs = time.perf_counter() - start
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('{:>10} {:>8.2f} {:>10.1f} {:>10.1f} {:>14.1f} {:>14.1f}'.format(
+            name, secs, size / 2 ** 20, peak / 2 ** 20,
+            size / num_postings, size / positions))
+        del inverted_index
+
+
+def bench_codecs(args) -> None:
+    """Compares the size and decoding speed of the integer codecs on the
+    doc ids, term frequencies and position gaps of the collection's
+    postings lists."""
+    index = Index([])
+    index.parse(args.collection, args.chunk_size)
+    lists = {'doc ids': [], 'freqs': [], 'positions': []}
+    for term in index.inverted_index:
+        doc_ids, term_freqs = index.term_freqs(term)
+        lists['doc ids'].append(doc_ids)
+        lists['freqs'].append(term_freqs)
+        postings = index[term]
+        lists['positions'].append([pos - prev for doc_id in map(str, doc_ids)
+                                   for prev, pos in zip([0] + postings[doc_id],
+                                                        postings[doc_id])])
+
+    print('{:>10} {:>10} {:>10} {:>12} {:>10}'.format(
+        'codec', 'list', 'bits/int', 'encode secs', 'M ints/s'))
+    for name, codec in intcodecs.CODECS.items():
+        for kind, values in lists.items():
+            encode = codec.encode_sorted if kind == 'doc ids' else codec.encode
+            decode = codec.decode_sorted if kind == 'doc ids' else codec.decode
+            start = time.perf_counter()
+            encoded = [encode(v) for v in values]
+            encode_secs = time.perf_counter() - start
+            start = time.perf_counter()
+            for buf, v in zip(encoded, values):
+                decode(buf, len(v))
+            decode_secs = time.perf_counter() - start
+            num_ints = sum(map(len, values))
+            print('{:>10} {:>10} {:>10.2f} {:>12.2f} {:>10.2f}'.format(
+                name, kind, 8 * sum(map(len, encoded)) / num_ints, encode_secs,
+                num_ints / decode_secs / 1e6))
+
+
+def bench_lookup(args) -> None:
+    """Times looking a document up in postings lists of growing length of
+    a binary index, by decoding only its block and by decoding the list."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_fp = os.path.join(tmp_dir, 'index.bin')
+        title_fp = os.path.join(tmp_dir, 'titles.bin')
+        index = Index([])
+        index.parse(args.collection, args.chunk_size)
+        index.write(index_fp, title_fp, binary=True)
+        index.read(index_fp, title_fp)
+        mapped = index.inverted_index
+        # The longest postings list with at most each power of 4 documents
+        by_length = dict()
+        for term in mapped:
+            doc_freq = mapped.doc_freq(term)
+            bucket = 4 ** math.ceil(math.log(doc_freq, 4))
+            if doc_freq > by_length.get(bucket, (0, None))[0]:
+                by_length[bucket] = (doc_freq, term)
+
+        rng = random.Random(1)
+        print('{:>8} {:>12} {:>12}'.format('docs', 'block us', 'full us'))
+        for _, (doc_freq, term) in sorted(by_length.items()):
+            doc_ids = mapped.doc_ids(term)
+            lookups = [[rng.choice(doc_ids)] for _ in range(1000)]
+            start = time.perf_counter()
+            for doc_id in lookups:
+                mapped.lookup(term, doc_id)
+            block = (time.perf_counter() - start) / len(lookups)
+            start = time.perf_counter()
+            for doc_id in lookups:
+                all_doc_ids, term_freqs = mapped.term_freqs(term)
+                term_freqs[bisect.bisect_left(all_doc_ids, doc_id[0])]
+            full = (time.perf_counter() - start) / len(lookups)
+            print('{:>8} {:>12.1f} {:>12.1f}'.format(doc_freq, block * 1e6, full * 1e6))
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def _free_text_queries(index: Index, num_queries: int) -> List[str]:
+    """Returns random free text queries of 2 to 5 terms, drawn from the
+    vocabulary with probability proportional to document frequency."""
+    rng = random.Random(0)
+    terms = sorted(index.inverted_index)
+    doc_freqs = [index.doc_freq(term) for term in terms]
+    return [' '.join(rng.choices(terms, doc_freqs, k=rng.randint(2, 5)))
+            for _ in range(num_queries)]
+
+
+def bench_rank(args) -> None:
+    """Compares exhaustive and MaxScore ranking of free text queries on a
+    binary index: postings scored and p50/p99 latency."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_fp = os.path.join(tmp_dir, 'index.bin')
+        title_fp = os.path.join(tmp_dir, 'titles.bin')
+        index = Index([])
+        index.parse(args.collection, args.chunk_size)
+        index.write(index_fp, title_fp, binary=True)
+        index = Index([])
+        index.read(index_fp, title_fp)
+        queries = _free_text_queries(index, args.num_queries)
+
+        print('{:>6} {:>10} {:>14} {:>10} {:>10}'.format(
+            'model', 'pruning', 'postings/q', 'p50 ms', 'p99 ms'))
+        for name, model in (('tfidf', TfIdf()), ('bm25', BM25())):
+            results = []
+            for prune in (False, True):
+                scorer = Scorer(index, model, prune)
+                latencies = []
+                results.append([])
+                for query in queries:
+                    start = time.perf_counter()
+                    results[-1].append(scorer.search(query, args.k))
+                    latencies.append(time.perf_counter() - start)
+                print('{:>6} {:>10} {:>14.0f} {:>10.2f} {:>10.2f}'.format(
+                    name, 'MaxScore' if prune else 'none', scorer.evaluated / len(queries),
+                    _percentile(latencies, 0.5) * 1000, _percentile(latencies, 0.99) * 1000))
+            assert results[0] == results[1]
+
+
+def bench_cache(args) -> None:
+    """Replays a query log in which a few queries are much more frequent
+    than others (a Zipf distribution) with and without the result cache."""
+    index = Index([])
+    index.parse(args.collection, args.chunk_size)
+    queries = _free_text_queries(index, args.num_queries)
+    rng = random.Random(1)
+    log = rng.choices(queries, [1 / rank for rank in range(1, len(queries) + 1)],
+                      k=10 * len(queries))
+
+    print('{:>8} {:>10} {:>10} {:>10} {:>12}'.format(
+        'cache', 'hit ratio', 'p50 ms', 'mean ms', 'saved secs'))
+    for max_entries in (0, args.num_queries // 10, args.num_queries):
+        index.result_cache = ResultCache(max_entries=max_entries)
+        latencies = []
+        for query in log:
+            start = time.perf_counter()
+            index.search(query, args.k)
+            latencies.append(time.perf_counter() - start)
+        stats = index.result_cache.stats()
+        print('{:>8} {:>10.2f} {:>10.3f} {:>10.3f} {:>12.2f}'.format(
+            max_entries, stats['hit_ratio'], _percentile(latencies, 0.5) * 1000,
+            sum(latencies) / len(latencies) * 1000, stats['saved_secs']))
+
+
+def bench_batch(args) -> None:
+    """Compares answering a Zipf-distributed query log one query at a time,
+    without the result cache, with Index.search_many on a binary index."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_fp = os.path.join(tmp_dir, 'index.bin')
+        title_fp = os.path.join(tmp_dir, 'titles.bin')
+        index = Index([])
+        index.parse(args.collection, args.chunk_size)
+        index.write(index_fp, title_fp, binary=True)
+        index = Index([])
+        index.read(index_fp, title_fp)
+        queries = _free_text_queries(index, args.num_queries)
+        rng = random.Random(1)
+        log = rng.choices(queries, [1 / rank for rank in range(1, len(queries) + 1)],
+                          k=args.log_size)
+
+        print('{} queries, {} distinct'.format(len(log), len(set(log))))
+        print('{:>16} {:>8} {:>10} {:>8}'.format('method', 'secs', 'qps', 'speedup'))
+        serial = None
+        for name, workers in [('search', 0)] + [('search_many', w) for w in (1, args.max_workers)]:
+            index.result_cache = ResultCache(max_entries=0 if workers == 0 else 10000)
+            start = time.perf_counter()
+            if workers == 0:
+                results = [index.search(query, args.k) for query in log]
+            else:
+                assert index.search_many(log, args.k, workers) == results
+            secs = time.perf_counter() - start
+            serial = serial or secs
+            print('{:>16} {:>8.2f} {:>10.0f} {:>8.1f}'.format(
+                '{} ({})'.format(name, workers) if workers else name,
+                secs, len(log) / secs, serial / secs))
+
+
+def bench_update(args) -> None:
+    """Compares adding a delta of changed pages to a segmented index with
+    rebuilding the binary index, and the query latency of both."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(args.collection) as f:
+            pages = list(Index._iter_pages(f, args.chunk_size))
+        delta_fp = os.path.join(tmp_dir, 'delta.dat')
+        with open(delta_fp, 'w') as f:
+            for page in random.Random(1).sample(pages, max(1, len(pages) // 100)):
+                f.write(page + '</page>\n')
+
+        index_fp = os.path.join(tmp_dir, 'index.bin')
+        title_fp = os.path.join(tmp_dir, 'titles.bin')
+        start = time.perf_counter()
+        rebuilt = Index([])
+        rebuilt.parse(args.collection, args.chunk_size)
+        rebuilt.write(index_fp, title_fp, binary=True)
+        rebuilt.read(index_fp, title_fp)
+        rebuild_secs = time.perf_counter() - start
+
+        segmented = Index([])
+        segmented.open_segments(os.path.join(tmp_dir, 'segments'))
+        segmented.update(args.collection, args.chunk_size)
+        segmented.inverted_index.wait_for_merges()
+        start = time.perf_counter()
+        segmented.update(delta_fp, args.chunk_size)
+        update_secs = time.perf_counter() - start
+
+        print('{} pages, {} in the delta, {} segments'.format(
+            len(pages), max(1, len(pages) // 100), len(segmented.inverted_index.segments)))
+        print('{:>10} {:>10} {:>10}'.format('method', 'secs', 'p50 ms'))
+        queries = _free_text_queries(rebuilt, args.num_queries)
+        for name, index, secs in (('rebuild', rebuilt, rebuild_secs),
+                                  ('update', segmented, update_secs)):
+            index.result_cache = ResultCache(max_entries=0)
+            latencies = []
+            for query in queries:
+                query_start = time.perf_counter()
+                index.search(query, args.k)
+                latencies.append(time.perf_counter() - query_start)
+            print('{:>10} {:>10.3f} {:>10.3f}'.format(
+                name, secs, _percentile(latencies, 0.5) * 1000))
+        segmented.inverted_index.close()
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'parse': bench_parse,
+    'build': bench_build,
+    'analyze': bench_analyze,
+    'phrase': bench_phrase,
+    'wildcard': bench_wildcard,
+    'postings': bench_postings,
+    'codecs': bench_codecs,
+    'lookup': bench_lookup,
+    'rank': bench_rank,
+    'cache': bench_cache,
+    'batch': bench_batch,
+    'update': bench_update,
+}
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--collection', default='data/part1/testCollection.dat')
+    parser.add_argument('--stopwords', default='data/part1/stopWords.dat')
+    parser.add_argument('--max-scale', type=int, default=64,
+                        help='largest number of copies of the collection to parse')
+    parser.add_argument('--chunk-size', type=int, default=1 << 20)
+    parser.add_argument('--index', action='store_true',
+                        help='build the full index instead of only parsing pages')
+    parser.add_argument('--memory', action='store_true',
+                        help='also report the peak memory used while parsing')
+    parser.add_argument('--max-postings', type=int, default=100000,
+                        help='largest number of positions per document to query')
+    parser.add_argument('--num-queries', type=int, default=1000)
+    parser.add_argument('--log-size', type=int, default=10000,
+                        help='number of queries in the replayed query log')
+    parser.add_argument('-k', type=int, default=10, help='number of results to rank')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count(),
+                        help='largest number of processes to build the index with')
+    args = parser.parse_args(argv)
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,122 +6,600 @@ This implementation of a search engine is composed of three classes:
     - a query, which is
 """
 
+import bisect
+import contextlib
 import functools
+import heapq
+import itertools
 import json
+import math
+import multiprocessing
+import os
 import re
-from typing import List, Set, Dict, Generator
+import tempfile
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import (IO, Callable, List, Set, Dict, FrozenSet, Generator, Iterable, Optional,
+                    Tuple)
 
 from nltk.stem import PorterStemmer
 
+import diskindex
+import intcodecs
 from boolparser import bool_expr_ast
+from postings import PostingsBuilder, PostingsIndex
+from querycache import ResultCache
+from segments import FLUSH_PAGES, MERGE_FACTOR, SegmentedIndex, SegmentedTitles
+from wildcard import PermutermIndex
+
+# Number of characters read from the collection file at a time
+CHUNK_SIZE = 1 << 20
+# Number of pages indexed by each worker of a parallel build
+SEGMENT_PAGES = 2000
+# Number of words whose stems are remembered by an Analyzer
+STEM_CACHE_SIZE = 100000
+# Words are the runs of characters left after lowercasing the stream
+WORD_RE = re.compile(r'[a-z0-9]+')
+# Operators and delimiters of the query syntax, which are not terms
+QUERY_SYNTAX_RE = re.compile(r'\bAND\b|\bOR\b|[()"]')
+# How much longer one sorted list must be than another for their
+# intersection to binary search it rather than merge the two lists
+GALLOP_RATIO = 8
+
+
+class StemCache:
+    """A bounded cache of the stems of words, evicting the least
+    recently used word when full."""
+
+    def __init__(self, max_size: int = STEM_CACHE_SIZE):
+        self.max_size = max_size
+        self.ps = PorterStemmer()
+        self.stems = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def stem(self, word: str) -> str:
+        try:
+            stemmed_word = self.stems[word]
+        except KeyError:
+            self.misses += 1
+            stemmed_word = self.ps.stem(word)
+            self._insert(word, stemmed_word)
+            return stemmed_word
+        self.hits += 1
+        self.stems.move_to_end(word)
+        return stemmed_word
+
+    def _insert(self, word: str, stemmed_word: str) -> None:
+        self.stems[word] = stemmed_word
+        if len(self.stems) > self.max_size:
+            self.stems.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {'size': len(self.stems), 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0}
+
+    def read(self, filepath: str) -> None:
+        """Adds the stems saved by write() to the cache."""
+        with open(filepath, 'r') as f:
+            for word, stemmed_word in json.load(f):
+                self._insert(word, stemmed_word)
+
+    def write(self, filepath: str) -> None:
+        """Saves the cached stems, from least to most recently used."""
+        with open(filepath, 'w') as f:
+            json.dump(list(self.stems.items()), f)
 
 
 class Analyzer:
     """Filtering stopwords and stemming"""
 
-    def __init__(self, stopwords=None):
+    def __init__(self, stopwords=None, stem_cache_size: int = STEM_CACHE_SIZE):
         if stopwords is None:
-            self.stopwords = []
+            self.stopwords = frozenset()
         else:
-            self.stopwords = stopwords
-        self.ps = PorterStemmer()
+            self.stopwords = frozenset(stopwords)
+        self.stem_cache = StemCache(stem_cache_size)
 
     def get_terms(self, stream) -> Generator[str, None, None]:
         """Takes in a stream of words and returns a list of terms."""
-        words = filter(None, re.split(r'[^a-z0-9]', stream.lower()))
-        for word in words:
-            if word not in self.stopwords:
-                stemmed_word = self.ps.stem(word)
+        stopwords = self.stopwords
+        stem = self.stem_cache.stem
+        for word in WORD_RE.findall(stream.lower()):
+            if word not in stopwords:
+                stemmed_word = stem(word)
                 if stemmed_word:
                     yield stemmed_word
 
+    def get_terms_many(self, streams: Iterable[str]) -> List[List[str]]:
+        """Returns the list of terms of each stream. Each distinct word
+        of the batch goes through the stem cache only once."""
+        stopwords = self.stopwords
+        stem = self.stem_cache.stem
+        findall = WORD_RE.findall
+        stems = dict()  # The stems of the words in this batch
+        terms = []
+        for stream in streams:
+            stream_terms = []
+            for word in findall(stream.lower()):
+                try:
+                    stemmed_word = stems[word]
+                except KeyError:
+                    stemmed_word = stems[word] = '' if word in stopwords else stem(word)
+                if stemmed_word:
+                    stream_terms.append(stemmed_word)
+            terms.append(stream_terms)
+        return terms
+
 
 class Index:
     """Collection parsing and index construction"""
 
-    def __init__(self, stopwords):
+    def __init__(self, stopwords, stem_cache_size: int = STEM_CACHE_SIZE):
         self.stopwords = stopwords
-        self.analyzer = Analyzer(self.stopwords)
-        # TODO (Issue #4): Should the inverted index be a dictionary, or its own class?
+        self.analyzer = Analyzer(self.stopwords, stem_cache_size)
         self.title_index = dict()
-        self.inverted_index = dict()  # We'll encode the index as a nested dictionary
-
-    def parse(self, collection_fp: str) -> None:
+        # Maps each term to a mapping of doc id to positions. Parsed and JSON
+        # indexes are compacted into a PostingsIndex, binary ones are mapped.
+        self.inverted_index = PostingsIndex.from_mapping(dict())
+        self.scoring_model = TfIdf()
+        self.result_cache = ResultCache()
+        self._batch_postings = None  # Postings fetched by the current search_many
+        self._reset_caches()
+
+    def _reset_caches(self) -> None:
+        """Drops the structures derived from the index, after it changed."""
+        self._permuterms = None  # Built on the first wildcard query
+        self._doc_stats = None  # Built on the first ranked query
+        self._term_bounds = dict()
+        self._scorer = None
+        self.result_cache.clear()
+
+    @property
+    def permuterms(self) -> PermutermIndex:
+        """The permuterm index of the terms, used to expand wildcards."""
+        if self._permuterms is None:
+            self._permuterms = PermutermIndex(self.inverted_index)
+        return self._permuterms
+
+    @property
+    def doc_stats(self) -> diskindex.DocStats:
+        """The document lengths and norms used for ranking. Binary indexes
+        store them; otherwise they are computed from the postings."""
+        if self._doc_stats is None:
+            self._doc_stats = self.inverted_index.doc_stats
+        return self._doc_stats
+
+    @property
+    def scorer(self) -> 'Scorer':
+        """The scorer ranking search results with the scoring model."""
+        if self._scorer is None or self._scorer.model is not self.scoring_model:
+            self._scorer = Scorer(self, self.scoring_model)
+        return self._scorer
+
+    def parse(self, collection_fp: str, chunk_size: int = CHUNK_SIZE) -> None:
         """Parses the collection file to construct the internal
         index structure (stored as the attribute self._index)
+
+        The collection is streamed in chunks of `chunk_size` characters,
+        so only a single page (plus the read buffer) is held in memory.
         """
         with open(collection_fp) as f:
-            # TODO: What if the file won't fit in memory? (We can ignore this for now)
-            content: str = f.read()
-        for page in self._parse_xml(content):
-            stream = page['stream']
-            terms = self.analyzer.get_terms(stream)
-
+            self._add_pages((page, self.analyzer.get_terms(page['stream']))
+                            for page in self._parse_xml(f, chunk_size))
+
+    def build(self, collection_fp: str, index_filepath: str, title_filepath: str,
+              workers: int = None, segment_pages: int = SEGMENT_PAGES,
+              chunk_size: int = CHUNK_SIZE) -> None:
+        """Indexes the collection on `workers` processes, writes the result
+        as a binary index and reads it back.
+
+        Each worker indexes a range of `segment_pages` pages and writes a
+        sorted segment, and the segments are then merged. The output is the
+        same as calling parse() and then write(..., binary=True).
+        """
+        workers = workers or os.cpu_count()
+        out_dir = os.path.dirname(os.path.abspath(index_filepath))
+        with tempfile.TemporaryDirectory(dir=out_dir) as segment_dir, \
+                ProcessPoolExecutor(workers, initializer=_init_worker,
+                                    initargs=(self.stopwords,)) as executor:
+            futures = []
+            with open(collection_fp) as f:
+                pages = self._iter_pages(f, chunk_size)
+                while True:
+                    batch = list(itertools.islice(pages, segment_pages))
+                    if not batch:
+                        break
+                    segment_fp = os.path.join(segment_dir, str(len(futures)))
+                    futures.append(executor.submit(
+                        self._build_segment, batch, segment_fp + '.index', segment_fp + '.titles'))
+                    # Bound the number of batches held in memory
+                    if len(futures) > 2 * workers:
+                        futures[-2 * workers - 1].result()
+            segments = [future.result() for future in futures]
+            diskindex.merge_indexes(index_filepath, [index_fp for index_fp, _ in segments])
+            diskindex.merge_titles(title_filepath, [title_fp for _, title_fp in segments])
+        self.read(index_filepath, title_filepath)
+
+    def _add_pages(self, pages: Iterable[Tuple[Dict, Iterable[str]]]) -> None:
+        """Indexes (page, terms) pairs into a new PostingsIndex."""
+        builder = PostingsBuilder()
+        for page, terms in pages:
             self.title_index[page['id']] = page['title']
-            # Start adding entries to the inverted index
-            for pos, term in enumerate(terms):
-                if term in self.inverted_index:
-                    if page['id'] in self.inverted_index[term]:
-                        self.inverted_index[term][page['id']].append(pos)
-                    else:
-                        self.inverted_index[term][page['id']] = [pos]
-                else:
-                    self.inverted_index[term] = {}
-                    self.inverted_index[term][page['id']] = [pos]
-
-    def _parse_xml(self, s) -> Generator[Dict, None, None]:
+            builder.add(page['id'], terms)
+        self.inverted_index = builder.build()
+        self._reset_caches()
+
+    @staticmethod
+    def _build_segment(pages: List[str], index_filepath: str,
+                       title_filepath: str) -> Tuple[str, str]:
+        """Indexes raw pages with the index of the worker process and
+        writes them as a binary segment. Run by the workers of build()."""
+        index = _worker_index
+        index.title_index = dict()
+        pages = [Index._parse_page(page) for page in pages]
+        page_terms = index.analyzer.get_terms_many(page['stream'] for page in pages)
+        Index._add_pages(index, zip(pages, page_terms))
+        index.write(index_filepath, title_filepath, binary=True)
+        return index_filepath, title_filepath
+
+    def open_segments(self, directory: str, flush_pages: int = FLUSH_PAGES,
+                      merge_factor: int = MERGE_FACTOR) -> None:
+        """Uses the segmented index in `directory`, creating it if needed.
+        Pages can then be added with update() and removed with delete(),
+        without rebuilding the index."""
+        self.inverted_index = SegmentedIndex(directory, flush_pages, merge_factor)
+        self.title_index = SegmentedTitles(self.inverted_index)
+        self._reset_caches()
+
+    def update(self, collection_fp: str, chunk_size: int = CHUNK_SIZE) -> None:
+        """Adds the pages of a collection file to a segmented index,
+        replacing the pages with the same doc ids, and commits them."""
+        if not isinstance(self.inverted_index, SegmentedIndex):
+            raise ValueError('only an index opened with open_segments() can be updated')
+        with open(collection_fp) as f:
+            for page in self._parse_xml(f, chunk_size):
+                self.inverted_index.add(page['id'], page['title'],
+                                        self.analyzer.get_terms(page['stream']))
+        self.inverted_index.commit()
+        self._reset_caches()
+
+    def delete(self, doc_ids: Iterable[str]) -> None:
+        """Deletes pages from a segmented index, and commits the deletions."""
+        if not isinstance(self.inverted_index, SegmentedIndex):
+            raise ValueError('only an index opened with open_segments() can be updated')
+        for doc_id in doc_ids:
+            self.inverted_index.delete(doc_id)
+        self.inverted_index.commit()
+        self._reset_caches()
+
+    def _parse_xml(self, f: IO[str], chunk_size: int = CHUNK_SIZE) -> Generator[Dict, None, None]:
+        """Yields the pages of the collection read from the file object `f`."""
         # TODO: If we use a different data dump, we should use a library like lxml
-        while s.find('<page>') > -1:
-            start_i = s.find('<id>')
-            end_i = s.find('</id>')
-            doc_id = s[start_i + 4:end_i]
+        for page in self._iter_pages(f, chunk_size):
+            yield self._parse_page(page)
 
-            start_i = s.find('<title>')
-            end_i = s.find('</title')
-            title = s[start_i + 7: end_i]
+    @staticmethod
+    def _iter_pages(f: IO[str], chunk_size: int) -> Generator[str, None, None]:
+        """Reads `f` in fixed-size chunks and yields the raw contents of
+        each <page> element. The buffer never holds more than one page
+        plus a single chunk.
+        """
+        buffer = ''
+        pos = 0  # Start of the unconsumed part of the buffer
+        search_from = 0  # Where to resume looking for '</page>'
+        eof = False
+        while True:
+            start = buffer.find('<page>', pos)
+            if start > -1:
+                end = buffer.find('</page>', max(start, search_from))
+                if end > -1:
+                    yield buffer[start:end]
+                    pos = search_from = end + len('</page>')
+                    continue
+                if eof:
+                    # An unterminated page at the end of the file
+                    yield buffer[start:]
+                    return
+                pos = start
+            elif eof:
+                return
+            else:
+                # Keep enough of the tail to match a '<page>' split across chunks
+                pos = max(pos, len(buffer) - len('<page>') + 1)
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            # Only rescan the tail which could hold a partial '</page>'
+            search_from = max(pos, len(buffer) - len('</page>') + 1) - pos
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+    @staticmethod
+    def _parse_page(s: str) -> Dict:
+        start_i = s.find('<id>')
+        end_i = s.find('</id>')
+        doc_id = s[start_i + 4:end_i]
 
-            start_i = s.find('<text>')
-            end_i = s.find('</text>')
-            text = s[start_i + 6: end_i]
-            stream = '{}\n{}'.format(title, text)
+        start_i = s.find('<title>')
+        end_i = s.find('</title')
+        title = s[start_i + 7: end_i]
 
-            yield {'id': doc_id, 'title': title, 'stream': stream}
-            s = s[s.find('</page>') + 1:]
+        start_i = s.find('<text>')
+        end_i = s.find('</text>')
+        text = s[start_i + 6: end_i]
+        stream = '{}\n{}'.format(title, text)
 
-    def read(self, index_filepath: str, title_filepath: str) -> None:
+        return {'id': doc_id, 'title': title, 'stream': stream}
+
+    def read(self, index_filepath: str, title_filepath: str, stems_filepath: str = None) -> None:
         """Constructs the index from the input index file at
-        the given path."""
-        # self._index = ...
-        with open(index_filepath, 'r') as f:
-            self.inverted_index = json.load(f)
+        the given path.
+
+        Binary index files are memory-mapped, and postings are only
+        decoded when a term is looked up. Stems saved by write() are
+        loaded into the analyzer's stem cache from `stems_filepath`.
+        """
+        if stems_filepath is not None and os.path.exists(stems_filepath):
+            self.analyzer.stem_cache.read(stems_filepath)
+        self._reset_caches()
+        if diskindex.is_binary(index_filepath):
+            self.inverted_index = diskindex.MappedIndex(index_filepath)
+            self.title_index = diskindex.MappedTitles(title_filepath)
+            return
         with open(title_filepath, 'r') as f:
             self.title_index = json.load(f)
-
-    def write(self, index_filepath: str, title_filepath: str) -> None:
-        """Writes the index to disk at the given folder"""
+        with open(index_filepath, 'r') as f:
+            self.inverted_index = PostingsIndex.from_mapping(json.load(f), self.title_index)
+
+    def write(self, index_filepath: str, title_filepath: str, binary: bool = False,
+              stems_filepath: str = None, codec: str = None) -> None:
+        """Writes the index to disk at the given folder, as JSON or in
+        the binary format of the `diskindex` module, whose postings are
+        encoded with the named codec of `intcodecs` if given. The
+        analyzer's stem cache is also saved if `stems_filepath` is given."""
+        if codec is not None and not binary:
+            raise ValueError('only binary indexes can use a codec')
+        if stems_filepath is not None:
+            self.analyzer.stem_cache.write(stems_filepath)
+        if binary:
+            diskindex.write_index(index_filepath, self.inverted_index, self.doc_stats,
+                                  intcodecs.get_codec(codec) if codec else None)
+            diskindex.write_titles(title_filepath, self.title_index)
+            return
         with open(index_filepath, 'w') as f:
-            json.dump(self.inverted_index, f)
+            json.dump({term: dict(postings) for term, postings in self.inverted_index.items()}, f)
         with open(title_filepath, 'w') as f:
-            json.dump(self.title_index, f)
+            json.dump(dict(self.title_index), f)
 
-    def search(self, query_string: str) -> List[int]:
-        """Searches the index for the file"""
+    def search(self, query_string: str, k: int = None) -> List[int]:
+        """Searches the index for the file. Returns all of the matches
+        sorted by doc id, or the `k` best matches ranked by the scorer.
+
+        Results are cached by the normalised query, until the index changes.
+        """
+        return self.result_cache.get(self._cache_key(query_string, k),
+                                     functools.partial(self._evaluate, query_string, k))
+
+    def search_many(self, query_strings: Iterable[str], k: int = None,
+                    workers: int = 1) -> List[List[int]]:
+        """Returns the results of search() for each of a batch of queries.
+
+        The queries are all normalised first, so that each distinct query
+        is evaluated once, and the postings of each term are fetched and
+        decoded once for the whole batch. With more than one worker, the
+        distinct queries are split across forked processes.
+        """
+        query_strings = list(query_strings)
+        keys = [self._cache_key(query_string, k) for query_string in query_strings]
+        distinct = dict(zip(keys, query_strings))
+        if workers > 1 and len(distinct) > 1 and \
+                'fork' in multiprocessing.get_all_start_methods():
+            results = self._search_forked(distinct, k, workers)
+        else:
+            with self.sharing_postings():
+                results = {key: self.result_cache.get(
+                    key, functools.partial(self._evaluate, query_string, k))
+                           for key, query_string in distinct.items()}
+        return [list(results[key]) for key in keys]
+
+    def _search_forked(self, distinct: Dict[Tuple, str], k: int,
+                       workers: int) -> Dict[Tuple, List[int]]:
+        global _batch_index  # pylint: disable=global-statement
+        keys = list(distinct)
+        # Deal the queries out in turn, so that every worker gets a share of
+        # the frequent and of the rare ones
+        chunks = [keys[i::workers] for i in range(min(workers, len(keys)))]
+        _batch_index = self  # Inherited by the forked workers
+        try:
+            with multiprocessing.get_context('fork').Pool(len(chunks)) as pool:
+                chunk_results = pool.starmap(
+                    _search_batch, [([distinct[key] for key in chunk], k) for chunk in chunks])
+        finally:
+            _batch_index = None
+        results = dict()
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            for key, key_results in zip(chunk, chunk_result):
+                self.result_cache.put(key, key_results)
+                results[key] = key_results
+        return results
+
+    def _evaluate(self, query_string: str, k: int = None) -> List[int]:
+        if k is not None:
+            return [doc_id for doc_id, _ in self.scorer.search(query_string, k)]
+        return sorted(QueryFactory.create(query_string).match(self), key=int)
+
+    @contextlib.contextmanager
+    def sharing_postings(self):
+        """Within the context, the postings of each term are only fetched
+        and decoded once, for searching a batch of queries. The postings
+        are held until the context exits."""
+        self._batch_postings = dict()
+        try:
+            yield
+        finally:
+            self._batch_postings = None
+
+    def _shared(self, kind: str, term: str, fetch: Callable):
+        """Returns fetch(term), from the postings already fetched in a batch."""
+        if self._batch_postings is None:
+            return fetch(term)
+        key = (kind, term)
+        if key not in self._batch_postings:
+            self._batch_postings[key] = fetch(term)
+        return self._batch_postings[key]
+
+    def _cache_key(self, query_string: str, k: int = None) -> Tuple:
+        """Returns the normalised form of a query, shared by the query
+        strings with the same results: its analysed terms and wildcard
+        patterns, in the structure the query matches them with."""
         query = QueryFactory.create(query_string)
-        return sorted(query.match(self), key=int)
-        # TODO (ISSUE 5): TF-IDF ranking
-        # Scorer().score(results) ...
+        if isinstance(query, PhraseQuery):
+            key = ('phrase', tuple(self.analyzer.get_terms(query_string)))
+        elif isinstance(query, BooleanQuery):
+            key = ('boolean', self._normalise_ast(bool_expr_ast(query_string)))
+        else:
+            key = ('terms', WildcardQuery.normalise(query_string, self.analyzer))
+        if k is None:
+            return key
+        # Ranking also depends on the terms the scorer weighs, and the model
+        return key + (k, WildcardQuery.normalise(QUERY_SYNTAX_RE.sub(' ', query_string),
+                                                 self.analyzer), self.scoring_model)
+
+    def _normalise_ast(self, parsed_query):
+        if isinstance(parsed_query, str):
+            return WildcardQuery.normalise(parsed_query, self.analyzer)
+        operator, operands = parsed_query
+        return operator, frozenset(self._normalise_ast(operand) for operand in operands)
 
     def __getitem__(self, term) -> Dict[int, List[int]]:
         """Returns a dictionary containing mappings of doc_id to the
-        positions in the document the term appears in.
+        positions in the document the term appears in. Compact and binary
+        indexes return a read-only mapping which decodes them on lookup.
 
         Documents in which the term doesn't appear in are not keys
         of the dictionary.
         """
         if term in self.inverted_index:
-            return self.inverted_index[term]
+            return self._shared('positions', term, self.inverted_index.__getitem__)
         return dict()
 
+    def doc_freq(self, term: str) -> int:
+        """Returns the number of documents the term appears in."""
+        if term not in self.inverted_index:
+            return 0
+        return self.inverted_index.doc_freq(term)
+
+    def doc_ids(self, term: str) -> List[int]:
+        """Returns the sorted ids of the documents the term appears in."""
+        if term not in self.inverted_index:
+            return []
+        return self.term_freqs(term)[0]
+
+    def term_bounds(self, term: str) -> diskindex.TermBounds:
+        """Returns the statistics bounding the weight of the term in any
+        document. Binary and segmented indexes store them; otherwise they
+        are computed on the term's first lookup."""
+        if isinstance(self.inverted_index, (diskindex.MappedIndex, SegmentedIndex)):
+            return self.inverted_index.term_bounds(term)
+        if term not in self._term_bounds:
+            self._term_bounds[term] = self.doc_stats.term_bounds(self.inverted_index[term])
+        return self._term_bounds[term]
+
+    def lookup(self, term: str, doc_ids: List[int]) -> List[Optional[int]]:
+        """Returns the number of times the term appears in each document of
+        a sorted list of doc ids, or None for the documents it doesn't
+        appear in. Binary indexes only decode the blocks of postings which
+        may hold the documents."""
+        if term not in self.inverted_index:
+            return [None] * len(doc_ids)
+        if isinstance(self.inverted_index, diskindex.MappedIndex):
+            return self.inverted_index.lookup(term, doc_ids)
+        all_doc_ids, term_freqs = self.term_freqs(term)
+        return [None if j is None else term_freqs[j]
+                for j in _gallop_lookup(doc_ids, all_doc_ids, 0)]
+
+    def term_freqs(self, term: str) -> Tuple[List[int], List[int]]:
+        """Returns the sorted ids of the documents the term appears in,
+        and the number of times it appears in each."""
+        if term not in self.inverted_index:
+            return [], []
+        return self._shared('term_freqs', term, self.inverted_index.term_freqs)
+
+
+# The index used by each process of Index.build
+_worker_index = None
+# The index searched by each process of Index.search_many
+_batch_index = None
+
+
+def _init_worker(stopwords) -> None:
+    global _worker_index  # pylint: disable=global-statement
+    _worker_index = Index(stopwords)
+
+
+def _search_batch(query_strings: List[str], k: int) -> List[List[int]]:
+    with _batch_index.sharing_postings():
+        return [_batch_index.search(query_string, k) for query_string in query_strings]
+
+def intersect(a: List[int], b: List[int], offset: int = 0) -> List[int]:
+    """Returns the elements x of the sorted list `a` for which x + offset
+    is in the sorted list `b`.
+
+    The lists are merged in linear time, unless one is much longer than
+    the other, in which case the elements of the shorter one are looked up
+    in the longer one by galloping (exponential) search.
+    """
+    if len(a) * GALLOP_RATIO < len(b):
+        found = _gallop_lookup(a, b, offset)
+        return [x for x, y in zip(a, found) if y is not None]
+    if len(b) * GALLOP_RATIO < len(a):
+        found = _gallop_lookup(b, a, -offset)
+        return [x - offset for x, y in zip(b, found) if y is not None]
+    to_return = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        y = b[j] - offset
+        if a[i] == y:
+            to_return.append(y)
+            i += 1
+            j += 1
+        elif a[i] < y:
+            i += 1
+        else:
+            j += 1
+    return to_return
+
+
+def _gallop_lookup(short: List[int], long: List[int], offset: int) -> List[int]:
+    """Returns, for every x of `short`, the index of x + offset in `long`
+    or None when it is missing."""
+    found = []
+    lo = 0
+    for x in short:
+        target = x + offset
+        step = 1
+        hi = lo
+        while hi < len(long) and long[hi] < target:
+            lo = hi + 1
+            hi = lo + step
+            step *= 2
+        lo = bisect.bisect_left(long, target, lo, min(hi, len(long)))
+        found.append(lo if lo < len(long) and long[lo] == target else None)
+    return found
+
+
+def union(lists: List[List[int]]) -> List[int]:
+    """Returns the sorted union of sorted lists, by a heap-based k-way merge."""
+    if len(lists) == 1:
+        return lists[0]
+    to_return = []
+    for x in heapq.merge(*lists):
+        if not to_return or to_return[-1] != x:
+            to_return.append(x)
+    return to_return
+
 
 class Query:
     def __init__(self, query_string: str):
@@ -148,55 +626,102 @@ class FreeTextQuery(OneWordQuery):
 
 class PhraseQuery(Query):
     def match(self, index: Index) -> Set[int]:
-        # TODO (Issue #3)
-        query_terms = index.analyzer.get_terms(self.query_string)
-        curr_indices = index[query_terms[0]]
-        for i in range(1, len(query_terms)):
-            next_indices = index[query_terms[i]]
-            temp_next = dict()
-            matches = set(curr_indices.keys()).intersection(set(next_indices.keys()))
-            for doc_id in matches:
-                doc_id_list = self.merge_lists(curr_indices[doc_id], next_indices[doc_id])
-                if len(doc_id_list) > 0:
-                    temp_next[doc_id] = doc_id_list
-            curr_indices = temp_next
-        return set(curr_indices.keys())
-
-    def merge_lists(self, curr_indices : List, next_indices : List) -> List:
-        to_return = []
-        for i in range(len(curr_indices)):
-            for j in range(len(next_indices)):
-                if curr_indices[i] + 1 == next_indices[j]:
-                    to_return.append(next_indices[j])
-        return to_return
+        query_terms = list(index.analyzer.get_terms(self.query_string))
+        if not query_terms:
+            return set()
+        # Pair each term's postings with its offset in the phrase, rarest term first
+        postings = sorted(((index[term], offset) for offset, term in enumerate(query_terms)),
+                          key=lambda p: len(p[0]))
+        doc_ids = set(postings[0][0])
+        for term_postings, _ in postings[1:]:
+            doc_ids.intersection_update(term_postings)
+
+        matches = set()
+        rarest_postings, rarest_offset = postings[0]
+        for doc_id in doc_ids:
+            # Candidate positions of the phrase's first term in the document
+            starts = [pos - rarest_offset for pos in rarest_postings[doc_id]]
+            for term_postings, offset in postings[1:]:
+                starts = intersect(starts, term_postings[doc_id], offset)
+                if not starts:
+                    break
+            else:
+                matches.add(doc_id)
+        return matches
 
 
 class BooleanQuery(Query):
     def match(self, index: Index) -> Set[int]:
-        # TODO (Issue #2)
-        #terms = index.analyzer.get_terms(self.query_string)
-        # A single word may be split into multiple terms!
         parsed_query = bool_expr_ast(self.query_string)
+        return set(map(str, self.helper(parsed_query, index)))
 
-        return self.helper(parsed_query, index)
-
-    def helper(self, parsed_query, index):
+    def helper(self, parsed_query, index: Index) -> List[int]:
+        """Returns the sorted ids of the documents matching the parsed query."""
         if isinstance(parsed_query, str):
-            return OneWordQuery(parsed_query).match(index)
+            # A single word may be split into multiple terms!
+            terms = WildcardQuery.expand(parsed_query, index)
+            return union([index.doc_ids(term) for term in terms])
 
         operator, operands = parsed_query
-
-        matches = [self.helper(operand, index) for operand in operands]
         if operator == 'OR':
-            return functools.reduce(lambda s, t: s.union(t), matches)
-        else:  # AND
-            return functools.reduce(lambda s, t: s.intersection(t), matches)
+            return union([self.helper(operand, index) for operand in operands])
+        # AND: start from the operand matching the fewest documents, so that
+        # the work done is bounded by the rarest operand
+        matches = None
+        for operand in sorted(operands, key=lambda o: self.estimate(o, index)):
+            if matches is not None and isinstance(operand, str) and \
+                    len(matches) * GALLOP_RATIO < self.estimate(operand, index):
+                # Look the few matches up rather than read the whole postings
+                found = [index.lookup(term, matches)
+                         for term in WildcardQuery.expand(operand, index)]
+                matches = [doc_id for doc_id, *term_freqs in zip(matches, *found)
+                           if any(term_freq is not None for term_freq in term_freqs)]
+            else:
+                operand_matches = self.helper(operand, index)
+                matches = operand_matches if matches is None else \
+                    intersect(matches, operand_matches)
+            if not matches:
+                break
+        return matches
+
+    def estimate(self, parsed_query, index: Index) -> int:
+        """Returns an upper bound of the number of documents matching
+        the parsed query, without reading any postings."""
+        if isinstance(parsed_query, str):
+            return sum(index.doc_freq(term) for term in WildcardQuery.expand(parsed_query, index))
+        operator, operands = parsed_query
+        estimates = [self.estimate(operand, index) for operand in operands]
+        return sum(estimates) if operator == 'OR' else min(estimates)
 
 
 class WildcardQuery(Query):
     def match(self, index: Index) -> Set[int]:
-        # TODO (Issue #1)
-        raise NotImplementedError
+        terms = self.expand(self.query_string, index)
+        return set(map(str, union([index.doc_ids(term) for term in terms])))
+
+    @staticmethod
+    def expand(query_string: str, index: Index) -> Set[str]:
+        """Returns the terms of the query, replacing every word containing
+        a '*' with the indexed terms it matches."""
+        terms = set()
+        for word in WildcardQuery.normalise(query_string, index.analyzer):
+            if '*' in word:
+                terms.update(index.permuterms.match(word))
+            else:
+                terms.add(word)
+        return terms
+
+    @staticmethod
+    def normalise(query_string: str, analyzer: Analyzer) -> FrozenSet[str]:
+        """Returns the terms of the words of the query, and the words
+        containing a '*' as they are."""
+        words = set()
+        for word in query_string.lower().split():
+            if '*' in word:
+                words.add(word)
+            else:
+                words.update(analyzer.get_terms(word))
+        return frozenset(words)
 
 
 class QueryFactory:
@@ -206,6 +731,8 @@ class QueryFactory:
             return PhraseQuery(query_string)
         if any([t in query_string for t in ('(', ')', 'AND', 'OR')]):
             return BooleanQuery(query_string)
+        if '*' in query_string:
+            return WildcardQuery(query_string)
         words = query_string.split()
         if len(words) == 1:
             return OneWordQuery(query_string)
@@ -215,9 +742,150 @@ class QueryFactory:
             raise ValueError('This query string is not supported.')
 
 
+class TfIdf:
+    """Tf-idf weights of the document terms, normalised by the Euclidean
+    norm of the document's term frequencies"""
+
+    @staticmethod
+    def idf(doc_freq: int, doc_stats: diskindex.DocStats) -> float:
+        return math.log(len(doc_stats) / doc_freq)
+
+    @staticmethod
+    def weight(term_freq: int, idf: float, doc: int, doc_stats: diskindex.DocStats) -> float:
+        return term_freq * idf / doc_stats.norms[doc]
+
+    @staticmethod
+    def max_weight(idf: float, bounds: diskindex.TermBounds,
+                   _doc_stats: diskindex.DocStats) -> float:
+        """Returns an upper bound of the weight of a term in any document.
+        Takes the doc stats for the same signature as BM25.max_weight."""
+        return idf * bounds.max_tf_norm
+
+
+class BM25:
+    """Okapi BM25"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    @staticmethod
+    def idf(doc_freq: int, doc_stats: diskindex.DocStats) -> float:
+        return math.log(1 + (len(doc_stats) - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def weight(self, term_freq: int, idf: float, doc: int, doc_stats: diskindex.DocStats) -> float:
+        length_ratio = doc_stats.lengths[doc] / doc_stats.avg_length
+        return idf * term_freq * (self.k1 + 1) / (
+            term_freq + self.k1 * (1 - self.b + self.b * length_ratio))
+
+    def max_weight(self, idf: float, bounds: diskindex.TermBounds,
+                   doc_stats: diskindex.DocStats) -> float:
+        """Returns an upper bound of the weight of a term in any document.
+        The weight grows with the term frequency and shrinks with the
+        document length."""
+        length_ratio = bounds.min_length / doc_stats.avg_length
+        return idf * bounds.max_tf * (self.k1 + 1) / (
+            bounds.max_tf + self.k1 * (1 - self.b + self.b * length_ratio))
+
+
 class Scorer:
-    # TODO (Issue 5): TF-IDF ranking
-    pass
+    """Ranks the documents matching a query, term at a time.
+
+    The score of every document is accumulated in an array indexed by
+    document number, and only the entries touched by a query are reset
+    afterwards, so a query costs time proportional to the postings of
+    its terms. Terms are added by decreasing upper bound of their weight.
+
+    Unless the query is a phrase or boolean query, MaxScore pruning
+    skips postings once the bounds of the remaining terms show that no
+    new document can make it into the top k: only the documents already
+    scored that still can are looked up in the remaining postings. The
+    results are the same as without pruning.
+    """
+
+    def __init__(self, index: Index, model=None, prune: bool = True):
+        self.index = index
+        self.model = TfIdf() if model is None else model
+        self.prune = prune
+        self.doc_stats = index.doc_stats
+        self.scores = array('d', bytes(8 * len(self.doc_stats)))
+        self.touched = bytearray(len(self.doc_stats))
+        self.evaluated = 0  # The number of postings scored so far
+
+    def search(self, query_string: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Returns the ids and scores of the `k` best documents matching
+        the query, best first. Documents with equal scores are ordered by id."""
+        if k <= 0:
+            return []
+        query = QueryFactory.create(query_string)
+        allowed = None
+        if not isinstance(query, (OneWordQuery, WildcardQuery)):
+            # Restrict phrase and boolean queries to their matches
+            matches = sorted(map(int, query.match(self.index)))
+            allowed = set(self.doc_stats.find(matches))
+
+        scores, touched, doc_stats = self.scores, self.touched, self.doc_stats
+        weight = self.model.weight
+        postings = self._postings(self.query_terms(query_string))
+        # The sum of the bounds of postings[i:]
+        remaining = list(itertools.accumulate(p[0] for p in reversed(postings)))[::-1]
+        scored = []  # Every document touched, to reset afterwards
+        candidates = scored  # The documents which can still make it into the top k
+        for i, (_, term, idf) in enumerate(postings):
+            threshold = -math.inf
+            if self.prune and allowed is None and len(candidates) >= k:
+                threshold = heapq.nlargest(k, (scores[doc] for doc in candidates))[-1]
+            if remaining[i] < threshold:
+                # Documents not scored yet cannot reach the top k, nor can
+                # those whose score would stay below the threshold, so only
+                # the others are looked up in the term's postings
+                candidates = sorted(doc for doc in candidates
+                                    if scores[doc] + remaining[i] >= threshold)
+                found = self.index.lookup(term, [doc_stats.doc_ids[doc] for doc in candidates])
+                for doc, term_freq in zip(candidates, found):
+                    if term_freq is not None:
+                        scores[doc] += weight(term_freq, idf, doc, doc_stats)
+                        self.evaluated += 1
+                continue
+            doc_ids, term_freqs = self.index.term_freqs(term)
+            docs = doc_stats.find(doc_ids)
+            self.evaluated += len(docs)
+            for doc, term_freq in zip(docs, term_freqs):
+                if not touched[doc]:
+                    touched[doc] = 1
+                    scored.append(doc)
+                scores[doc] += weight(term_freq, idf, doc, doc_stats)
+
+        if allowed is not None:
+            candidates = [doc for doc in candidates if doc in allowed]
+        top = heapq.nlargest(k, candidates, key=lambda doc: (scores[doc], -doc))
+        results = [(str(doc_stats.doc_ids[doc]), scores[doc]) for doc in top]
+        for doc in scored:
+            scores[doc] = 0.0
+            touched[doc] = 0
+        return results
+
+    def _postings(self, terms: Set[str]) -> List[Tuple[float, str, float]]:
+        """Returns the upper bound of the weight and the idf of each query
+        term found in the index, by decreasing bound. Their postings are
+        only read when needed.
+
+        The bounds are slightly inflated so that rounding errors never
+        prune a document which belongs in the top k.
+        """
+        postings = []
+        for term in sorted(terms):
+            doc_freq = self.index.doc_freq(term)
+            if doc_freq:
+                idf = self.model.idf(doc_freq, self.doc_stats)
+                bound = self.model.max_weight(idf, self.index.term_bounds(term), self.doc_stats)
+                postings.append((bound * (1 + 1e-9), term, idf))
+        postings.sort(key=lambda p: -p[0])
+        return postings
+
+    def query_terms(self, query_string: str) -> Set[str]:
+        """Returns the terms of the query, without the boolean operators."""
+        return WildcardQuery.expand(QUERY_SYNTAX_RE.sub(' ', query_string), self.index)
 
 
 def main():
@@ -0,0 +1,661 @@
+"""
+Binary on-disk format for the inverted index and the title store.
+
+Both files share the same layout:
+
+    header:     magic (4 bytes), dictionary offset (8 bytes), number of keys
+                (8 bytes), trailer offset (8 bytes)
+    data:       one block per key
+    dictionary: for every key, in sorted order, varint(len(key)), the UTF-8
+                encoded key, and varint(gap to the offset of the key's block)
+    trailer:    data about the whole file, 8-byte aligned
+
+A block ends where the block of the next key begins. Reading a file
+only decodes the dictionary; blocks are decoded on lookup from a
+memory-mapped view of the file.
+
+A postings block starts with the term's TermBounds: an 8-byte double
+(the largest term frequency divided by the document's norm), varint(the
+largest term frequency) and varint(the length of the shortest document),
+then varint(number of documents). Doc ids must be integers (as strings).
+In the original layout, of indexes with the magic SIX1, these are
+followed by a varint (doc id gap, number of positions) pair for every
+document, and the gap-encoded positions of every document in the same
+order.
+
+The trailer of an index holds its DocStats: the number of documents,
+then arrays of 8-byte doc ids, lengths, sums of squared term frequencies
+and norms, in order of doc id.
+
+A title block holds the UTF-8 encoded title.
+
+Indexes written now encode postings with a codec of the `intcodecs`
+module (VByte by default), whose id replaces the last byte of the magic,
+and split them into blocks of BLOCK_SIZE documents which can be decoded
+on their own. After the bounds and varint(number of documents), such a
+postings block holds:
+
+    skip table: if there are several blocks, the first doc id (8 bytes)
+                and the offset from the end of the skip table (4 bytes)
+                of every block
+    blocks:     for every block, varint(bytes of doc ids), varint(bytes of
+                term frequencies), the codec's encoding of the doc ids less
+                the block's first doc id, and of the term frequencies
+    positions:  the codec's encoding of the positions of every document,
+                gap-encoded within each document
+
+So a lookup of a few doc ids binary searches the skip table, and only
+decodes the blocks which may hold them.
+"""
+
+import bisect
+import functools
+import heapq
+import itertools
+import math
+import mmap
+import struct
+from array import array
+from typing import (AbstractSet, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional,
+                    Sequence, Set, Tuple)
+
+from intcodecs import CODECS, Codec
+
+MAGIC = b'SIX1'
+# Codecs by the last byte of the magic of the indexes using them; None
+# is the original varint layout, without blocks
+_CODEC_IDS = {MAGIC[-1:]: None, **{codec.id: codec for codec in CODECS.values()}}
+# Number of documents in a block of postings
+BLOCK_SIZE = 128
+_HEADER = struct.Struct('<4sQQQ')
+_COUNT = struct.Struct('<Q')
+_DOUBLE = struct.Struct('<d')
+_SKIP = struct.Struct('<QI')
+
+
+def encode_varint(n: int, out: bytearray) -> None:
+    """Appends the unsigned LEB128 encoding of `n` to `out`."""
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def decode_varints(buf, pos: int = 0, end: int = None, count: int = None) -> List[int]:
+    """Decodes the varints in buf[pos:end], stopping after `count` of
+    them if given."""
+    if end is None:
+        end = len(buf)
+    values = []
+    n = 0
+    shift = 0
+    for byte in buf[pos:end]:
+        if byte & 0x80:
+            n |= (byte & 0x7f) << shift
+            shift += 7
+        else:
+            values.append(n | (byte << shift))
+            if len(values) == count:
+                break
+            n = 0
+            shift = 0
+    return values
+
+
+def _decode_varint(buf, pos: int) -> Tuple[int, int]:
+    """Decodes the varint at buf[pos] and returns it along with the
+    position following it."""
+    n = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return n, pos
+        shift += 7
+
+
+class TermBounds(NamedTuple):
+    """Statistics bounding the weight of a term in any document"""
+    max_tf_norm: float  # The largest term frequency divided by the document norm
+    max_tf: int  # The largest term frequency
+    min_length: int  # The length of the shortest document containing the term
+
+
+def _magic(codec: Codec = None) -> bytes:
+    return MAGIC[:-1] + codec.id if codec is not None else MAGIC
+
+
+def encode_postings(postings: Dict[str, List[int]], bounds: TermBounds,
+                    codec: Codec = None) -> bytearray:
+    """Encodes a term's mapping of doc id to positions as a postings block,
+    in blocks encoded with the codec if given, or else in the original
+    varint layout."""
+    out = bytearray(_DOUBLE.pack(bounds.max_tf_norm))
+    encode_varint(bounds.max_tf, out)
+    encode_varint(bounds.min_length, out)
+    doc_ids = sorted(postings, key=int)
+    encode_varint(len(doc_ids), out)
+    if codec is not None:
+        blocks = []
+        for i in range(0, len(doc_ids), BLOCK_SIZE):
+            block_ids = [int(doc_id) for doc_id in doc_ids[i:i + BLOCK_SIZE]]
+            first = block_ids[0] if len(doc_ids) > BLOCK_SIZE else 0
+            doc_bytes = codec.encode_sorted([doc_id - first for doc_id in block_ids])
+            tf_bytes = codec.encode([len(postings[str(doc_id)]) for doc_id in block_ids])
+            block = bytearray()
+            encode_varint(len(doc_bytes), block)
+            encode_varint(len(tf_bytes), block)
+            blocks.append((first, block + doc_bytes + tf_bytes))
+        if len(blocks) > 1:
+            offset = 0
+            for first, block in blocks:
+                out += _SKIP.pack(first, offset)
+                offset += len(block)
+        for _, block in blocks:
+            out += block
+        gaps = []
+        for doc_id in doc_ids:
+            positions = postings[doc_id]
+            gaps += [pos - prev for prev, pos in zip([0] + positions, positions)]
+        out += codec.encode(gaps)
+        return out
+    prev = 0
+    for doc_id in doc_ids:
+        encode_varint(int(doc_id) - prev, out)
+        encode_varint(len(postings[doc_id]), out)
+        prev = int(doc_id)
+    for doc_id in doc_ids:
+        prev = 0
+        for pos in postings[doc_id]:
+            encode_varint(pos - prev, out)
+            prev = pos
+    return out
+
+
+def decode_bounds(buf, pos: int = 0) -> TermBounds:
+    """Decodes the bounds at the start of a postings block."""
+    max_tf_norm, = _DOUBLE.unpack_from(buf, pos)
+    max_tf, pos = _decode_varint(buf, pos + _DOUBLE.size)
+    min_length, _ = _decode_varint(buf, pos)
+    return TermBounds(max_tf_norm, max_tf, min_length)
+
+
+class BlockedPostings:
+    """The doc ids and term frequencies of a postings block encoded with
+    a codec, decoding only the blocks of documents looked up."""
+
+    def __init__(self, buf, codec: Codec, pos: int = 0):
+        self.buf = buf
+        self.codec = codec
+        _, pos = _decode_varint(buf, pos + _DOUBLE.size)
+        _, pos = _decode_varint(buf, pos)
+        self.num_docs, pos = _decode_varint(buf, pos)
+        self.num_blocks = -(-self.num_docs // BLOCK_SIZE)
+        self.skips = pos
+        if self.num_blocks > 1:
+            pos += self.num_blocks * _SKIP.size
+        self.blocks = pos  # The position of the first block
+
+    def _skip(self, i: int) -> Tuple[int, int]:
+        """Returns the first doc id and the position of the i-th block."""
+        if self.num_blocks == 1:
+            return 0, self.blocks
+        first, offset = _SKIP.unpack_from(self.buf, self.skips + i * _SKIP.size)
+        return first, self.blocks + offset
+
+    def block(self, i: int) -> Tuple[List[int], List[int], int]:
+        """Decodes the doc ids and term frequencies of the i-th block, and
+        returns them with the position following the block."""
+        first, pos = self._skip(i)
+        count = min(BLOCK_SIZE, self.num_docs - i * BLOCK_SIZE)
+        doc_bytes, pos = _decode_varint(self.buf, pos)
+        tf_bytes, pos = _decode_varint(self.buf, pos)
+        doc_ids = self.codec.decode_sorted(self.buf[pos:pos + doc_bytes], count)
+        if first:
+            doc_ids = [first + doc_id for doc_id in doc_ids]
+        pos += doc_bytes
+        term_freqs = self.codec.decode(self.buf[pos:pos + tf_bytes], count)
+        return doc_ids, term_freqs, pos + tf_bytes
+
+    def _find_block(self, doc_id: int, lo: int = 0) -> int:
+        """Returns the last block from `lo` whose first doc id is at most
+        `doc_id`, by binary search of the skip table."""
+        hi = self.num_blocks
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self._skip(mid)[0] <= doc_id:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, doc_ids: List[int]) -> List[Optional[int]]:
+        """Returns the term frequency in each document of a sorted list of
+        doc ids, or None for the documents missing from the postings."""
+        found = []
+        i = -1
+        block_ids = term_freqs = None
+        for doc_id in doc_ids:
+            j = self._find_block(doc_id, max(i, 0))
+            if j != i:
+                i = j
+                block_ids, term_freqs, _ = self.block(i)
+            k = bisect.bisect_left(block_ids, doc_id)
+            found.append(term_freqs[k] if k < len(block_ids) and block_ids[k] == doc_id
+                         else None)
+        return found
+
+    def term_freqs(self) -> Tuple[List[int], List[int], int]:
+        """Decodes every doc id and term frequency, and returns them with
+        the position at which the positions start."""
+        doc_ids, term_freqs = [], []
+        pos = self.blocks
+        for i in range(self.num_blocks):
+            block_ids, block_freqs, pos = self.block(i)
+            doc_ids += block_ids
+            term_freqs += block_freqs
+        return doc_ids, term_freqs, pos
+
+
+def decode_postings(buf, pos: int = 0, end: int = None,
+                    codec: Codec = None) -> Dict[str, List[int]]:
+    """Decodes a postings block into a mapping of doc id to positions."""
+    if codec is not None:
+        doc_ids, term_freqs, pos = BlockedPostings(buf, codec, pos).term_freqs()
+        gaps = codec.decode(buf[pos:end], sum(term_freqs))
+        postings = dict()
+        i = 0
+        for doc_id, count in zip(doc_ids, term_freqs):
+            positions = gaps[i:i + count]
+            for k in range(1, count):
+                positions[k] += positions[k - 1]
+            postings[str(doc_id)] = positions
+            i += count
+        return postings
+    values = decode_varints(buf, pos + _DOUBLE.size, end)
+    num_docs = values[2]
+    i = 3 + 2 * num_docs
+    postings = dict()
+    doc_id = 0
+    for j in range(3, i, 2):
+        doc_id += values[j]
+        count = values[j + 1]
+        positions = values[i:i + count]
+        for k in range(1, count):
+            positions[k] += positions[k - 1]
+        postings[str(doc_id)] = positions
+        i += count
+    return postings
+
+
+class DocStats:
+    """Per-document statistics used for ranking. Documents are numbered
+    by the position of their id in the sorted doc ids."""
+
+    def __init__(self, doc_ids: Sequence[int], lengths: Sequence[int],
+                 sq_sums: Sequence[int], norms: Sequence[float] = None):
+        self.doc_ids = doc_ids
+        self.lengths = lengths  # The number of terms in each document
+        self.sq_sums = sq_sums  # The sum of the squared frequencies of its terms
+        if norms is None:
+            norms = array('d', map(math.sqrt, sq_sums))
+        self.norms = norms  # The Euclidean norm of its term frequencies
+        self._avg_length = None
+        self._numbers = None
+
+    @property
+    def avg_length(self) -> float:
+        if self._avg_length is None:
+            self._avg_length = sum(self.lengths) / len(self) if len(self) else 0.0
+        return self._avg_length
+
+    @classmethod
+    def from_buffer(cls, buf: memoryview) -> 'DocStats':
+        """Returns the stats stored in `buf`, without copying them."""
+        num_docs, = _COUNT.unpack_from(buf)
+        arrays = [buf[_COUNT.size + i * 8 * num_docs:_COUNT.size + (i + 1) * 8 * num_docs]
+                  for i in range(4)]
+        return cls(arrays[0].cast('q'), arrays[1].cast('q'), arrays[2].cast('q'),
+                   arrays[3].cast('d'))
+
+    def to_bytes(self) -> bytes:
+        return b''.join([_COUNT.pack(len(self))] + [
+            array(typecode, values).tobytes() for typecode, values in (
+                ('q', self.doc_ids), ('q', self.lengths), ('q', self.sq_sums),
+                ('d', self.norms))])
+
+    @classmethod
+    def merge(cls, stats: List['DocStats'], deleted: List[AbstractSet[int]] = None,
+              repeated_sq_sums: Mapping[int, int] = None) -> 'DocStats':
+        """Combines the stats of sets of documents, leaving out the
+        documents of each set listed in `deleted`.
+
+        A doc id in several sets is one document holding the terms of all
+        of them. Its lengths are added up, but its sum of squared term
+        frequencies depends on the terms the sets share, so it must be
+        given in `repeated_sq_sums`.
+        """
+        deleted = deleted or [frozenset()] * len(stats)
+        docs = sorted((doc_id, s.lengths[i], s.sq_sums[i])
+                      for s, s_deleted in zip(stats, deleted)
+                      for i, doc_id in enumerate(s.doc_ids) if doc_id not in s_deleted)
+        merged = []
+        for doc_id, rows in itertools.groupby(docs, key=lambda row: row[0]):
+            rows = list(rows)
+            if len(rows) > 1:
+                if repeated_sq_sums is None or doc_id not in repeated_sq_sums:
+                    raise ValueError('no sum of squares for repeated doc id {}'.format(doc_id))
+                rows = [(doc_id, sum(row[1] for row in rows), repeated_sq_sums[doc_id])]
+            merged += rows
+        return cls(*[array('q', column) for column in zip(*merged)] or [[], [], []])
+
+    @property
+    def numbers(self) -> Dict[str, int]:
+        """Maps each doc id, as a string, to the number of the document."""
+        if self._numbers is None:
+            self._numbers = {str(doc_id): i for i, doc_id in enumerate(self.doc_ids)}
+        return self._numbers
+
+    def term_bounds(self, postings: Dict[str, List[int]]) -> TermBounds:
+        """Returns the bounds of a term with the given postings."""
+        numbers = self.numbers
+        max_tf_norm = 0.0
+        max_tf = 0
+        min_length = None
+        for doc_id, positions in postings.items():
+            doc = numbers[doc_id]
+            max_tf_norm = max(max_tf_norm, len(positions) / self.norms[doc])
+            max_tf = max(max_tf, len(positions))
+            if min_length is None or self.lengths[doc] < min_length:
+                min_length = self.lengths[doc]
+        return TermBounds(max_tf_norm, max_tf, min_length or 0)
+
+    def find(self, doc_ids: List[int]) -> List[int]:
+        """Returns the numbers of the documents with the given sorted ids."""
+        numbers = []
+        lo = 0
+        for doc_id in doc_ids:
+            lo = bisect.bisect_left(self.doc_ids, doc_id, lo)
+            numbers.append(lo)
+        return numbers
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+
+def write_table(filepath: str, blocks: Iterator[Tuple[str, bytes]],
+                trailer: bytes = b'', magic: bytes = MAGIC) -> None:
+    """Writes (key, block) pairs, which must be sorted by key, and an
+    optional trailer to a file."""
+    dictionary = bytearray()
+    num_keys = 0
+    with open(filepath, 'wb') as f:
+        f.write(_HEADER.pack(magic, 0, 0, 0))
+        prev = offset = _HEADER.size
+        for key, block in blocks:
+            encoded_key = key.encode('utf-8')
+            encode_varint(len(encoded_key), dictionary)
+            dictionary += encoded_key
+            encode_varint(offset - prev, dictionary)
+            prev = offset
+            f.write(block)
+            offset += len(block)
+            num_keys += 1
+        dictionary += bytes(-(offset + len(dictionary)) % 8)
+        f.write(dictionary)
+        f.write(trailer)
+        f.seek(0)
+        f.write(_HEADER.pack(magic, offset, num_keys, offset + len(dictionary)))
+
+
+def is_binary(filepath: str) -> bool:
+    """Returns whether the file at the given path uses the binary format."""
+    with open(filepath, 'rb') as f:
+        magic = f.read(len(MAGIC))
+    return magic[:-1] == MAGIC[:-1] and magic[-1:] in _CODEC_IDS
+
+
+class MappedTable(Mapping):
+    """A read-only mapping of key to the raw block of a binary file,
+    backed by a memory map."""
+
+    def __init__(self, filepath: str):
+        with open(filepath, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, dictionary_offset, num_keys, trailer_offset = _HEADER.unpack_from(self.buf)
+        if magic[:-1] != MAGIC[:-1] or magic[-1:] not in _CODEC_IDS:
+            raise ValueError('{} is not a binary index file'.format(filepath))
+        self.codec = _CODEC_IDS[magic[-1:]]  # The codec of the postings of an index
+        self.trailer = memoryview(self.buf)[trailer_offset:]
+        self.spans = dict()  # Maps each key to the (start, end) of its block
+        key = None
+        offset = _HEADER.size
+        pos = dictionary_offset
+        for _ in range(num_keys):
+            length, pos = _decode_varint(self.buf, pos)
+            next_key = self.buf[pos:pos + length].decode('utf-8')
+            gap, pos = _decode_varint(self.buf, pos + length)
+            if key is not None:
+                self.spans[key] = (offset, offset + gap)
+            key = next_key
+            offset += gap
+        if key is not None:
+            self.spans[key] = (offset, dictionary_offset)
+
+    def block(self, key: str) -> bytes:
+        start, end = self.spans[key]
+        return self.buf[start:end]
+
+    def __getitem__(self, key: str):
+        return self.block(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.spans
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.spans)
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+
+class MappedIndex(MappedTable):
+    """An inverted index whose postings are decoded on lookup."""
+
+    def __init__(self, filepath: str):
+        super().__init__(filepath)
+        self._doc_stats = None
+
+    def __getitem__(self, term: str) -> Dict[str, List[int]]:
+        start, end = self.spans[term]
+        return decode_postings(self.buf, start, end, self.codec)
+
+    @property
+    def doc_stats(self) -> DocStats:
+        """The stats of the documents, read from the trailer on first use."""
+        if self._doc_stats is None:
+            self._doc_stats = DocStats.from_buffer(self.trailer)
+        return self._doc_stats
+
+    def doc_freq(self, term: str) -> int:
+        """Returns the number of documents in the term's postings."""
+        start, end = self.spans[term]
+        return decode_varints(self.buf, start + _DOUBLE.size, end, 3)[2]
+
+    def term_bounds(self, term: str) -> TermBounds:
+        return decode_bounds(self.buf, self.spans[term][0])
+
+    def lookup(self, term: str, doc_ids: List[int]) -> List[Optional[int]]:
+        """Returns the term frequency in each document of a sorted list of
+        doc ids, or None for the documents the term is missing from."""
+        if self.codec is not None:
+            return BlockedPostings(self.buf, self.codec, self.spans[term][0]).lookup(doc_ids)
+        term_freqs = dict(zip(*self.term_freqs(term)))
+        return [term_freqs.get(doc_id) for doc_id in doc_ids]
+
+    def doc_ids(self, term: str) -> List[int]:
+        """Decodes the sorted doc ids of the term's postings, without
+        their positions."""
+        return self.term_freqs(term)[0]
+
+    def term_freqs(self, term: str) -> Tuple[List[int], List[int]]:
+        """Decodes the sorted doc ids of the term's postings and the
+        number of positions in each, without the positions."""
+        start, end = self.spans[term]
+        if self.codec is not None:
+            doc_ids, term_freqs, _ = BlockedPostings(self.buf, self.codec, start).term_freqs()
+            return doc_ids, term_freqs
+        num_docs = self.doc_freq(term)
+        values = decode_varints(self.buf, start + _DOUBLE.size, end, 3 + 2 * num_docs)
+        doc_ids = values[3::2]
+        for i in range(1, num_docs):
+            doc_ids[i] += doc_ids[i - 1]
+        return doc_ids, values[4::2]
+
+
+class MappedTitles(MappedTable):
+    """A title store whose titles are decoded on lookup."""
+
+    def __getitem__(self, doc_id: str) -> str:
+        return self.block(doc_id).decode('utf-8')
+
+
+def write_index(filepath: str, inverted_index: Mapping[str, Dict[str, List[int]]],
+                doc_stats: DocStats, codec: Codec = None) -> None:
+    """Writes an inverted index and its document stats in the binary
+    format, with postings encoded by the given codec (VByte by default)."""
+    codec = codec or CODECS['vbyte']
+    write_table(filepath, ((term, encode_postings(inverted_index[term],
+                                                  doc_stats.term_bounds(inverted_index[term]),
+                                                  codec))
+                           for term in sorted(inverted_index)), doc_stats.to_bytes(),
+                _magic(codec))
+
+
+def write_titles(filepath: str, title_index: Mapping[str, str]) -> None:
+    """Writes a title store in the binary format."""
+    write_table(filepath, ((doc_id, title_index[doc_id].encode('utf-8'))
+                           for doc_id in sorted(title_index)))
+
+
+def merge_tables(filepath: str, tables: List[MappedTable],
+                 merge_blocks: Callable[[str, List[Tuple[int, bytes]]], Optional[bytes]],
+                 trailer: bytes = b'', magic: bytes = MAGIC) -> None:
+    """Writes the k-way merge of sorted tables to a file. The blocks of a
+    key are combined by `merge_blocks`, which is given the key and its
+    (table number, block) pairs in table order. Keys it returns None for
+    are left out.
+    """
+    keys = heapq.merge(*[zip(table, itertools.repeat(i)) for i, table in enumerate(tables)])
+    blocks = ((key, merge_blocks(key, [(i, tables[i].block(key)) for _, i in group]))
+              for key, group in itertools.groupby(keys, key=lambda k: k[0]))
+    write_table(filepath, ((key, block) for key, block in blocks if block is not None),
+                trailer, magic)
+
+
+def _merge_postings(_key: str, numbered_blocks: List[Tuple[int, bytes]],
+                    codec: Codec = None) -> bytes:
+    blocks = [block for _, block in numbered_blocks]
+    if len(blocks) == 1:
+        return blocks[0]
+    postings = dict()
+    for block in blocks:
+        for doc_id, positions in decode_postings(block, codec=codec).items():
+            postings.setdefault(doc_id, []).extend(positions)
+    # Only used when the segments hold different documents, so the bounds
+    # of the merged postings are the extremes of the segments' bounds
+    bounds = [decode_bounds(block) for block in blocks]
+    return encode_postings(postings, TermBounds(max(b.max_tf_norm for b in bounds),
+                                                max(b.max_tf for b in bounds),
+                                                min(b.min_length for b in bounds)), codec)
+
+
+def _purge_postings(_key: str, numbered_blocks: List[Tuple[int, bytes]],
+                    deleted: List[AbstractSet[int]], doc_stats: DocStats,
+                    codec: Codec = None) -> Optional[bytes]:
+    """Merges postings blocks without the documents deleted from their
+    segment, or returns None if no document is left."""
+    postings = dict()
+    for i, block in numbered_blocks:
+        for doc_id, positions in decode_postings(block, codec=codec).items():
+            if int(doc_id) not in deleted[i]:
+                postings.setdefault(doc_id, []).extend(positions)
+    if not postings:
+        return None
+    if len(numbered_blocks) > 1:
+        # A doc id in several segments has the positions of each
+        for positions in postings.values():
+            positions.sort()
+    return encode_postings(postings, doc_stats.term_bounds(postings), codec)
+
+
+def _repeated_doc_ids(stats: List[DocStats], deleted: List[AbstractSet[int]]) -> Set[int]:
+    """Returns the doc ids left in more than one of the segments."""
+    seen = set()
+    repeated = set()
+    for segment_stats, segment_deleted in zip(stats, deleted):
+        for doc_id in segment_stats.doc_ids:
+            if doc_id not in segment_deleted:
+                if doc_id in seen:
+                    repeated.add(doc_id)
+                seen.add(doc_id)
+    return repeated
+
+
+def _repeated_sq_sums(segments: List['MappedIndex'], repeated: AbstractSet[int],
+                      deleted: List[AbstractSet[int]]) -> Dict[int, int]:
+    """Returns the sum of the squared term frequencies of each repeated
+    doc id, over the terms of all of its segments."""
+    sq_sums = dict.fromkeys(repeated, 0)
+    for term, _ in itertools.groupby(heapq.merge(*segments)):
+        freqs = dict()
+        for segment, segment_deleted in zip(segments, deleted):
+            if term in segment:
+                for doc_id, freq in zip(*segment.term_freqs(term)):
+                    if doc_id in repeated and doc_id not in segment_deleted:
+                        freqs[doc_id] = freqs.get(doc_id, 0) + freq
+        for doc_id, freq in freqs.items():
+            sq_sums[doc_id] += freq * freq
+    return sq_sums
+
+
+def merge_indexes(filepath: str, segment_filepaths: List[str],
+                  deleted: List[AbstractSet[int]] = None) -> None:
+    """Merges binary index segments, which must be given in collection
+    order, into a single binary index. The doc ids in deleted[i] are left
+    out of the i-th segment. A doc id in several segments becomes one
+    document with the terms of all of them, as when parsing serially. The
+    segments must share a codec, which the index keeps."""
+    segments = [MappedIndex(fp) for fp in segment_filepaths]
+    codecs = {type(segment.codec) for segment in segments}
+    if len(codecs) > 1:
+        raise ValueError('cannot merge segments with different codecs')
+    codec = segments[0].codec if segments else None
+    deleted = deleted or [frozenset()] * len(segments)
+    stats = [segment.doc_stats for segment in segments]
+    repeated = _repeated_doc_ids(stats, deleted)
+    repeated_sq_sums = _repeated_sq_sums(segments, repeated, deleted) if repeated else None
+    doc_stats = DocStats.merge(stats, deleted, repeated_sq_sums)
+    merge_blocks = functools.partial(_merge_postings, codec=codec)
+    if repeated or any(deleted):
+        # The bounds of postings which lost documents, or whose documents
+        # were merged, must be recomputed
+        merge_blocks = functools.partial(_purge_postings, deleted=deleted, doc_stats=doc_stats,
+                                         codec=codec)
+    merge_tables(filepath, segments, merge_blocks, doc_stats.to_bytes(), _magic(codec))
+
+
+def merge_titles(filepath: str, segment_filepaths: List[str],
+                 deleted: List[AbstractSet[int]] = None) -> None:
+    """Merges binary title segments into a single title store. The title
+    from the last segment wins, as when parsing serially. The titles of
+    the doc ids in deleted[i] are left out of the i-th segment."""
+    def last_title(doc_id: str, numbered_blocks: List[Tuple[int, bytes]]) -> Optional[bytes]:
+        for i, block in reversed(numbered_blocks):
+            if not deleted or int(doc_id) not in deleted[i]:
+                return block
+        return None
+
+    merge_tables(filepath, [MappedTitles(fp) for fp in segment_filepaths], last_title)
@@ -17,6 +17,14 @@
 
 import math
 
+# numpy and scipy are optional: without them, the classifier falls
+# back to the dictionary implementation
+try :
+	import numpy
+	import scipy.sparse
+except ImportError :
+	numpy = None
+
 # GLOBALS
 numDocs = 0
 
@@ -34,8 +42,23 @@ numDocs = 0
 #  5. outfile - the filehandle to which we write out our classifications
 def bayesClassify(features, vecRep, training, toClassify, outfile) :
 	
-	# read in files for training
 	featureList = readFeatures(features)
+	if numpy is not None :
+		classifiedDocs, testData = sparseClassify(featureList, vecRep, training, toClassify)
+	else :
+		classifiedDocs, testData = dictClassify(featureList, vecRep, training, toClassify)
+	
+	# write to the output file
+	idsToWrite = sorted(classifiedDocs.keys())
+	for i in idsToWrite :
+		outfile.write(str(i) + " " + str(classifiedDocs[i]) + "\n")
+	
+# dictClassify()
+# Trains and classifies with vectors represented as dictionaries.
+# Returns the classification of each docID to classify, and
+# the expected classifications.
+def dictClassify(featureList, vecRep, training, toClassify) :
+	
 	# dict of docID -> feature vector
 	bigDict = readVecRep(vecRep)
 	trainingDict = readTrainingData(training)
@@ -44,13 +67,24 @@ def bayesClassify(features, vecRep, training, toClassify, outfile) :
 	priorDict, condProbDict = computeProbabilities(featureList, bigDict, trainingDict)
 	
 	# apply the multinomial naive bayes classification to the test dataset
-	classifiedDocs, testData = classifyDocs(bigDict, priorDict, condProbDict, toClassify)
+	return classifyDocs(bigDict, priorDict, condProbDict, toClassify)
+
+# sparseClassify()
+# Does the same as dictClassify with numpy and scipy: the
+# vectors are the rows of a sparse matrix, training sums
+# them per class with one matrix product, and all the
+# documents are classified with another.
+def sparseClassify(featureList, vecRep, training, toClassify) :
 	
-	# write to the output file
-	idsToWrite = sorted(classifiedDocs.keys())
-	for i in idsToWrite :
-		outfile.write(str(i) + " " + str(classifiedDocs[i]) + "\n")
+	numFeatures = len(featureList)
+	matrix, rows = readVecRepMatrix(vecRep, numFeatures)
+	trainingDict = readTrainingData(training)
 	
+	classes, logPriors, logCondProbs = computeLogProbabilities(numFeatures, matrix, rows,
+		trainingDict)
+	
+	return classifyDocsSparse(matrix, rows, classes, logPriors, logCondProbs, toClassify)
+
 # readFeatures
 # Given a filehandle for the features file, reads in
 # the features, and returns a list of features.
@@ -90,6 +124,43 @@ def readVecRep(vecRep) :
 		
 	return bigDict
 
+# readVecRepMatrix
+# Given the output of vecrep.py, builds a compressed sparse
+# row matrix of the counts of the numFeatures features, with
+# a row for each line. Returns it with a dictionary mapping
+# each docID to its row.
+#
+# Features out of range are left out, as computeProbabilities
+# has no probability for them.
+def readVecRepMatrix(vecRep, numFeatures) :
+	global numDocs
+	rows = dict()
+	indptr = [0]
+	indices = []
+	counts = []
+	for line in vecRep :
+		numDocs += 1
+		
+		littleDict = dict()
+		fields = line.split(" ")
+		docID = int(fields[0])
+		for pair in fields[2:] :
+			pair = pair.strip().split(":")
+			termID = int(pair[0])
+			if 0 <= termID < numFeatures :
+				littleDict[termID] = int(pair[1])
+		
+		for termID in sorted(littleDict) :
+			indices.append(termID)
+			counts.append(littleDict[termID])
+		rows[docID] = len(indptr) - 1
+		indptr.append(len(indices))
+	
+	matrix = scipy.sparse.csr_matrix(
+		(numpy.array(counts, dtype=float), numpy.array(indices, dtype=numpy.int32),
+		numpy.array(indptr, dtype=numpy.int32)), shape=(len(indptr) - 1, numFeatures))
+	return matrix, rows
+
 # readTrainingData
 # arg - a filehandle for the training data set
 # 
@@ -152,6 +223,38 @@ def computeProbabilities(featureList, bigDict, trainingDict) :
 			condProbDict[c][i] = float(term2tct[i] + 1) / float(TctSum + numFeatures)
 			
 	return (priorDict, condProbDict)
+
+# computeLogProbabilities()
+# Computes the same probabilities as computeProbabilities
+# from the matrix of readVecRepMatrix. Returns the list of
+# classes, in the order in which maxClass would see them, the
+# logs of their priors, and a features x classes matrix of the
+# logs of the conditional probabilities.
+def computeLogProbabilities(numFeatures, matrix, rows, trainingDict) :
+	priorDict = dict()
+	global numDocs
+	for c in trainingDict :
+		priorDict[c] = float(len(trainingDict[c]))/float(numDocs)
+	classes = list(priorDict)
+	
+	# the classes x documents matrix of the training documents
+	# of each class, whose product with the document vectors
+	# holds Tct for every class and term
+	classIndices = []
+	rowIndices = []
+	for i, c in enumerate(classes) :
+		for docID in trainingDict[c] :
+			if docID in rows :
+				classIndices.append(i)
+				rowIndices.append(rows[docID])
+	membership = scipy.sparse.csr_matrix(
+		(numpy.ones(len(classIndices)), (classIndices, rowIndices)),
+		shape=(len(classes), matrix.shape[0]))
+	tct = membership.dot(matrix).toarray()
+	
+	condProbs = (tct + 1) / (tct.sum(axis=1) + numFeatures)[:, numpy.newaxis]
+	logPriors = numpy.log([priorDict[c] for c in classes])
+	return classes, logPriors, numpy.log(condProbs).T
 			
 	
 def maxClass(scoreDict) :
@@ -197,3 +300,33 @@ def classifyOneDoc(docID, priorDict, condProbDict, bigDict) :
 						
 	maxCat = maxClass(score)
 	return maxCat
+
+# classifyDocsSparse
+# Runs the multinomial naive bayes algorithm on every document
+# to classify at once, using the results of computeLogProbabilities.
+def classifyDocsSparse(matrix, rows, classes, logPriors, logCondProbs, toClassify) :
+	
+	classifiedDocs = dict()
+	testData = dict()
+	
+	docIDs = []
+	for line in toClassify :
+		lineArgs = line.split(" ")
+		docID = int(lineArgs[0])
+		docIDs.append(docID)
+		testData[docID] = int(lineArgs[1])
+	
+	# as in classifyOneDoc, every feature of a document counts
+	# once whatever its count, and a document missing from the
+	# vector representation is scored by its prior alone
+	scores = numpy.tile(logPriors, (len(docIDs), 1))
+	present = [i for i, docID in enumerate(docIDs) if docID in rows]
+	vectors = matrix[[rows[docIDs[i]] for i in present]]
+	vectors.data[:] = 1
+	scores[present] += vectors.dot(logCondProbs)
+	
+	# argmax picks the first of equal scores, like maxClass
+	for docID, best in zip(docIDs, scores.argmax(axis=1)) :
+		classifiedDocs[docID] = classes[best]
+	
+	return classifiedDocs, testData
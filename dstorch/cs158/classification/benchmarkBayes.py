@@ -0,0 +1,49 @@
+###################################################
+# benchmarkBayes.py -
+#  Times the dictionary and the sparse matrix
+#  implementations of multinomial naive bayes on
+#  the same files, and checks that they agree.
+#
+#  arg1 - the features file
+#  arg2 - the vector representation from vecrep.py
+#  arg3 - the training data
+#  arg4 - the docIDs to classify
+#
+# Needs numpy and scipy.
+#
+###################################################
+
+import bayes
+import sys
+import time
+
+# Runs classify on the files of the command line, and
+# returns its classifications and the seconds it took
+def timeClassify(classify) :
+	bayes.numDocs = 0
+	featureList = bayes.readFeatures(open(sys.argv[1]))
+	vecRep = open(sys.argv[2])
+	training = open(sys.argv[3])
+	toClassify = open(sys.argv[4])
+	start = time.time()
+	classifiedDocs, testData = classify(featureList, vecRep, training, toClassify)
+	return classifiedDocs, time.time() - start
+
+if __name__ == '__main__' :
+
+	if bayes.numpy is None :
+		print "numpy and scipy are needed to benchmark the sparse classifier"
+		sys.exit(1)
+
+	dictDocs, dictTime = timeClassify(bayes.dictClassify)
+	sparseDocs, sparseTime = timeClassify(bayes.sparseClassify)
+
+	differences = 0
+	for docID in dictDocs :
+		if dictDocs[docID] != sparseDocs[docID] :
+			differences += 1
+
+	print "documents classified: %d" % len(dictDocs)
+	print "dictionaries:  %.2fs" % dictTime
+	print "sparse matrix: %.2fs (%.0fx)" % (sparseTime, dictTime / sparseTime)
+	print "different classifications: %d" % differences
@@ -16,7 +16,14 @@
 ######################################################################
 
 import math
-import copy
+
+# numpy and scipy are optional: without them, the classifier falls
+# back to the dictionary vectors
+try :
+	import numpy
+	import scipy.sparse
+except ImportError :
+	numpy = None
 
 # rocchioClassify()
 # The main method for the rocchio module, which should be called
@@ -31,6 +38,10 @@ import copy
 #		attempt to classify and the expected results
 #  5. outfile - the filehandle to which we write out our classifications
 def rocchioClassify(features, vecRep, training, toClassify, outfile) :
+	if numpy is not None :
+		rocchioClassifySparse(features, vecRep, training, toClassify, outfile)
+		return
+	
 	# read in files for training
 	featureList = readFeatures(features)
 	dictTuple = readVecRep(vecRep)
@@ -49,6 +60,22 @@ def rocchioClassify(features, vecRep, training, toClassify, outfile) :
 	# write the output
 	writeResults(outfile, classifications)
 	
+# rocchioClassifySparse()
+# Does the same as rocchioClassify with numpy and scipy: the
+# normalized vectors are the rows of a sparse matrix, all the
+# centroids are computed with one matrix product, and all the
+# documents are classified with another.
+def rocchioClassifySparse(features, vecRep, training, toClassify, outfile) :
+	matrix, rows = readVecRepMatrix(vecRep)
+	trainingDict = readTrainingData(training)
+	
+	classes, centroids = trainRocchioSparse(matrix, rows, trainingDict)
+	
+	testData = readTestData(toClassify)
+	classifications = applyRocchioSparse(testData, classes, centroids, matrix, rows)
+	
+	writeResults(outfile, classifications)
+
 # readFeatures
 # Given a filehandle for the features file, reads in
 # the features, and returns a list of features.
@@ -89,6 +116,42 @@ def readVecRep(vecRep) :
 		
 	return bigDict, normDict
 
+# readVecRepMatrix
+# Given the output of vecrep.py, builds a compressed sparse
+# row matrix with a row for each line holding the vector
+# divided by its Euclidean norm. Returns it with a dictionary
+# mapping each docID to its row.
+def readVecRepMatrix(vecRep) :
+	rows = dict()
+	indptr = [0]
+	indices = []
+	values = []
+	for line in vecRep :
+		
+		littleDict = dict()
+		
+		# parse the line from the vecrep file
+		fields = line.split(" ")
+		docID = int(fields[0])
+		normalization = math.sqrt(int(fields[1]))
+		
+		for pair in fields[2:] :
+			pair = pair.strip()
+			pair = pair.split(":")
+			littleDict[int(pair[0])] = int(pair[1]) / normalization
+		
+		for feature in sorted(littleDict) :
+			indices.append(feature)
+			values.append(littleDict[feature])
+		rows[docID] = len(indptr) - 1
+		indptr.append(len(indices))
+	
+	numFeatures = max(indices) + 1 if indices else 0
+	matrix = scipy.sparse.csr_matrix(
+		(numpy.array(values), numpy.array(indices, dtype=numpy.int32),
+		numpy.array(indptr, dtype=numpy.int32)), shape=(len(indptr) - 1, numFeatures))
+	return matrix, rows
+
 # readTrainingData
 # arg - a filehandle for the training data set
 # 
@@ -154,14 +217,44 @@ def computeCentroid(docIDList, bigDict, normDict) :
 	centroid = divideVector(centroid, float(len(docIDList)))
 	return centroid
 
+# trainRocchioSparse()
+# Computes the centroids of trainRocchio from the matrix of
+# readVecRepMatrix.
+#
+# return -
+#  the list of classes, in the order in which applyRocchioOnce
+#  would see them, and a dense classes x features matrix of
+#  their centroids
+def trainRocchioSparse(matrix, rows, trainingDict) :
+	classes = list(trainingDict)
+	
+	# the classes x documents matrix whose product with the
+	# document vectors averages the vectors of each class. Like
+	# computeCentroid, it divides by the number of training
+	# documents, even those missing from the vector representation.
+	classIndices = []
+	rowIndices = []
+	weights = []
+	for i, classification in enumerate(classes) :
+		docIDList = trainingDict[classification]
+		for docID in docIDList :
+			if docID in rows :
+				classIndices.append(i)
+				rowIndices.append(rows[docID])
+				weights.append(1.0 / len(docIDList))
+	membership = scipy.sparse.csr_matrix((weights, (classIndices, rowIndices)),
+		shape=(len(classes), matrix.shape[0]))
+	
+	return classes, membership.dot(matrix).toarray()
+
 # divideVector
 # args -
 #  1. vector - the vector to divide
 #  2. div - the scalar to divide the vector by
 def divideVector(vector, div) :
-	outVec = copy.deepcopy(vector)
+	outVec = dict()
 	for feature in vector :
-		outVec[feature] /= div
+		outVec[feature] = vector[feature] / div
 	return outVec
 
 # multiplyVector
@@ -169,9 +262,9 @@ def divideVector(vector, div) :
 #  1. vector - the vector to multiply
 #  2. mult - the scalar to multiply the vector by
 def multiplyVector(vector, mult) :
-	outVec = copy.deepcopy(vector)
+	outVec = dict()
 	for feature in vector :
-		outVec[feature] *= mult
+		outVec[feature] = vector[feature] * mult
 	return outVec
 
 # subtractVector
@@ -254,13 +347,43 @@ def applyRocchio(testData, centroidDict, bigDict, normDict) :
 		else :
 			numNotClassified += 1
 	
-	# print some stats to the terminal
+	printStats(numCorrect, numClassified, numNotClassified)
+	
+	return classifications
+
+# applyRocchioSparse
+# Does the same as applyRocchio, with the results of
+# trainRocchioSparse and the matrix of readVecRepMatrix.
+#
+# For a normalized vector v, |v - c|^2 = |v|^2 - 2 v.c + |c|^2,
+# where |v|^2 is the same for every centroid c. The nearest
+# centroid of every document therefore comes from a single
+# product of the document vectors with the centroids.
+def applyRocchioSparse(testData, classes, centroids, matrix, rows) :
+	numCorrect = 0
+	classifications = dict()
+	
+	docIDs = [docID for docID in testData if docID in rows]
+	vectors = matrix[[rows[docID] for docID in docIDs]]
+	distances = (centroids ** 2).sum(axis=1) - 2 * vectors.dot(centroids.T)
+	
+	# argmin picks the first of equal distances, like applyRocchioOnce
+	for docID, best in zip(docIDs, distances.argmin(axis=1)) :
+		classifications[docID] = classes[best]
+		if classes[best] == testData[docID] :
+			numCorrect += 1
+	
+	printStats(numCorrect, len(docIDs), len(testData) - len(docIDs))
+	
+	return classifications
+
+# printStats
+# Prints some stats about the classifications to the terminal.
+def printStats(numCorrect, numClassified, numNotClassified) :
 	print "percent correct: ", (float(numCorrect)/float(numClassified)) * 100
 	print "number classified: ", numClassified
 	print "number correct: ", numCorrect
 	print "number not classified: ", numNotClassified
-	
-	return classifications
 
 # applyRocchioOnce
 # args -
@@ -0,0 +1,117 @@
+################################################################
+# PostingsCache.py -
+#  a memory-bounded cache of decoded postings lists, kept
+#  across queries and shared by the main and zone indexes
+#
+# Eviction is a segmented LRU: a postings list enters the
+# "probation" segment, and moves to the "protected" segment
+# when it is hit again. Protected lists are only demoted back
+# to probation when the protected segment is full, so terms
+# which are asked for repeatedly outlive terms which are
+# asked for once (for example by a wildcard expansion).
+#
+################################################################
+
+import sys
+from collections import OrderedDict
+
+# the default bound on the bytes held by the cache
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# the fraction of the cache reserved for protected entries
+PROTECTED_FRACTION = 0.8
+
+
+# Estimates the bytes of memory held by a decoded postings
+# list, a (docID -> position list, idf) tuple as returned by
+# queryIndex.createIndex
+def postingsSize(postings) :
+	outDict = postings[0]
+	size = sys.getsizeof(postings) + sys.getsizeof(outDict)
+	intSize = sys.getsizeof(0)
+	for positionList in outDict.itervalues() :
+		size += sys.getsizeof(positionList) + intSize * (len(positionList) + 1)
+	return size
+
+
+class PostingsCache(object):
+
+	def __init__(self, maxBytes = DEFAULT_MAX_BYTES) :
+		self.maxBytes = maxBytes
+		self.maxProtectedBytes = int(maxBytes * PROTECTED_FRACTION)
+
+		# map from key to (postings, size), least recently used first
+		self.probation = OrderedDict()
+		self.protected = OrderedDict()
+		self.probationBytes = 0
+		self.protectedBytes = 0
+
+		# counters
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	# Returns the postings cached under key, or None
+	def get(self, key) :
+		if key in self.protected :
+			entry = self.protected.pop(key)
+			self.protected[key] = entry
+		elif key in self.probation :
+			# a second use promotes the entry
+			entry = self.probation.pop(key)
+			self.probationBytes -= entry[1]
+			self.protected[key] = entry
+			self.protectedBytes += entry[1]
+			self.demote()
+		else :
+			self.misses += 1
+			return None
+		self.hits += 1
+		return entry[0]
+
+	# Caches postings under key, which must not be cached yet
+	def put(self, key, postings) :
+		size = postingsSize(postings)
+		if size > self.maxBytes :
+			return
+		self.probation[key] = (postings, size)
+		self.probationBytes += size
+		self.evict()
+
+	# moves the least recently used protected entries back
+	# to probation until the protected segment fits
+	def demote(self) :
+		while self.protectedBytes > self.maxProtectedBytes :
+			key, entry = self.protected.popitem(last=False)
+			self.protectedBytes -= entry[1]
+			self.probation[key] = entry
+			self.probationBytes += entry[1]
+		self.evict()
+
+	# drops entries until the cache fits, least recently
+	# used probationary entries first
+	def evict(self) :
+		while self.probationBytes + self.protectedBytes > self.maxBytes :
+			if len(self.probation) > 0 :
+				key, entry = self.probation.popitem(last=False)
+				self.probationBytes -= entry[1]
+			else :
+				key, entry = self.protected.popitem(last=False)
+				self.protectedBytes -= entry[1]
+			self.evictions += 1
+
+	def clear(self) :
+		self.probation.clear()
+		self.protected.clear()
+		self.probationBytes = 0
+		self.protectedBytes = 0
+
+	# returns a one line summary of the counters
+	def stats(self) :
+		lookups = self.hits + self.misses
+		hitRatio = 0.0
+		if lookups > 0 :
+			hitRatio = float(self.hits) / lookups
+		return "postings cache: %d hits, %d misses (hit ratio %.3f), %d evictions, %d entries, %d bytes" % \
+			(self.hits, self.misses, hitRatio, self.evictions,
+			 len(self.probation) + len(self.protected), self.probationBytes + self.protectedBytes)
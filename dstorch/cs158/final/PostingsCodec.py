@@ -0,0 +1,102 @@
+################################################################
+# PostingsCodec.py -
+#  encodings of the postings lists written by createIndex.py
+#  and read back by queryIndex.py
+#
+# "text" is the original format: the idf followed by
+# ":docID pos pos ..." for every document, on one line.
+#
+# "vbyte" stores the same information in binary. A postings
+# list is its length in bytes, then the idf as an 8-byte
+# double, the number of documents, and for every document
+# in order of docID the gap from the previous docID, the
+# number of positions and the gaps between the positions.
+# Lengths, counts and gaps are variable-byte integers: 7 bits
+# per byte, the high bit set on all but the last byte.
+#
+# An index using a codec other than text starts with the line
+# "codec <name>".
+#
+################################################################
+
+import struct
+
+CODECS = ["text", "vbyte"]
+
+# the header line naming the codec of an index
+HEADER_PREFIX = "codec "
+
+DOUBLE = struct.Struct("<d")
+
+
+# Appends the variable-byte encoding of n to the list
+# of characters out
+def encodeVarint(n, out) :
+	while n > 0x7f :
+		out.append(chr((n & 0x7f) | 0x80))
+		n >>= 7
+	out.append(chr(n))
+
+
+# Decodes the variable-byte integer at position pos of the
+# string s, and returns it with the position following it
+def decodeVarint(s, pos) :
+	n = 0
+	shift = 0
+	while True :
+		byte = ord(s[pos])
+		pos += 1
+		n |= (byte & 0x7f) << shift
+		if byte < 0x80 :
+			return n, pos
+		shift += 7
+
+
+# Returns the postings list with the given idf and map
+# from docID to positions, encoded with the vbyte codec
+def encodeVByte(idf, littleDict) :
+	out = [DOUBLE.pack(idf)]
+	encodeVarint(len(littleDict), out)
+	lastDocID = 0
+	for docID in sorted(littleDict) :
+		positionList = littleDict[docID]
+		encodeVarint(docID - lastDocID, out)
+		encodeVarint(len(positionList), out)
+		lastPos = 0
+		for pos in positionList :
+			encodeVarint(pos - lastPos, out)
+			lastPos = pos
+		lastDocID = docID
+	body = "".join(out)
+	length = []
+	encodeVarint(len(body), length)
+	return "".join(length) + body
+
+
+# Reads the vbyte postings list at the current position of
+# indexFile, and returns its map from docID to positions and
+# its idf, like queryIndex.createIndex
+def readVByte(indexFile) :
+	# a length takes at most 10 bytes
+	start = indexFile.tell()
+	head = indexFile.read(10)
+	length, pos = decodeVarint(head, 0)
+	indexFile.seek(start + pos, 0)
+	body = indexFile.read(length)
+
+	idf = DOUBLE.unpack_from(body, 0)[0]
+	numDocs, pos = decodeVarint(body, DOUBLE.size)
+	outDict = dict()
+	docID = 0
+	for i in range(numDocs) :
+		gap, pos = decodeVarint(body, pos)
+		docID += gap
+		count, pos = decodeVarint(body, pos)
+		positionList = []
+		lastPos = 0
+		for j in range(count) :
+			gap, pos = decodeVarint(body, pos)
+			lastPos += gap
+			positionList.append(lastPos)
+		outDict[docID] = positionList
+	return outDict, idf
@@ -0,0 +1,54 @@
+##################################################
+# benchmarkPageRank.py -
+#  Compares the page ranks of pageRank.py, which
+#  iterates until convergence, with those of the
+#  fixed 128 iterations of computePageRank.m on
+#  the same adjacency matrix.
+#
+# Arguments
+#   arg1 - the link graph from buildAdjacency.py
+#   arg2 - optional, the number of pages
+#
+##################################################
+
+import sys
+import time
+
+import numpy
+
+import pageRank
+
+# the number of iterations of computePageRank.m
+MATLAB_ITERATIONS = 128
+
+
+# Runs computePageRank with the given tolerance and number
+# of iterations, and returns the ranks, the iterations run and
+# the seconds they took
+def timePageRank(adjacency, tolerance, maxIterations) :
+	start = time.time()
+	x, iterations = pageRank.computePageRank(adjacency, tolerance=tolerance,
+		maxIterations=maxIterations)
+	return x, iterations, time.time() - start
+
+
+if __name__ == '__main__' :
+
+	numPages = None
+	if len(sys.argv) > 2 :
+		numPages = int(sys.argv[2])
+
+	start = time.time()
+	adjacency = pageRank.loadAdjacency(sys.argv[1], numPages)
+	print "pages: %d, links: %d, loaded in %.2fs" % (adjacency.shape[0], adjacency.nnz,
+		time.time() - start)
+
+	fixedX, fixedIterations, fixedTime = timePageRank(adjacency, 0, MATLAB_ITERATIONS)
+	print "fixed:     %4d iterations in %.2fs" % (fixedIterations, fixedTime)
+
+	x, iterations, seconds = timePageRank(adjacency, pageRank.TOLERANCE,
+		pageRank.MAX_ITERATIONS)
+	print "converged: %4d iterations in %.2fs, tolerance %g" % (iterations, seconds,
+		pageRank.TOLERANCE)
+
+	print "L1 distance between the two: %g" % numpy.abs(x - fixedX).sum()
@@ -1,4 +1,17 @@
 ##################################################
+# buildAdjacency.py -
+#  Extracts the link graph of the collection.
+#
+# Pages are parsed one at a time, and the links
+# of batches of pages are extracted by a pool of
+# processes while the next batch is parsed.
+#
+# Arguments
+#   arg1 - xml text file containing the collection
+#   arg2 - the graph file to output
+#   arg3 - optional, "text" to write the adjacency
+#          matrix read by computePageRank.m instead
+#          of the binary graph of linkGraph.py
 #
 # Authors:
 #   David Storch (dstorch)
@@ -8,58 +21,114 @@
 
 import sys
 import re
-import math
+import multiprocessing
 
 from parseCollection import XMLParser
 
+# the wiki markup of a link, [[title|text]] or [[title#section]]
+LINK_REGEX = re.compile("\[\[[^\[\]]*\]\]")
 
-if __name__ == '__main__' :
-	
-	# filehandles
-	collection = open(sys.argv[1])
-	outfile = open(sys.argv[2], 'w')
-
-	# extract docID, title, and text from the XML
-	xmlparse = XMLParser(collection)
-	parsedPages = xmlparse.parseCollection()
-	
-	# the number of documents
-	N = float(len(parsedPages))
-	
+# the number of pages handed to the pool of processes at once
+BATCH_SIZE = 1000
+# the number of batches being extracted at once
+MAX_PENDING = 2
+
+
+# extractLinks
+# Returns the set of page titles linked to in the
+# given text of a page.
+def extractLinks(text) :
+	titles = set()
+	for match in LINK_REGEX.findall(text) :
+		match = match[2:-2]
+		match = match.split("|")[0]
+		match = match.split("#")[0]
+		titles.add(match)
+	return titles
+
+# readLinks
+# Parses the collection, and extracts the links of every
+# page with the processes of pool.
+#
+# return -
+#  the map from title to docID, and the list of sets of
+#  titles linked to by each page, in order of the collection
+def readLinks(collection, pool) :
 	title2id = dict()
-	adjacency = []
-	
-	# set up map from title to docID
-	for p in parsedPages :
+	linkTitles = []
+	pending = []
+	batch = []
+
+	for p in XMLParser(collection).iterCollection() :
 		title2id[p._title] = p._id
-		
-	# build the adjacency matrix
-	for p in parsedPages :
-
-		adjacencyList = []
-		
-		matches = re.findall("\[\[[^\[\]]*\]\]", (p._pzone + "\n" + p._text))
-		 
-		for match in matches :
-			match = match[2:-2]
-			
-			arr = match.split("|")
-			match = arr[0]
-			arr = match.split("#")
-			match = arr[0]
-			
-			if match in title2id :
-				if not title2id[match] in adjacencyList :
-					adjacencyList.append(title2id[match])
-				
-		adjacency.append(adjacencyList)
-				
-	# write out to the file
-	for i, adjList in enumerate(adjacency) :
+		batch.append(p._pzone + "\n" + p._text)
+		if len(batch) == BATCH_SIZE :
+			pending.append(pool.map_async(extractLinks, batch))
+			batch = []
+			if len(pending) > MAX_PENDING :
+				linkTitles.extend(pending.pop(0).get())
+
+	pending.append(pool.map_async(extractLinks, batch))
+	for result in pending :
+		linkTitles.extend(result.get())
+
+	return title2id, linkTitles
+
+# buildGraph
+# Resolves the linked titles to docIDs.
+#
+# return -
+#  the row pointers and link targets of the graph, in the
+#  compressed sparse row form of linkGraph.py
+def buildGraph(title2id, linkTitles) :
+	pointers = [0]
+	targets = []
+	for titles in linkTitles :
+		links = set()
+		for title in titles :
+			if title in title2id :
+				links.add(title2id[title])
+		targets.extend(sorted(links))
+		pointers.append(len(targets))
+
+	# pages only linked to still need a row
+	numPages = max([len(linkTitles)] + [target + 1 for target in targets])
+	pointers.extend([len(targets)] * (numPages + 1 - len(pointers)))
+
+	return pointers, targets
+
+# writeText
+# Writes out the graph as the adjacency matrix read by
+# computePageRank.m, one "<from> <to> <weight>" line per
+# link, numbered from 1.
+def writeText(outfile, pointers, targets) :
+	for i in range(len(pointers) - 1) :
+		adjList = targets[pointers[i]:pointers[i + 1]]
 		if len(adjList) == 0 :
 			continue
 		degree = str(1.0/float(len(adjList)))
 		for j in adjList :
 			outfile.write(str(i+1) + " " + str(j+1) + " " + degree + "\n")
-	
 
+
+if __name__ == '__main__' :
+
+	# filehandles
+	collection = open(sys.argv[1])
+	outPath = sys.argv[2]
+	text = len(sys.argv) > 3 and sys.argv[3] == "text"
+
+	pool = multiprocessing.Pool()
+	title2id, linkTitles = readLinks(collection, pool)
+	pool.close()
+	pool.join()
+
+	pointers, targets = buildGraph(title2id, linkTitles)
+
+	# write out to the file
+	if text :
+		writeText(open(outPath, 'w'), pointers, targets)
+	else :
+		# only the binary graph needs numpy
+		import linkGraph
+		linkGraph.writeGraph(outPath, pointers, targets)
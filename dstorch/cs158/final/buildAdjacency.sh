@@ -16,6 +16,7 @@
 MAIN="buildAdjacency.py"
 
 # call python script, always putting the
-# output into "adjacency.dat"
-python $MAIN $1 adjacency.dat
+# output into "adjacency.dat" as the text
+# matrix read by computePageRank.m
+python $MAIN $1 adjacency.dat text
 
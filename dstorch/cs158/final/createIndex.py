@@ -8,6 +8,11 @@
 # Arguments
 #   arg1 - xml text file containing the original collection
 #   arg2 - index file to output
+#   arg3 - stop words file, one per line
+#   arg4 - titles file to output
+#   arg5 - zone index file to output
+#   arg6 - optional, the codec of the postings lists: text
+#          (the default) or vbyte; see PostingsCodec.py
 #
 # Author:
 #   David Storch (dstorch)
@@ -21,6 +26,7 @@ import math
 import os
 from Weights import WeightHolder
 from parseCollection import XMLParser
+import PostingsCodec
 
 ##################################################
 # GLOBALS
@@ -40,6 +46,9 @@ minimumStubChars = 1000
 
 weights = WeightHolder()
 
+# the encoding of the postings lists
+codec = "text"
+
 ##################################################
 
 
@@ -106,10 +115,19 @@ def writeIndex(indexFile, bigDict, normalizationDict, positionMap) :
 	# NOTE: reserve 21 bytes for the length of the dictionary
 	# (last character is a newline)
 	
+	# binary codecs encode the postings lists up front
+	encoded = dict()
+	if codec == "vbyte" :
+		for term in bigDict :
+			encoded[term] = PostingsCodec.encodeVByte(idfDict[term], bigDict[term])
+	
 	# determine byte-positions, not taking length of header into account
 	currentBytes = 0
 	for term in bigDict:
 		positionMap[term] = currentBytes
+		if term in encoded :
+			currentBytes += len(encoded[term])
+			continue
 		littleDict = bigDict[term]
 		currentBytes += len(str(idfDict[term]))
 		for docID in littleDict :
@@ -132,6 +150,10 @@ def writeIndex(indexFile, bigDict, normalizationDict, positionMap) :
 	dictionaryLengthStr = str(dictionaryLength)
 	normLengthStr = str(normLength)
 	
+	# name the codec, unless the postings are text
+	if codec != "text" :
+		indexFile.write(PostingsCodec.HEADER_PREFIX + codec + "\n")
+	
 	# write dictionary length to the beginning of the file
 	for i in range(0, 20 - len(dictionaryLengthStr)) :
 		indexFile.write('0')
@@ -153,6 +175,9 @@ def writeIndex(indexFile, bigDict, normalizationDict, positionMap) :
 	
 	# write the inverted index
 	for term in bigDict:
+		if term in encoded :
+			indexFile.write(encoded[term])
+			continue
 		littleDict = bigDict[term]
 		indexFile.write(str(idfDict[term]))
 		for docID in littleDict :
@@ -170,10 +195,14 @@ if __name__ == '__main__' :
 	
 	# filehandles
 	collection = open(sys.argv[1])
-	indexFile = open(sys.argv[2], 'w')
+	indexFile = open(sys.argv[2], 'wb')
 	stopWords = open(sys.argv[3])
 	titleIndex = open(sys.argv[4], 'w')
-	pzoneFile = open(sys.argv[5], "w")
+	pzoneFile = open(sys.argv[5], "wb")
+	if len(sys.argv) > 6 :
+		codec = sys.argv[6]
+		if codec not in PostingsCodec.CODECS :
+			sys.exit("unknown codec " + codec + ", expected one of " + ", ".join(PostingsCodec.CODECS))
 	
 	# create a set of stop words from the stopWords infile
 	# assuming that there is one word per line
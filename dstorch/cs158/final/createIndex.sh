@@ -9,14 +9,17 @@
 # The following python scripts are required:
 #   1. buildAdjacency.py - producing the adjacency matrix
 #      for the wikipedia web graph
-#   2. computePageRank.sh - uses the adjacency matrix
-#      to calculate page ranks; just invokes the matlab
-#      script computePageRank.m
+#   2. pageRank.py - uses the adjacency matrix to
+#      calculate page ranks (computePageRank.sh runs the
+#      original matlab script computePageRank.m instead)
 #   3. buildStopWordList.py - analyzes the collection
 #      in order to determine a good list of stop words
 #
 # Run as:
-#   ./createIndex.sh <collection> <index to output>
+#   ./createIndex.sh <collection> <index to output> [codec]
+#
+# where codec is text (the default) or vbyte, the encoding
+# of the postings lists (see PostingsCodec.py)
 #
 # Author:
 #  David Storch
@@ -37,9 +40,9 @@ python $STOPBUILD $1 $STOPOUT
 # Main program to be executed
 MAIN="createIndex.py"
 
-# adjacency matrix builder and outfile
+# link graph builder and its binary outfile (see linkGraph.py)
 ADJBUILD="buildAdjacency.py"
-ADJOUT="adjacency.out"
+ADJOUT="adjacency.graph"
 
 # titles file to write
 TITLES="titles.out"
@@ -48,11 +51,24 @@ TITLES="titles.out"
 ZONE="zone.out"
 
 # Call $MAIN and pass all the script arguments
-python $MAIN $1 $2 $STOPOUT $TITLES $ZONE
+python $MAIN $1 $2 $STOPOUT $TITLES $ZONE $3
 
-# build the adjacency matrix
+# build the link graph
 python $ADJBUILD $1 $ADJOUT
 
-# compute page ranks
-source computePageRank.sh
+# compute page ranks, one for every page of the titles file
+python pageRank.py $ADJOUT pageRank.out $(wc -l < $TITLES)
+
+# and the page ranks for each class of the classification
+# read by queryIndex.sh, if there is one
+CLASSIF="classifMNB.dat"
+if [ -f $CLASSIF ]; then
+	python topicPageRank.py $ADJOUT $CLASSIF topicPageRank.npy $(wc -l < $TITLES)
+else
+	CLASSIF=""
+fi
+
+# precompute the static priors of each document, which
+# queryIndex.py finds next to the index
+python staticPriors.py pageRank.out $TITLES $2.priors $CLASSIF
 
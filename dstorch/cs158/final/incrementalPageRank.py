@@ -0,0 +1,158 @@
+##################################################
+# incrementalPageRank.py -
+#  Updates the page ranks of a link graph after
+#  pages and links have changed, without starting
+#  over from scratch.
+#
+# The power iteration of pageRank.py is warm-started
+# from the previous ranks, which are already close
+# to the new ones when the changes are small, so it
+# converges in a fraction of the iterations.
+#
+# Its tolerance bounds the L1 distance of the ranks
+# from the exact page ranks of the new graph. Every
+# iteration shrinks the distance to them by a factor
+# of 1 - alpha at least, so iterating until the change
+# is below tolerance * alpha / (1 - alpha) is enough.
+#
+# The changes are read from a file of lines, with
+# pages numbered from 1 as in the text adjacency
+# matrix:
+#   "+ <from> <to>" - adds a link
+#   "- <from> <to>" - removes a link
+#   "+ <page>"      - adds a page without links
+#   "- <page>"      - removes all the links from and
+#                     to a page
+#
+# Arguments
+#   arg1 - the link graph before the changes
+#   arg2 - the page ranks before the changes
+#   arg3 - the changes
+#   arg4 - the page rank file to output
+#   arg5 - optional, the binary link graph to output
+#          after the changes
+#
+##################################################
+
+import sys
+import time
+
+import numpy
+import scipy.sparse
+
+import linkGraph
+import pageRank
+
+
+# readPageRank()
+# Reads the page ranks written by pageRank.writePageRank.
+def readPageRank(pageRankFile) :
+	return numpy.array([float(line) for line in pageRankFile if line.strip()])
+
+
+# readChanges()
+# Reads the file of changes to the link graph.
+#
+# return -
+#  a dictionary of the lists of the added links, removed
+#  links, added pages and removed pages, keyed by "addLinks",
+#  "removeLinks", "addPages" and "removePages". Links are
+#  (from, to) pairs, numbered from 0.
+def readChanges(changesFile) :
+	changes = {"addLinks" : [], "removeLinks" : [], "addPages" : [], "removePages" : []}
+	for line in changesFile :
+		fields = line.split()
+		if not fields :
+			continue
+		add = fields[0] == "+"
+		pages = [int(field) - 1 for field in fields[1:]]
+		if len(pages) == 2 :
+			changes["addLinks" if add else "removeLinks"].append(tuple(pages))
+		else :
+			changes["addPages" if add else "removePages"].append(pages[0])
+	return changes
+
+
+# applyChanges()
+# Returns the adjacency matrix of the graph after the
+# changes, weighted like the matrices of pageRank.py.
+#
+# args
+#  1. adjacency - the adjacency matrix before the changes
+#  2. changes - the changes returned by readChanges
+def applyChanges(adjacency, changes) :
+	links = adjacency.tocoo()
+	fromPages = links.row.astype(numpy.int64)
+	toPages = links.col.astype(numpy.int64)
+
+	newPages = [adjacency.shape[0]] + [page + 1 for page in changes["addPages"]]
+	for link in changes["addLinks"] :
+		newPages.append(max(link) + 1)
+	N = max(newPages)
+
+	# links are removed by their number from * N + to
+	keep = numpy.ones(len(fromPages), dtype=bool)
+	if changes["removeLinks"] :
+		removed = numpy.array([f * N + t for f, t in changes["removeLinks"]], dtype=numpy.int64)
+		keep &= ~numpy.isin(fromPages * N + toPages, removed)
+	if changes["removePages"] :
+		removed = numpy.array(changes["removePages"], dtype=numpy.int64)
+		keep &= ~numpy.isin(fromPages, removed) & ~numpy.isin(toPages, removed)
+
+	added = numpy.array(changes["addLinks"], dtype=numpy.int64).reshape(-1, 2)
+	fromPages = numpy.concatenate([fromPages[keep], added[:, 0]])
+	toPages = numpy.concatenate([toPages[keep], added[:, 1]])
+
+	# duplicate links are summed by the conversion, and counted once
+	structure = scipy.sparse.csr_matrix((numpy.ones(len(fromPages)), (fromPages, toPages)),
+		shape=(N, N))
+	structure.sum_duplicates()
+	return linkGraph.adjacencyMatrix(structure.indptr, structure.indices, N)
+
+
+# updatePageRank()
+# Computes the page ranks of the graph after the changes,
+# starting from the ranks before them. New pages start with
+# the rank of a page reached by teleport alone.
+#
+# args
+#  1. adjacency - the adjacency matrix after the changes
+#  2. previous - the page ranks before the changes
+#  3. alpha - the teleport probability
+#  4. tolerance - the largest L1 distance of the result
+#     from the exact page ranks
+#  5. maxIterations - the most iterations to run
+#
+# return -
+#  the array of page ranks, and the number of iterations run
+def updatePageRank(adjacency, previous, alpha=pageRank.ALPHA, tolerance=pageRank.TOLERANCE,
+		maxIterations=pageRank.MAX_ITERATIONS) :
+	N = adjacency.shape[0]
+	start = numpy.empty(N)
+	start[:len(previous)] = previous[:N]
+	start[len(previous):] = alpha / N
+	start /= start.sum()
+
+	return pageRank.computePageRank(adjacency, alpha, tolerance * alpha / (1 - alpha),
+		maxIterations, start)
+
+
+if __name__ == '__main__' :
+
+	previous = readPageRank(open(sys.argv[2]))
+	# there is a rank for every page, even those without links
+	adjacency = pageRank.loadAdjacency(sys.argv[1], len(previous))
+	changes = readChanges(open(sys.argv[3]))
+	outfile = open(sys.argv[4], 'w')
+
+	start = time.time()
+	adjacency = applyChanges(adjacency, changes)
+	x, iterations = updatePageRank(adjacency, previous)
+	done = time.time()
+	pageRank.writePageRank(outfile, x)
+
+	if len(sys.argv) > 5 :
+		linkGraph.writeGraph(sys.argv[5], adjacency.indptr, adjacency.indices)
+
+	print("pages: %d, links: %d" % (adjacency.shape[0], adjacency.nnz))
+	print("%d iterations in %.2fs" % (iterations, done - start))
@@ -0,0 +1,96 @@
+################################################################
+# linkGraph.py -
+#  The binary format of the link graph written by
+#  buildAdjacency.py, in compressed sparse row form.
+#
+# The file starts with a header of the magic string "LINKCSR1",
+# the number of pages N and the number of links L, as 8-byte
+# little-endian integers. Then come the N + 1 row pointers and
+# the L link targets, as little-endian integers of 8 and 4
+# bytes: the links of page i are the docIDs
+# targets[pointers[i]:pointers[i + 1]], sorted and without
+# duplicates.
+#
+# Both arrays can be memory-mapped, so loading the graph
+# takes no time whatever its size.
+#
+################################################################
+
+import struct
+
+import numpy
+import scipy.sparse
+
+MAGIC = b"LINKCSR1"
+HEADER = struct.Struct("<8sqq")
+
+POINTER_TYPE = numpy.dtype("<i8")
+TARGET_TYPE = numpy.dtype("<i4")
+
+
+# isGraph
+# Returns whether the file at path is a link graph in this
+# format, rather than a text adjacency matrix.
+def isGraph(path) :
+	f = open(path, "rb")
+	magic = f.read(len(MAGIC))
+	f.close()
+	return magic == MAGIC
+
+
+# writeGraph
+# Writes the link graph with the given row pointers and
+# link targets, both sequences of integers, to path.
+def writeGraph(path, pointers, targets) :
+	pointers = numpy.asarray(pointers, dtype=POINTER_TYPE)
+	targets = numpy.asarray(targets, dtype=TARGET_TYPE)
+	f = open(path, "wb")
+	f.write(HEADER.pack(MAGIC, len(pointers) - 1, len(targets)))
+	pointers.tofile(f)
+	targets.tofile(f)
+	f.close()
+
+
+# readGraph
+# Reads the link graph at path, and returns its row pointers
+# and link targets as numpy arrays, memory-mapped unless
+# mmap is False.
+def readGraph(path, mmap=True) :
+	f = open(path, "rb")
+	magic, numPages, numLinks = HEADER.unpack(f.read(HEADER.size))
+	if magic != MAGIC :
+		raise ValueError(path + " is not a link graph")
+
+	if mmap :
+		f.close()
+		pointers = numpy.memmap(path, dtype=POINTER_TYPE, mode="r",
+			offset=HEADER.size, shape=(numPages + 1,))
+		targets = numpy.memmap(path, dtype=TARGET_TYPE, mode="r",
+			offset=HEADER.size + (numPages + 1) * POINTER_TYPE.itemsize, shape=(numLinks,))
+	else :
+		pointers = numpy.fromfile(f, dtype=POINTER_TYPE, count=numPages + 1)
+		targets = numpy.fromfile(f, dtype=TARGET_TYPE, count=numLinks)
+		f.close()
+	return pointers, targets
+
+
+# adjacencyMatrix
+# Returns the numPages x numPages adjacency matrix of the
+# link graph, as a scipy sparse matrix in which each link
+# of a page weighs one over the number of links of the page,
+# like the text matrix of buildAdjacency.py.
+#
+# numPages defaults to the number of pages of the graph, and
+# can be larger to add pages without links.
+def adjacencyMatrix(pointers, targets, numPages=None) :
+	pointers = numpy.asarray(pointers)
+	if numPages is None :
+		numPages = len(pointers) - 1
+	if numPages > len(pointers) - 1 :
+		padding = numpy.repeat(pointers[-1], numPages - (len(pointers) - 1))
+		pointers = numpy.concatenate([pointers, padding])
+
+	degrees = numpy.diff(pointers)
+	weights = numpy.repeat(1.0 / numpy.maximum(degrees, 1), degrees)
+	return scipy.sparse.csr_matrix((weights, numpy.asarray(targets), pointers),
+		shape=(numPages, numPages))
@@ -0,0 +1,165 @@
+##################################################
+# pageRank.py -
+#  Computes the page ranks of the adjacency matrix
+#  written by buildAdjacency.py, like
+#  computePageRank.m, and writes them to a file
+#  that queryIndex.py reads, one per line in order
+#  of docID.
+#
+# Rather than running a fixed number of power
+# iterations, it iterates until the L1 norm of the
+# change in the ranks is below a tolerance.
+#
+# Arguments
+#   arg1 - the link graph from buildAdjacency.py, either
+#          binary (see linkGraph.py) or a text adjacency
+#          matrix of lines "<from> <to> <weight>"
+#          numbered from 1
+#   arg2 - the page rank file to output
+#   arg3 - optional, the number of pages; by default
+#          the largest page number in the matrix
+#
+##################################################
+
+import sys
+import time
+
+import numpy
+import scipy.sparse
+
+import linkGraph
+
+# teleport probability
+ALPHA = 0.1
+# iterate until the L1 norm of the change in the ranks is below this
+TOLERANCE = 1e-8
+# or this many iterations have been run
+MAX_ITERATIONS = 1000
+
+
+# readAdjacency()
+# Reads the adjacency matrix in the text format of
+# buildAdjacency.py. Duplicate entries are summed, as
+# spconvert does.
+#
+# args
+#  1. adjacencyFile - a filehandle for the adjacency matrix
+#  2. numPages - the number of pages, or None for the largest
+#     page number in the matrix
+#
+# return -
+#  the numPages x numPages sparse matrix, with the weight of
+#  the link from page i to page j in row i and column j,
+#  numbered from 0
+def readAdjacency(adjacencyFile, numPages=None) :
+	fromPages = []
+	toPages = []
+	weights = []
+	for line in adjacencyFile :
+		fields = line.split()
+		if not fields :
+			continue
+		fromPages.append(int(fields[0]) - 1)
+		toPages.append(int(fields[1]) - 1)
+		weights.append(float(fields[2]))
+
+	if numPages is None :
+		numPages = max(fromPages + toPages) + 1 if fromPages else 0
+	return scipy.sparse.csr_matrix((weights, (fromPages, toPages)),
+		shape=(numPages, numPages))
+
+
+# loadAdjacency()
+# Returns the adjacency matrix of the link graph at path, in
+# either of the formats of buildAdjacency.py, like readAdjacency.
+def loadAdjacency(path, numPages=None) :
+	if linkGraph.isGraph(path) :
+		pointers, targets = linkGraph.readGraph(path)
+		return linkGraph.adjacencyMatrix(pointers, targets, numPages)
+	return readAdjacency(open(path), numPages)
+
+
+# computePageRank()
+# Runs the power iteration of computePageRank.m: starting from
+# all the probability on the first page, or from the ranks in
+# start, every step follows a link with probability 1 - alpha
+# and teleports to any page with probability alpha, or always
+# teleports from a page without links.
+#
+# Teleports go to every page alike, unless teleport gives the
+# probability of teleporting to each page. It can also be a
+# matrix with such a distribution in each column, to compute
+# the page ranks of all of them at once, one per column.
+#
+# args
+#  1. adjacency - the matrix returned by readAdjacency
+#  2. alpha - the teleport probability
+#  3. tolerance - stop once the L1 norm of the change in the
+#     ranks is below this; 0 runs all of maxIterations
+#  4. maxIterations - the most iterations to run
+#  5. start - optional, the ranks to start from; by default
+#     teleport if it is given
+#  6. teleport - optional, the distribution(s) to teleport to
+#
+# return -
+#  the array of page ranks, and the number of iterations run
+def computePageRank(adjacency, alpha=ALPHA, tolerance=TOLERANCE,
+		maxIterations=MAX_ITERATIONS, start=None, teleport=None) :
+	N = adjacency.shape[0]
+	if N == 0 :
+		return numpy.zeros(0), 0
+
+	# x * adjacency is adjacency' * x, with x as a column
+	transposed = adjacency.T.tocsr()
+	dangling = numpy.asarray(adjacency.sum(axis=1)).ravel() == 0
+	# the probability of teleporting from each page
+	restart = numpy.where(dangling, 1.0, alpha)
+
+	if start is not None :
+		x = numpy.array(start, dtype=float)
+	elif teleport is not None :
+		x = numpy.array(teleport, dtype=float)
+	else :
+		x = numpy.zeros(N)
+		x[0] = 1
+	if teleport is None :
+		teleport = 1.0 / N
+
+	iterations = 0
+	while iterations < maxIterations :
+		v = numpy.dot(restart, x)
+		nextX = (1 - alpha) * transposed.dot(x) + v * teleport
+		iterations += 1
+		# the largest change of any of the columns
+		change = numpy.abs(nextX - x).sum(axis=0).max()
+		x = nextX
+		if change < tolerance :
+			break
+
+	return x, iterations
+
+
+# writePageRank()
+# Writes the page ranks in the format of computePageRank.m.
+def writePageRank(outfile, x) :
+	for rank in x :
+		outfile.write('%12.16f\n' % rank)
+
+
+if __name__ == '__main__' :
+
+	outfile = open(sys.argv[2], 'w')
+	numPages = None
+	if len(sys.argv) > 3 :
+		numPages = int(sys.argv[3])
+
+	start = time.time()
+	adjacency = loadAdjacency(sys.argv[1], numPages)
+	loaded = time.time()
+	x, iterations = computePageRank(adjacency)
+	done = time.time()
+	writePageRank(outfile, x)
+
+	print("pages: %d, links: %d" % (adjacency.shape[0], adjacency.nnz))
+	print("loaded in %.2fs" % (loaded - start))
+	print("%d iterations in %.2fs" % (iterations, done - loaded))
@@ -5,7 +5,8 @@
 #
 # In order to parse the collection, instantiate an XMLParser
 # object by passing in a filehandle for the collection file.
-# Then call the parseCollection method on this object.
+# Then call the parseCollection method on this object, or
+# iterate over iterCollection to parse one page at a time.
 #
 # Author:
 #  David Storch
@@ -46,21 +47,25 @@ class XMLParser(object):
 	# accessed. It is responsible for parsing the XML
 	# of the entire collection.
 	def parseCollection(self) :
-		self._toParse
+		return list(self.iterCollection())
+	
+	# Like parseCollection, but yields the ParsedPage objects
+	# one at a time as they are parsed, so that the collection
+	# never has to fit in memory.
+	def iterCollection(self) :
 		while not self._toParse.closed :
 			#need to catch EOF error
 			line = self._toParse.readline()
 			openIndex = realFind(line, "<collection>")
 			if openIndex != -1 :
 				return self.parsePages(line[openIndex:])
+		return iter([])
 			
 	# The top-level XML parsing methof which is called from
 	# parse collection. This method calls the ParsedPage
 	# constructor and then calls ParsedPage.parse() on this
 	# object.
 	def parsePages(self, restOfLine) :
-		pageList = []
-		
 		line = restOfLine
 		
 		while str.find(line, "</collection>") == -1 :
@@ -68,11 +73,9 @@ class XMLParser(object):
 			if openIndex != -1 :
 				page = ParsedPage(self._toParse)
 				page.parse(line[openIndex:])
-				pageList.append(page)
+				yield page
 		
 			line = self._toParse.readline()
-		
-		return pageList
 
 
 
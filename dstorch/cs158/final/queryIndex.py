@@ -15,6 +15,14 @@
 #	arg4 - gives <docID> <stub?> <title>
 #		A wikipage is considered a stub if the text following
 #		the top section is less than 1000 characters long
+#	arg5 - classifFile, gives <docID> <class>, the Naive
+#		Multinomial Bayes classification of each document
+#	arg6 - optional, the topic-sensitive page ranks written by
+#		topicPageRank.py, which replace the page rank of arg3
+#		(needs numpy)
+#
+# If staticPriors.py wrote the directory <indexFile>.priors,
+# the per-document parts of the ranking come from there.
 #
 # Author:
 #   David Storch (dstorch)
@@ -24,11 +32,22 @@
 import PorterStemmer
 import re
 import sys
+import os
 import math
 import heapq
 from bool_parser import bool_expr_ast
 from BTrees.OOBTree import OOBTree
 from Weights import WeightHolder
+from PostingsCache import PostingsCache
+import PostingsCodec
+
+# numpy is only needed for topic-sensitive page ranks
+# and static priors
+try :
+	import numpy
+	import staticPriors
+except ImportError :
+	numpy = None
 
 
 ##################################################
@@ -57,10 +76,25 @@ stubsBody = dict()
 # Bayes classification of each document
 mnbClassif = dict()
 
+# the memory-mapped array of the page rank of each document
+# for each class, if given
+topicPageRank = None
+
+# the memory-mapped columns of the static priors of each
+# document from staticPriors.py, if they were written
+priors = None
+
 # the total number of documents in each class,
 # according to Multinomial Naive Bayes
 totalInClass = dict()
 
+# global cache of decoded postings lists, kept across
+# queries and shared by the main and zone indexes
+postingsCache = PostingsCache()
+
+# the codec of the postings lists of each index file, by name
+indexCodecs = dict()
+
 ##################################################
 
 
@@ -95,8 +129,15 @@ def makePermuterms(btree, s, num) :
 # Input:
 #	1. indexFile, a file handle for the inverted index
 def buildDictionary(indexFile, btree, normDict) :
-	dictionaryBytes = long(indexFile.readline())
+	# indexes with binary postings name their codec first
+	line = indexFile.readline()
+	indexCodecs[indexFile.name] = "text"
+	if line.startswith(PostingsCodec.HEADER_PREFIX) :
+		indexCodecs[indexFile.name] = line[len(PostingsCodec.HEADER_PREFIX):].strip()
+		line = indexFile.readline()
+	dictionaryBytes = long(line)
 	normBytes = long(indexFile.readline())
+	headerBytes = indexFile.tell()
 	
 	# build the permuterm btree
 	dictionaryString = indexFile.read(dictionaryBytes)
@@ -104,7 +145,7 @@ def buildDictionary(indexFile, btree, normDict) :
 	for line in dictionaryList :
 		if len(line) > 1 :
 			fields = line.split(' ')
-			makePermuterms(btree, fields[0], long(fields[1]) + 42 + dictionaryBytes + normBytes)
+			makePermuterms(btree, fields[0], long(fields[1]) + headerBytes + dictionaryBytes + normBytes)
 
 			
 	# build the normalization dict
@@ -239,19 +280,31 @@ def createIndex(postingString) :
 	
 	return outDict, float(idf)
 		
+# Returns the decoded postings list starting at the given
+# byte of the index file, reading and parsing it only if
+# it is not in the postings cache.
+def readPostings(indexFile, bytePosition) :
+	key = (indexFile.name, bytePosition)
+	postings = postingsCache.get(key)
+	if postings == None :
+		indexFile.seek(bytePosition, 0)
+		if indexCodecs.get(indexFile.name) == "vbyte" :
+			postings = PostingsCodec.readVByte(indexFile)
+		else :
+			postings = createIndex(indexFile.readline())
+		postingsCache.put(key, postings)
+	return postings
+
 # Given a token (with or without the dollar sign),
-# fetches the corresponding postings list from the
-# index file.
+# fetches the corresponding decoded postings list.
 #
 # input: a stemmed term from the lexicon
 def getPostingsList(token, btree, indexFile) :
 	if token.find("$") == -1 :
 		token = '$' + token
 	if token in btree :
-		bytePosition = btree[token]
-		indexFile.seek(bytePosition, 0)
-		line = indexFile.readline()
-		return line
+		return readPostings(indexFile, btree[token])
+	return createIndex(None)
 
 	
 
@@ -388,10 +441,7 @@ def wildcardQuery(s, indexFile, btree, normDict, cache) :
 
 	outList = []
 	for i in keyset :
-		bytes = btree[i]
-		indexFile.seek(bytes, 0)
-		line = indexFile.readline()
-		cache[i] = createIndex(line)
+		cache[i] = readPostings(indexFile, btree[i])
 		dictionary = cache[i][0]
 		
 		outList.extend(dictionary.keys())
@@ -487,7 +537,9 @@ def phraseQuery(s, indexFile, btree, normDict, cache) :
 					nextIDDict = cache[t][0]
 					postings = merge(postings, nextIDDict)
 		else :
-			postings = cache[term][0]
+			# copy, as merging the postings of a later wildcard
+			# term would otherwise modify the cached postings
+			postings = dict(cache[term][0])
 
 		bigDict[term] = postings
 		
@@ -522,7 +574,7 @@ def freeTextQuery(s, indexFile, btree, normDict, cache) :
 			resultSet = resultSet.union(set(postings))
 		else :
 			# get a dictionary from doc ID to positions
-			cache[t] = createIndex(getPostingsList(t, btree, indexFile))
+			cache[t] = getPostingsList(t, btree, indexFile)
 			postings = cache[t][0]
 
 			resultSet = resultSet.union(set(postings.keys()))
@@ -731,6 +783,36 @@ def mnbRank(docScores, zoneScores) :
 	return classCount
 
 
+# blendPageRank
+#
+# Called from computeFinalRanking, this function mixes the
+# topic-sensitive page ranks of the classes, weighted by the
+# fraction of the query results in each class from mnbRank.
+# Returns a dictionary mapping each docID in hits to its rank.
+def blendPageRank(hits, classifScores) :
+	docIDs = sorted(hits)
+	return dict(zip(docIDs, blendedRanks(docIDs, classifScores)))
+
+# blendedRanks
+#
+# Returns the array of the blended page ranks of blendPageRank
+# for the list of docIDs.
+def blendedRanks(docIDs, classifScores) :
+	classWeights = classArray(classifScores, topicPageRank.shape[1])
+	return numpy.dot(topicPageRank[docIDs], classWeights)
+
+# classArray
+#
+# Returns the array of the numClasses scores of classifScores,
+# indexed by class, with zeros for the classes without one.
+def classArray(classifScores, numClasses) :
+	scores = numpy.zeros(numClasses)
+	for classif in classifScores :
+		if 0 <= classif < numClasses :
+			scores[classif] = classifScores[classif]
+	return scores
+
+
 # computeFinalRanking
 #
 # This function is an important helper for getTopK.
@@ -766,6 +848,15 @@ def computeFinalRanking(listOfTerms, hits, docScores, zoneScores, pageRank, cach
 	# get classification information
 	classifScores = mnbRank(docScores, zoneScores)
 	
+	# with static priors, the hits are all ranked at once
+	if priors is not None :
+		return rankWithPriors(listOfTerms, hits, docScores, zoneScores, classifScores,
+			queryIdf, weights)
+	
+	# use the page rank of the classes of the results
+	if topicPageRank is not None :
+		pageRank = blendPageRank(hits, classifScores)
+	
 	# get the max score for each type of measurement---
 	# this will be used to normalize the scores
 	maxPageRank = 0
@@ -801,6 +892,11 @@ def computeFinalRanking(listOfTerms, hits, docScores, zoneScores, pageRank, cach
 	# in the main weighting scheme
 	t1d = dict(); t2d = dict(); t3d = dict(); t4d = dict()
 	
+	termRankWeight = weights.getTermRankWeight()
+	pageRankWeight = weights.getPageRankWeight()
+	zoneWeight = weights.getZoneWeight()
+	mnbWeight = weights.getMNBWeight()
+	
 	for docID in hits :
 		
 		###################################################
@@ -809,10 +905,10 @@ def computeFinalRanking(listOfTerms, hits, docScores, zoneScores, pageRank, cach
 		#
 		###################################################
 		
-		w1 = weights.getTermRankWeight()
-		w2 = weights.getPageRankWeight()
-		w3 = weights.getZoneWeight()
-		w4 = weights.getMNBWeight()
+		w1 = termRankWeight
+		w2 = pageRankWeight
+		w3 = zoneWeight
+		w4 = mnbWeight
 		
 		# If the query is general, then weight page rank higher and
 		# underweight articles that are tagged as stubs.
@@ -904,6 +1000,100 @@ def computeFinalRanking(listOfTerms, hits, docScores, zoneScores, pageRank, cach
 	return top10
 
 
+# rankWithPriors
+#
+# Does the rest of computeFinalRanking with the static priors
+# of staticPriors.py, computing the same scores for all of the
+# hits at once from the columns of priors gathered at their
+# docIDs, rather than document by document.
+def rankWithPriors(listOfTerms, hits, docScores, zoneScores, classifScores, queryIdf, weights) :
+	
+	docIDs = numpy.array(sorted(hits))
+	docIDList = docIDs.tolist()
+	numHits = len(docIDs)
+	
+	if topicPageRank is not None :
+		ranks = blendedRanks(docIDs, classifScores)
+		with numpy.errstate(divide='ignore') :
+			newPageRank = numpy.where(ranks > 0, -1.0 / numpy.log(ranks), 0)
+	else :
+		newPageRank = priors["pageRank"][docIDs]
+	isStubHeader = priors["stubHeader"][docIDs] != 0
+	isStubBody = priors["stubBody"][docIDs] != 0
+	classifs = priors["classif"][docIDs]
+	
+	termRank = numpy.array([docScores.get(docID, 0) for docID in docIDList], dtype=float)
+	zoneRank = numpy.array([zoneScores.get(docID, 0) for docID in docIDList], dtype=float)
+	
+	# normalize each score by its max over the hits
+	t1 = numpy.zeros(numHits)
+	maxTermRank = max(0, termRank.max())
+	if maxTermRank > 0 :
+		t1 = termRank / maxTermRank
+	t2 = numpy.zeros(numHits)
+	maxPageRank = max(0, newPageRank.max())
+	if maxPageRank > 0 :
+		t2 = newPageRank / maxPageRank
+	t3 = numpy.zeros(numHits)
+	maxZoneRank = max(0, zoneRank.max())
+	if maxZoneRank > 0 :
+		t3 = zoneRank / maxZoneRank
+	
+	t4 = numpy.zeros(numHits)
+	if classifScores :
+		scores = classArray(classifScores, max(classifScores) + 1)
+		known = (classifs >= 0) & (classifs < len(scores))
+		t4[known] = scores[classifs[known]]
+	
+	# dynamically compute weights, as computeFinalRanking does
+	w1 = numpy.empty(numHits); w1.fill(weights.getTermRankWeight())
+	w2 = numpy.empty(numHits); w2.fill(weights.getPageRankWeight())
+	w3 = numpy.empty(numHits); w3.fill(weights.getZoneWeight())
+	w4 = numpy.empty(numHits); w4.fill(weights.getMNBWeight())
+	
+	if queryIdf <= weights.getIdfCutoff() :
+		w1 -= 0.1
+		w2 += 0.2
+		w3 -= 0.1
+	
+	w1[isStubBody] -= 0.3
+	w2[isStubBody] += 0.15
+	w3[isStubBody] += 0.15
+	
+	w1[isStubHeader] += 0.05
+	w2[isStubHeader] += 0.05
+	w3[isStubHeader] -= 0.1
+	
+	# do the weighting here
+	t1d = w1 * t1; t2d = w2 * t2; t3d = w3 * t3; t4d = w4 * t4
+	weightedScore = t1d + t2d + t3d + t4d
+	
+	# improve the score for each matching title term
+	for term in listOfTerms :
+		inTitle = numpy.array([term in titles[docID] for docID in docIDList], dtype=bool)
+		weightedScore[inTitle] *= weights.getTitleBoostFactor()
+	
+	# reduce the score for stubs if the query is sufficiently general
+	if queryIdf <= weights.getIdfCutoff() :
+		print "overweighting page rank"
+		weightedScore[isStubBody | isStubHeader] *= weights.getStubBoostFactor()
+	
+	# reduce the score if page rank was the major contributor
+	for td in (t1d, t3d) :
+		control = td > 0
+		control[control] = (t2d[control] / td[control]) > 10.0
+		weightedScore[control] *= weights.getPageRankControl()
+	
+	# the top 10, ties going to the lowest docID like heapq.nlargest
+	top = numpy.argsort(-weightedScore, kind='mergesort')[:K]
+	
+	for i in top :
+		docID = docIDList[i]
+		print docID, float(weightedScore[i]), float(t1d[i]), float(t3d[i]), float(t2d[i]), float(t4d[i]), mnbClassif[docID], rawTitles[docID].strip()
+	
+	return [docIDList[i] for i in top]
+
+
 ##################################################################################
 #### MULTINOMIAL NAIVE BAYES CLASSIFICATION								   #######
 ##################################################################################
@@ -938,17 +1128,31 @@ def readMNBClassif(classifFile) :
 ###########################################################
 if __name__ == '__main__' :
 	
-	indexFile = open(sys.argv[1])
-	zoneFile = open(sys.argv[2])
+	indexFile = open(sys.argv[1], 'rb')
+	zoneFile = open(sys.argv[2], 'rb')
 	stopWords = open(sys.argv[3])
 	pageRankFile = open(sys.argv[4])
 	titleFile = open(sys.argv[5])
 	classifFile = open(sys.argv[6])
+	
+	if len(sys.argv) > 7 :
+		if numpy is None :
+			sys.stderr.write("topic-sensitive page ranks need numpy; using " + sys.argv[4] + "\n")
+		else :
+			print "memory-mapping topic-sensitive page ranks"
+			topicPageRank = numpy.load(sys.argv[7], mmap_mode='r')
+	
+	# the static priors written next to the index
+	priorsDirectory = sys.argv[1] + ".priors"
+	if numpy is not None and os.path.isdir(priorsDirectory) :
+		print "memory-mapping static priors"
+		priors = staticPriors.readPriors(priorsDirectory)
 
 
-	# global dict which avoids doing unnecessary
-	# disk reads. The cache should be flushed
-	# before every query.
+	# global dict of the postings of the terms of the
+	# current query, flushed before every query. The
+	# postings themselves come from postingsCache, which
+	# avoids doing unnecessary disk reads across queries.
 	cache = dict()
 	zoneCache = dict()
 	
@@ -1023,3 +1227,5 @@ if __name__ == '__main__' :
 		except EOFError:
 			receiveInput = False
 	
+	sys.stderr.write(postingsCache.stats() + "\n")
+	
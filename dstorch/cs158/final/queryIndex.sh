@@ -20,6 +20,13 @@ TITLES="titles.out"
 # the file containing document classifications
 CLASSIF="classifMNB.dat"
 
+# the page rankings for each classification, used
+# instead of $RANK when createIndex.sh wrote them
+TOPICRANK="topicPageRank.npy"
+if [ ! -f $TOPICRANK ]; then
+	TOPICRANK=""
+fi
+
 # Call $MAIN and pass all the script arguments
-python $MAIN $1 $ZONE $STOP $RANK $TITLES $CLASSIF
+python $MAIN $1 $ZONE $STOP $RANK $TITLES $CLASSIF $TOPICRANK
 
@@ -0,0 +1,116 @@
+##################################################
+# staticPriors.py -
+#  Precomputes the parts of the ranking of
+#  queryIndex.py that depend on the document
+#  alone, and stores them next to the index, one
+#  numpy array per column in a directory, indexed
+#  by docID:
+#
+#   pageRank.npy   - the page rank as used in the
+#                    ranking: -1 / log(rank), or 0
+#   stubHeader.npy - whether the top section of the
+#                    page is stub-length
+#   stubBody.npy   - whether the rest of the page is
+#   classif.npy    - the Naive Multinomial Bayes
+#                    classification, or -1
+#
+# queryIndex.py memory-maps the columns, and gathers
+# them at the docIDs of the results of each query.
+#
+# Arguments
+#   arg1 - the page rank file from pageRank.py
+#   arg2 - the titles file from createIndex.py
+#   arg3 - the directory to output, <index>.priors
+#          for the index read by queryIndex.py
+#   arg4 - optional, the classification, lines of
+#          "<docID> <class>"
+#
+##################################################
+
+import math
+import os
+import sys
+
+import numpy
+
+COLUMNS = ["pageRank", "stubHeader", "stubBody", "classif"]
+
+
+# transformPageRank()
+# Compresses the range of the page ranks with logarithms,
+# taking the inverse so that the highest page ranks remain
+# the highest, as computeFinalRanking does.
+def transformPageRank(pageRank) :
+	transformed = []
+	for rank in pageRank :
+		if rank > 0 :
+			transformed.append(-1.0 / math.log(rank))
+		else :
+			transformed.append(0)
+	return numpy.array(transformed, dtype=float)
+
+
+# buildPriors()
+# Reads the page ranks, the stub flags of the titles file and
+# the classification, if there is one.
+#
+# return -
+#  a dictionary mapping each of COLUMNS to its array
+def buildPriors(pageRankFile, titleFile, classifFile=None) :
+	pageRank = [float(line) for line in pageRankFile if line.strip()]
+
+	stubs = dict()
+	for line in titleFile :
+		fields = line.split("\t")
+		stubs[int(fields[0])] = (int(fields[1]) != 0, int(fields[2]) != 0)
+
+	classifs = dict()
+	if classifFile is not None :
+		for line in classifFile :
+			fields = line.split()
+			if fields :
+				classifs[int(fields[0])] = int(fields[1])
+
+	numPages = max([len(pageRank)] + [docID + 1 for docID in stubs] +
+		[docID + 1 for docID in classifs])
+	priors = {
+		"pageRank" : numpy.zeros(numPages),
+		"stubHeader" : numpy.zeros(numPages, dtype=numpy.uint8),
+		"stubBody" : numpy.zeros(numPages, dtype=numpy.uint8),
+		"classif" : numpy.empty(numPages, dtype=numpy.int32),
+	}
+	priors["pageRank"][:len(pageRank)] = transformPageRank(pageRank)
+	for docID in stubs :
+		priors["stubHeader"][docID], priors["stubBody"][docID] = stubs[docID]
+	priors["classif"].fill(-1)
+	for docID in classifs :
+		priors["classif"][docID] = classifs[docID]
+	return priors
+
+
+# writePriors()
+# Writes every column of priors to the directory.
+def writePriors(directory, priors) :
+	if not os.path.isdir(directory) :
+		os.makedirs(directory)
+	for column in COLUMNS :
+		numpy.save(os.path.join(directory, column + ".npy"), priors[column])
+
+
+# readPriors()
+# Memory-maps the columns written by writePriors.
+def readPriors(directory) :
+	priors = dict()
+	for column in COLUMNS :
+		priors[column] = numpy.load(os.path.join(directory, column + ".npy"), mmap_mode="r")
+	return priors
+
+
+if __name__ == '__main__' :
+
+	classifFile = None
+	if len(sys.argv) > 4 :
+		classifFile = open(sys.argv[4])
+
+	priors = buildPriors(open(sys.argv[1]), open(sys.argv[2]), classifFile)
+	writePriors(sys.argv[3], priors)
@@ -0,0 +1,95 @@
+##################################################
+# test_pageRank.py -
+#  Checks that incremental page rank updates stay
+#  within their tolerance of a full recompute, and
+#  the topic-sensitive page ranks.
+#
+# Run with pytest.
+#
+##################################################
+
+import random
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+import incrementalPageRank
+import linkGraph
+import pageRank
+import topicPageRank
+
+
+# Returns the adjacency matrix of a random graph
+def randomGraph(numPages, maxLinks, rand) :
+	pointers = [0]
+	targets = []
+	for page in range(numPages) :
+		links = set(rand.randrange(numPages) for i in range(rand.randint(0, maxLinks)))
+		targets.extend(sorted(links))
+		pointers.append(len(targets))
+	return linkGraph.adjacencyMatrix(pointers, targets)
+
+
+def test_incremental_page_rank() :
+	rand = random.Random(0)
+	adjacency = randomGraph(2000, 8, rand)
+	previous, _ = pageRank.computePageRank(adjacency, tolerance=1e-12)
+
+	changes = {
+		"addLinks" : [(rand.randrange(2010), rand.randrange(2010)) for i in range(40)],
+		"removeLinks" : [(page, adjacency.indices[adjacency.indptr[page]])
+			for page in range(0, 2000, 100) if adjacency[page].nnz],
+		"addPages" : [2011],
+		"removePages" : [3, 5],
+	}
+	changed = incrementalPageRank.applyChanges(adjacency, changes)
+	assert changed.shape == (2012, 2012)
+	for f, t in changes["removeLinks"] :
+		assert changed[f, t] == 0
+	assert changed[3].nnz == 0 and changed[:, 5].nnz == 0
+	rowSums = numpy.asarray(changed.sum(axis=1)).ravel()
+	assert numpy.allclose(rowSums[rowSums > 0], 1)
+
+	exact, _ = pageRank.computePageRank(changed, tolerance=1e-12)
+	for tolerance in (1e-4, 1e-6, 1e-8) :
+		x, _ = incrementalPageRank.updatePageRank(changed, previous, tolerance=tolerance)
+		assert numpy.abs(x - exact).sum() <= tolerance
+
+	# against a full recompute with the same guarantee, a small update
+	# saves the iterations taken to get as close as the previous ranks
+	# already are, which is most of them at loose tolerances
+	changes = {"addLinks" : [(17, 1234)], "removeLinks" : [changes["removeLinks"][1]],
+		"addPages" : [], "removePages" : []}
+	changed = incrementalPageRank.applyChanges(adjacency, changes)
+	alpha = pageRank.ALPHA
+	for tolerance in (1e-4, 1e-6, 1e-8) :
+		_, iterations = incrementalPageRank.updatePageRank(changed, previous, tolerance=tolerance)
+		_, fullIterations = pageRank.computePageRank(changed,
+			tolerance=tolerance * alpha / (1 - alpha))
+		assert iterations <= 0.7 * fullIterations
+
+
+def test_topic_page_rank() :
+	rand = random.Random(1)
+	adjacency = randomGraph(500, 6, rand)
+	classes = numpy.array([rand.randrange(-1, 4) for page in range(500)])
+	classes[classes == 2] = 3
+
+	ranks, _ = topicPageRank.computeTopicPageRank(adjacency, classes, tolerance=1e-12)
+	assert ranks.shape == (500, 4)
+	assert not ranks[:, 2].any()
+
+	# each column is the page rank teleporting to the pages of its class
+	for c in (0, 1, 3) :
+		teleport = (classes == c) / float((classes == c).sum())
+		x, _ = pageRank.computePageRank(adjacency, tolerance=1e-12, teleport=teleport)
+		assert numpy.abs(ranks[:, c] - x).sum() < 1e-10
+		assert abs(ranks[:, c].sum() - 1) < 1e-10
+
+	# teleporting to every page is the plain page rank
+	everyPage = numpy.zeros(500, dtype=int)
+	ranks, _ = topicPageRank.computeTopicPageRank(adjacency, everyPage, tolerance=1e-12)
+	x, _ = pageRank.computePageRank(adjacency, tolerance=1e-12)
+	assert numpy.abs(ranks[:, 0] - x).sum() < 1e-10
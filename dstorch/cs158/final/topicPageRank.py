@@ -0,0 +1,90 @@
+##################################################
+# topicPageRank.py -
+#  Computes a topic-sensitive page rank for every
+#  class of the multinomial naive bayes
+#  classification of the collection: the page rank
+#  of pageRank.py, but teleporting only to the pages
+#  of the class.
+#
+# The ranks are saved as a numpy array with a row
+# for every page and a column for every class, which
+# queryIndex.py memory-maps and blends by the classes
+# of the results of each query.
+#
+# Arguments
+#   arg1 - the link graph from buildAdjacency.py
+#   arg2 - the classification, lines of
+#          "<docID> <class>"
+#   arg3 - the array of page ranks to output (.npy)
+#   arg4 - optional, the number of pages
+#
+##################################################
+
+import sys
+import time
+
+import numpy
+
+import pageRank
+
+
+# readClassification()
+# Reads the lines "<docID> <class>" of classifFile.
+#
+# return -
+#  an array of the class of each of the numPages pages,
+#  -1 for pages without one
+def readClassification(classifFile, numPages) :
+	classes = numpy.empty(numPages, dtype=int)
+	classes.fill(-1)
+	for line in classifFile :
+		fields = line.split()
+		if fields :
+			classes[int(fields[0])] = int(fields[1])
+	return classes
+
+
+# computeTopicPageRank()
+# Computes the page ranks teleporting to the pages of each
+# class alike, all of them at once.
+#
+# args
+#  1. adjacency - the adjacency matrix of pageRank.py
+#  2. classes - the class of each page, from readClassification
+#  3. alpha, tolerance, maxIterations - as for
+#     pageRank.computePageRank
+#
+# return -
+#  the numPages x classes array of page ranks, whose column c
+#  holds the ranks for class c, or zeros if no page has class c,
+#  and the number of iterations run
+def computeTopicPageRank(adjacency, classes, alpha=pageRank.ALPHA,
+		tolerance=pageRank.TOLERANCE, maxIterations=pageRank.MAX_ITERATIONS) :
+	numClasses = classes.max() + 1 if len(classes) else 0
+	classified = numpy.nonzero(classes >= 0)[0]
+
+	teleport = numpy.zeros((len(classes), numClasses))
+	teleport[classified, classes[classified]] = 1
+	sizes = teleport.sum(axis=0)
+	teleport /= numpy.maximum(sizes, 1)
+
+	return pageRank.computePageRank(adjacency, alpha, tolerance, maxIterations,
+		teleport=teleport)
+
+
+if __name__ == '__main__' :
+
+	numPages = None
+	if len(sys.argv) > 4 :
+		numPages = int(sys.argv[4])
+	adjacency = pageRank.loadAdjacency(sys.argv[1], numPages)
+	classes = readClassification(open(sys.argv[2]), adjacency.shape[0])
+
+	start = time.time()
+	ranks, iterations = computeTopicPageRank(adjacency, classes)
+	done = time.time()
+	numpy.save(sys.argv[3], ranks)
+
+	print("pages: %d, links: %d, classes: %d" % (adjacency.shape[0], adjacency.nnz,
+		ranks.shape[1]))
+	print("%d iterations in %.2fs" % (iterations, done - start))
@@ -0,0 +1,366 @@
+"""
+Codecs for sequences of non-negative integers, such as the doc id gaps,
+term frequencies and positions of postings lists.
+
+Every codec encodes a list of integers to bytes, and decodes them given
+the number of integers. The count is not stored, so that callers which
+already know it (such as a postings block, which stores the document
+frequency) do not pay for it twice.
+
+    vbyte   7 bits per byte, the high bit set on all but the last byte
+    simple8b  64-bit words holding as many values of equal width as fit,
+            with the layout given by a 4-bit selector
+    pfor    patched frame of reference: blocks of 128 values packed at the
+            width which fits 90% of them, the rest stored as exceptions
+    eliasfano  for sorted sequences: the low bits of each value packed,
+            and the high bits as a unary-coded bit vector
+
+Sorted sequences are encoded with encode_sorted(), which codes their gaps
+except for Elias-Fano, which codes the values themselves (and codes the
+prefix sums of unsorted sequences).
+
+Decoding is vectorised with NumPy when it is installed, and falls back
+to pure Python otherwise.
+"""
+
+import math
+from typing import Dict, List, Sequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Shortest sequence decoded with NumPy; shorter ones are faster in Python
+NUMPY_MIN_COUNT = 256
+
+
+def _gaps(values: Sequence[int]) -> List[int]:
+    return [value - prev for prev, value in zip([0] + list(values), values)]
+
+
+def _prefix_sums(values: Sequence[int]) -> List[int]:
+    sums = list(values)
+    for i in range(1, len(sums)):
+        sums[i] += sums[i - 1]
+    return sums
+
+
+def _pack(values: Sequence[int], width: int) -> bytes:
+    """Packs values into `width` bits each, least significant bits first.
+    Eight values take exactly `width` bytes, so they are packed in groups."""
+    out = bytearray()
+    for i in range(0, len(values), 8):
+        group = 0
+        for j, value in enumerate(values[i:i + 8]):
+            group |= value << (j * width)
+        out += group.to_bytes(width, 'little')
+    return bytes(out[:(len(values) * width + 7) // 8])
+
+
+def _unpack(buf, width: int, count: int) -> List[int]:
+    """Unpacks `count` values of `width` bits packed by _pack()."""
+    if width == 0:
+        return [0] * count
+    mask = (1 << width) - 1
+    values = []
+    for i in range(0, (count + 7) // 8):
+        group = int.from_bytes(buf[i * width:(i + 1) * width], 'little')
+        for _ in range(min(8, count - 8 * i)):
+            values.append(group & mask)
+            group >>= width
+    return values
+
+
+def _unpack_array(buf, width: int, count: int):
+    """Vectorised _unpack(), returning an array of uint64."""
+    if width == 0:
+        return numpy.zeros(count, numpy.uint64)
+    bits = numpy.unpackbits(numpy.frombuffer(buf, numpy.uint8, (count * width + 7) // 8),
+                            bitorder='little')[:count * width]
+    weights = numpy.left_shift(numpy.uint64(1), numpy.arange(width, dtype=numpy.uint64))
+    return bits.reshape(count, width).astype(numpy.uint64) @ weights
+
+
+class Codec:
+    """Encodes lists of non-negative integers."""
+    name = None
+    id = None  # The byte identifying the codec in a binary index file
+
+    def encode(self, values: Sequence[int]) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, buf, count: int) -> List[int]:
+        """Decodes the first `count` values encoded in `buf`."""
+        if numpy is not None and count >= NUMPY_MIN_COUNT:
+            return self.decode_array(buf, count).tolist()
+        return self._decode(buf, count)
+
+    def decode_array(self, buf, count: int):
+        """Decodes the first `count` values into a NumPy array of uint64."""
+        raise NotImplementedError
+
+    def _decode(self, buf, count: int) -> List[int]:
+        raise NotImplementedError
+
+    def encode_sorted(self, values: Sequence[int]) -> bytes:
+        """Encodes a non-decreasing list, by its gaps unless overridden."""
+        return self.encode(_gaps(values))
+
+    def decode_sorted(self, buf, count: int) -> List[int]:
+        if numpy is not None and count >= NUMPY_MIN_COUNT:
+            return numpy.cumsum(self.decode_array(buf, count), dtype=numpy.uint64).tolist()
+        return _prefix_sums(self._decode(buf, count))
+
+
+class VByte(Codec):
+    name = 'vbyte'
+    id = b'V'
+
+    def encode(self, values: Sequence[int]) -> bytes:
+        out = bytearray()
+        for n in values:
+            while n > 0x7f:
+                out.append((n & 0x7f) | 0x80)
+                n >>= 7
+            out.append(n)
+        return bytes(out)
+
+    def _decode(self, buf, count: int) -> List[int]:
+        values = []
+        n = 0
+        shift = 0
+        for byte in buf:
+            if byte & 0x80:
+                n |= (byte & 0x7f) << shift
+                shift += 7
+            else:
+                values.append(n | (byte << shift))
+                if len(values) == count:
+                    break
+                n = 0
+                shift = 0
+        return values
+
+    def decode_array(self, buf, count: int):
+        data = numpy.frombuffer(buf, numpy.uint8)
+        ends = numpy.flatnonzero(data < 0x80)[:count]
+        data = data[:ends[-1] + 1].astype(numpy.uint64)
+        starts = numpy.concatenate(([0], ends[:-1] + 1))
+        # The index of each byte within its varint
+        offsets = numpy.arange(len(data)) - numpy.repeat(starts, ends - starts + 1)
+        parts = (data & numpy.uint64(0x7f)) << (offsets * 7).astype(numpy.uint64)
+        return numpy.add.reduceat(parts, starts)
+
+
+# The (number of values, bits per value) of each Simple-8b selector. The
+# first two encode runs of ones, the most common gap and frequency.
+_SIMPLE8B = [(240, 0), (120, 0), (60, 1), (30, 2), (20, 3), (15, 4), (12, 5), (10, 6),
+             (8, 7), (7, 8), (6, 10), (5, 12), (4, 15), (3, 20), (2, 30), (1, 60)]
+
+
+class Simple8b(Codec):
+    name = 'simple8b'
+    id = b'S'
+
+    def encode(self, values: Sequence[int]) -> bytes:
+        bit_lengths = [value.bit_length() for value in values]
+        if bit_lengths and max(bit_lengths) > 60:
+            raise ValueError('simple8b encodes values of at most 60 bits')
+        out = bytearray()
+        i = 0
+        while i < len(values):
+            for selector, (count, width) in enumerate(_SIMPLE8B):
+                window = values[i:i + count]
+                if width == 0:
+                    # A run of ones, padded with ones if it reaches the end
+                    if window.count(1) != len(window):
+                        continue
+                elif max(bit_lengths[i:i + count]) > width:
+                    continue
+                word = selector << 60
+                if width:
+                    for j, value in enumerate(window):
+                        word |= value << (j * width)
+                out += word.to_bytes(8, 'little')
+                i += count
+                break
+        return bytes(out)
+
+    def _decode(self, buf, count: int) -> List[int]:
+        values = []
+        for pos in range(0, len(buf), 8):
+            if len(values) >= count:
+                break
+            word = int.from_bytes(buf[pos:pos + 8], 'little')
+            num, width = _SIMPLE8B[word >> 60]
+            if width == 0:
+                values.extend([1] * num)
+                continue
+            mask = (1 << width) - 1
+            for _ in range(num):
+                values.append(word & mask)
+                word >>= width
+        return values[:count]
+
+    def decode_array(self, buf, count: int):
+        words = numpy.frombuffer(buf, '<u8', len(buf) // 8)
+        selectors = (words >> numpy.uint64(60)).astype(numpy.intp)
+        counts = numpy.array([num for num, _ in _SIMPLE8B])[selectors]
+        ends = numpy.cumsum(counts)
+        words, selectors, counts = [a[:numpy.searchsorted(ends, count) + 1]
+                                    for a in (words, selectors, counts)]
+        starts = ends[:len(words)] - counts
+        values = numpy.empty(int(counts.sum()), numpy.uint64)
+        for selector in numpy.unique(selectors):
+            num, width = _SIMPLE8B[selector]
+            chosen = selectors == selector
+            positions = starts[chosen][:, None] + numpy.arange(num)
+            if width == 0:
+                values[positions.ravel()] = 1
+                continue
+            shifts = numpy.arange(num, dtype=numpy.uint64) * numpy.uint64(width)
+            mask = numpy.uint64((1 << width) - 1)
+            values[positions.ravel()] = ((words[chosen][:, None] >> shifts) & mask).ravel()
+        return values[:count]
+
+
+# Number of values in a PForDelta block, and the fraction which must fit
+# in the block's bit width
+_PFOR_BLOCK = 128
+_PFOR_FIT = 0.9
+
+
+class PForDelta(Codec):
+    """Each block is the bit width b (a byte), the number of exceptions
+    (a byte), their indexes within the block (a byte each), the bits of
+    each exception above the lowest b as varints, and the lowest b bits of
+    every value, packed."""
+    name = 'pfor'
+    id = b'P'
+
+    def encode(self, values: Sequence[int]) -> bytes:
+        out = bytearray()
+        for i in range(0, len(values), _PFOR_BLOCK):
+            block = values[i:i + _PFOR_BLOCK]
+            bit_lengths = sorted(value.bit_length() for value in block)
+            width = bit_lengths[min(len(block) - 1, int(_PFOR_FIT * len(block)))]
+            exceptions = [j for j, value in enumerate(block) if value >> width]
+            out.append(width)
+            out.append(len(exceptions))
+            out += bytes(exceptions)
+            out += VByte().encode([block[j] >> width for j in exceptions])
+            mask = (1 << width) - 1
+            out += _pack([value & mask for value in block], width)
+        return bytes(out)
+
+    def _blocks(self, buf, count: int):
+        """Yields the (exception indexes, exceptions, width, packed bits,
+        number of values) of each block."""
+        pos = 0
+        for i in range(0, count, _PFOR_BLOCK):
+            num = min(_PFOR_BLOCK, count - i)
+            width, num_exceptions = buf[pos], buf[pos + 1]
+            pos += 2
+            indexes = list(buf[pos:pos + num_exceptions])
+            pos += num_exceptions
+            highs = []
+            while len(highs) < num_exceptions:
+                n = shift = 0
+                while buf[pos] & 0x80:
+                    n |= (buf[pos] & 0x7f) << shift
+                    shift += 7
+                    pos += 1
+                highs.append(n | (buf[pos] << shift))
+                pos += 1
+            size = (num * width + 7) // 8
+            yield indexes, highs, width, buf[pos:pos + size], num
+            pos += size
+
+    def _decode(self, buf, count: int) -> List[int]:
+        values = []
+        for indexes, highs, width, packed, num in self._blocks(buf, count):
+            block = _unpack(packed, width, num)
+            for j, high in zip(indexes, highs):
+                block[j] |= high << width
+            values += block
+        return values
+
+    def decode_array(self, buf, count: int):
+        blocks = []
+        for indexes, highs, width, packed, num in self._blocks(memoryview(buf), count):
+            block = _unpack_array(packed, width, num)
+            if indexes:
+                block[indexes] |= numpy.array(highs, numpy.uint64) << numpy.uint64(width)
+            blocks.append(block)
+        return numpy.concatenate(blocks)
+
+
+class EliasFano(Codec):
+    """A byte holding the number l of low bits, the low l bits of every
+    value packed, and a bit vector in which value i sets bit
+    (value >> l) + i."""
+    name = 'eliasfano'
+    id = b'E'
+
+    def encode(self, values: Sequence[int]) -> bytes:
+        return self.encode_sorted(_prefix_sums(values))
+
+    def encode_sorted(self, values: Sequence[int]) -> bytes:
+        if not values:
+            return b''
+        universe = values[-1] + 1
+        low_bits = max(0, int(math.log2(universe / len(values))))
+        mask = (1 << low_bits) - 1
+        high = bytearray((len(values) + (universe >> low_bits) + 8) // 8)
+        for i, value in enumerate(values):
+            bit = (value >> low_bits) + i
+            high[bit >> 3] |= 1 << (bit & 7)
+        return bytes([low_bits]) + _pack([value & mask for value in values], low_bits) + high
+
+    def decode(self, buf, count: int) -> List[int]:
+        return _gaps(self.decode_sorted(buf, count))
+
+    def decode_array(self, buf, count: int):
+        return numpy.diff(self.decode_sorted_array(buf, count), prepend=numpy.uint64(0))
+
+    def decode_sorted(self, buf, count: int) -> List[int]:
+        if not count:
+            return []
+        if numpy is not None and count >= NUMPY_MIN_COUNT:
+            return self.decode_sorted_array(buf, count).tolist()
+        low_bits = buf[0]
+        start = 1 + (count * low_bits + 7) // 8
+        values = _unpack(buf[1:start], low_bits, count)
+        i = 0
+        for byte_index, byte in enumerate(buf[start:]):
+            while byte and i < count:
+                lowest = byte & -byte
+                bit = 8 * byte_index + lowest.bit_length() - 1
+                values[i] |= (bit - i) << low_bits
+                i += 1
+                byte ^= lowest
+            if i == count:
+                break
+        return values
+
+    def decode_sorted_array(self, buf, count: int):
+        low_bits = buf[0]
+        start = 1 + (count * low_bits + 7) // 8
+        lows = _unpack_array(memoryview(buf)[1:start], low_bits, count)
+        bits = numpy.unpackbits(numpy.frombuffer(buf, numpy.uint8, offset=start),
+                                bitorder='little')
+        highs = (numpy.flatnonzero(bits)[:count] - numpy.arange(count)).astype(numpy.uint64)
+        return (highs << numpy.uint64(low_bits)) | lows
+
+
+CODECS: Dict[str, Codec] = {codec.name: codec
+                            for codec in (VByte(), Simple8b(), PForDelta(), EliasFano())}
+
+
+def get_codec(name: str) -> Codec:
+    """Returns the codec with the given name."""
+    if name not in CODECS:
+        raise ValueError('unknown codec {!r}, expected one of {}'.format(
+            name, ', '.join(sorted(CODECS))))
+    return CODECS[name]
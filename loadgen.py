@@ -0,0 +1,107 @@
+"""
+A load generator for the query server in `server.py`.
+
+Opens `concurrency` connections, each of which sends a query, waits for
+its response and sends the next, until `requests` queries have been
+answered. Reports the throughput and latency percentiles:
+
+    python loadgen.py queries.txt --port 8158 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import Dict, Iterator, List, NamedTuple
+
+from server import MAX_LINE, OVERLOADED
+
+
+class LoadReport(NamedTuple):
+    requests: int
+    errors: int
+    rejected: int  # Requests the server was too overloaded to accept
+    secs: float
+    latencies: List[float]  # Seconds taken by each request, sorted
+
+    @property
+    def qps(self) -> float:
+        return self.requests / self.secs if self.secs else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        if not self.latencies:
+            return 0.0
+        return self.latencies[min(len(self.latencies) - 1, int(fraction * len(self.latencies)))]
+
+    def __str__(self) -> str:
+        return ('{} requests in {:.2f}s: {:.1f} qps, {} errors, {} rejected\n'
+                'latency ms: p50 {:.2f}, p90 {:.2f}, p99 {:.2f}, max {:.2f}').format(
+                    self.requests, self.secs, self.qps, self.errors, self.rejected,
+                    *(self.percentile(fraction) * 1000 for fraction in (0.5, 0.9, 0.99, 1)))
+
+
+async def _client(requests: Iterator[Dict], latencies: List[float], responses: List[Dict],
+                  host: str, port: int, path: str) -> None:
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path, limit=MAX_LINE)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+    try:
+        for request in requests:
+            start = time.perf_counter()
+            writer.write(json.dumps(request).encode('utf-8') + b'\n')
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError('the server closed the connection')
+            latencies.append(time.perf_counter() - start)
+            responses.append(json.loads(line.decode('utf-8')))
+    finally:
+        writer.close()
+
+
+async def generate_load(queries: List[str], requests: int, concurrency: int = 8,
+                        k: int = None, host: str = '127.0.0.1', port: int = None,
+                        path: str = None) -> LoadReport:
+    """Sends `requests` queries, cycling through `queries`, over
+    `concurrency` connections to a server on a Unix socket if `path` is
+    given, on a TCP port otherwise."""
+    # The clients share one iterator, so each request is sent once
+    shared = ({'id': i, 'query': query, 'k': k}
+              for i, query in zip(range(requests), itertools.cycle(queries)))
+    latencies = []
+    responses = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(shared, latencies, responses, host, port, path)
+                           for _ in range(concurrency)))
+    secs = time.perf_counter() - start
+    rejected = sum(response.get('error') == OVERLOADED for response in responses)
+    errors = sum('error' in response for response in responses) - rejected
+    return LoadReport(len(responses), errors, rejected, secs, sorted(latencies))
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('queries', help='file of queries, one per line')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8158)
+    parser.add_argument('--unix', help='connect to this Unix socket instead of TCP')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=8, help='number of connections')
+    parser.add_argument('-k', type=int, help='number of ranked results (default: all matches)')
+    args = parser.parse_args(argv)
+
+    with open(args.queries) as f:
+        queries = [line.strip() for line in f if line.strip()]
+    loop = asyncio.new_event_loop()
+    try:
+        print(loop.run_until_complete(generate_load(
+            queries, args.requests, args.concurrency, args.k, args.host, args.port, args.unix)))
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Compact in-memory postings.
+
+Holding an inverted index as nested dictionaries costs a dictionary per
+term, a string key and a list per posting, and an int object for every
+position. A PostingsIndex instead numbers the documents densely, in
+order of doc id, and lays the postings of all terms out in flat arrays:
+
+    term_starts: for every term, in sorted order, the offset of its first
+                 posting in `docs` (plus the total number of postings)
+    docs:        the document number of every posting, term by term
+    pos_starts:  for every posting, the offset of its first position in
+                 `positions` (plus the total number of positions)
+    positions:   the positions of every posting, in the same order
+
+Looking a term up returns a Postings view, which reads like the
+dictionary of doc id to positions of the nested layout. Doc ids must be
+integers (as strings).
+"""
+
+import bisect
+from array import array
+from typing import Dict, Iterable, Iterator, List, Mapping, Tuple
+
+import diskindex
+
+
+class Postings(Mapping):
+    """The postings of a term: a read-only mapping of doc id to the
+    positions of the term in that document."""
+
+    __slots__ = ('index', 'start', 'end')
+
+    def __init__(self, index: 'PostingsIndex', start: int, end: int):
+        self.index = index
+        self.start = start
+        self.end = end
+
+    def _find(self, doc_id: str) -> int:
+        """Returns the offset of the posting of a document in `docs`, or -1."""
+        doc = self.index.numbers.get(doc_id)
+        if doc is None:
+            return -1
+        docs = self.index.docs
+        i = bisect.bisect_left(docs, doc, self.start, self.end)
+        return i if i < self.end and docs[i] == doc else -1
+
+    def __getitem__(self, doc_id: str) -> List[int]:
+        i = self._find(doc_id)
+        if i < 0:
+            raise KeyError(doc_id)
+        pos_starts = self.index.pos_starts
+        return self.index.positions[pos_starts[i]:pos_starts[i + 1]].tolist()
+
+    def __contains__(self, doc_id) -> bool:
+        return self._find(doc_id) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        documents = self.index.documents
+        return (documents[doc] for doc in self.index.docs[self.start:self.end])
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+
+class PostingsIndex(Mapping):
+    """An immutable inverted index mapping terms to their Postings."""
+
+    def __init__(self, documents: List[str], terms: List[str], term_starts: array,
+                 docs: array, pos_starts: array, positions: array):
+        self.documents = documents  # The doc id of every document number
+        self.numbers = {doc_id: doc for doc, doc_id in enumerate(documents)}
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.term_starts = term_starts
+        self.docs = docs
+        self.pos_starts = pos_starts
+        self.positions = positions
+        self._doc_stats = None
+
+    @classmethod
+    def from_mapping(cls, inverted_index: Mapping[str, Mapping[str, List[int]]],
+                     doc_ids: Iterable[str] = ()) -> 'PostingsIndex':
+        """Compacts nested mappings of term to doc id to positions. Documents
+        without any term can be included by listing them in `doc_ids`."""
+        documents = set(doc_ids)
+        for postings in inverted_index.values():
+            documents.update(postings)
+        documents = sorted(documents, key=int)
+        numbers = {doc_id: doc for doc, doc_id in enumerate(documents)}
+        return _compact(documents, ((term, sorted((numbers[doc_id], positions)
+                                                  for doc_id, positions in postings.items()))
+                                    for term, postings in sorted(inverted_index.items())))
+
+    def __getitem__(self, term: str) -> Postings:
+        i = self.terms[term]
+        return Postings(self, self.term_starts[i], self.term_starts[i + 1])
+
+    def __contains__(self, term) -> bool:
+        return term in self.terms
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.terms)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @property
+    def doc_stats(self) -> diskindex.DocStats:
+        """The lengths and norms of the documents, in document number order."""
+        if self._doc_stats is None:
+            lengths = [0] * len(self.documents)
+            sq_sums = [0] * len(self.documents)
+            pos_starts = self.pos_starts
+            for i, doc in enumerate(self.docs):
+                count = pos_starts[i + 1] - pos_starts[i]
+                lengths[doc] += count
+                sq_sums[doc] += count * count
+            self._doc_stats = diskindex.DocStats(
+                [int(doc_id) for doc_id in self.documents], lengths, sq_sums)
+        return self._doc_stats
+
+    def doc_freq(self, term: str) -> int:
+        i = self.terms[term]
+        return self.term_starts[i + 1] - self.term_starts[i]
+
+    def doc_ids(self, term: str) -> List[int]:
+        """Returns the sorted ids of the documents of the term's postings."""
+        return self.term_freqs(term)[0]
+
+    def term_freqs(self, term: str) -> Tuple[List[int], List[int]]:
+        """Returns the sorted ids of the documents of the term's postings
+        and the number of positions in each."""
+        i = self.terms[term]
+        start, end = self.term_starts[i], self.term_starts[i + 1]
+        doc_ids = self.doc_stats.doc_ids
+        pos_starts = self.pos_starts
+        return ([doc_ids[doc] for doc in self.docs[start:end]],
+                [pos_starts[j + 1] - pos_starts[j] for j in range(start, end)])
+
+
+class PostingsBuilder:
+    """Accumulates the postings of documents one at a time, to be
+    compacted into a PostingsIndex by build()."""
+
+    def __init__(self):
+        self.documents = []  # Doc ids in the order they were added
+        self.numbers: Dict[str, int] = dict()  # Doc id to its index in `documents`
+        self.repeated = False  # Whether a doc id was added more than once
+        # For every term, the documents it appears in, the number of
+        # positions in each and the positions
+        self.terms: Dict[str, Tuple[array, array, array]] = dict()
+
+    def add(self, doc_id: str, terms: Iterable[str]) -> None:
+        """Adds a document with the given sequence of terms. Adding a doc id
+        again adds the positions to those of the document."""
+        doc = self.numbers.get(doc_id)
+        if doc is None:
+            doc = self.numbers[doc_id] = len(self.documents)
+            self.documents.append(doc_id)
+        else:
+            self.repeated = True
+        doc_positions = dict()
+        for pos, term in enumerate(terms):
+            try:
+                doc_positions[term].append(pos)
+            except KeyError:
+                doc_positions[term] = [pos]
+        for term, positions in doc_positions.items():
+            try:
+                docs, counts, term_positions = self.terms[term]
+            except KeyError:
+                docs, counts, term_positions = self.terms[term] = \
+                    array('I'), array('I'), array('I')
+            docs.append(doc)
+            counts.append(len(positions))
+            term_positions.extend(positions)
+
+    def build(self) -> PostingsIndex:
+        """Returns the index of the documents added, emptying the builder."""
+        order = sorted(range(len(self.documents)), key=lambda doc: int(self.documents[doc]))
+        documents = [self.documents[doc] for doc in order]
+        in_order = order == list(range(len(order)))
+        numbers = array('I', bytes(4 * len(order)))
+        for number, doc in enumerate(order):
+            numbers[doc] = number
+        repeated = self.repeated
+        self.documents = []
+        self.numbers = dict()
+        self.repeated = False
+        return _compact(documents, self._term_postings(numbers, in_order, repeated))
+
+    def _term_postings(self, numbers: array, in_order: bool, repeated: bool) \
+            -> Iterator[Tuple[str, List[Tuple[int, array]]]]:
+        for term in sorted(self.terms):
+            # Drop each term's arrays once compacted, to bound the peak memory
+            docs, counts, positions = self.terms.pop(term)
+            postings = []
+            start = 0
+            for doc, count in zip(docs, counts):
+                postings.append((numbers[doc], positions[start:start + count]))
+                start += count
+            if repeated:
+                # A document added more than once has a posting per add, whose
+                # positions are merged in order, as the writers gap-encode them
+                postings.sort(key=lambda posting: posting[0])
+                merged = []
+                for doc, doc_positions in postings:
+                    if merged and merged[-1][0] == doc:
+                        merged[-1] = (doc, array('I', sorted(merged[-1][1] + doc_positions)))
+                    else:
+                        merged.append((doc, doc_positions))
+                postings = merged
+            elif not in_order:
+                postings.sort(key=lambda posting: posting[0])
+            yield term, postings
+
+
+def _compact(documents: List[str],
+             term_postings: Iterable[Tuple[str, Iterable[Tuple[int, Iterable[int]]]]]) \
+        -> PostingsIndex:
+    """Lays out the sorted (document number, positions) postings of each
+    term, in sorted term order, as a PostingsIndex."""
+    terms = []
+    term_starts = array('Q', [0])
+    docs = array('I')
+    pos_starts = array('Q', [0])
+    positions = array('I')
+    for term, postings in term_postings:
+        terms.append(term)
+        for doc, doc_positions in postings:
+            docs.append(doc)
+            positions.extend(doc_positions)
+            pos_starts.append(len(positions))
+        term_starts.append(len(docs))
+    return PostingsIndex(documents, terms, term_starts, docs, pos_starts, positions)
@@ -0,0 +1,94 @@
+"""
+A cache of search results.
+
+Entries are evicted least recently used first once the cache holds more
+than `max_entries` results or more than `max_bytes` bytes of them, and
+expire `ttl` seconds after they were computed.
+"""
+
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, NamedTuple
+
+# Default bounds of a ResultCache
+RESULT_CACHE_SIZE = 10000
+RESULT_CACHE_BYTES = 64 << 20
+RESULT_CACHE_TTL = 600.0
+
+
+class _Entry(NamedTuple):
+    results: List
+    size: int  # Estimated bytes held by the results
+    expires: float
+    cost: float  # Seconds taken to compute the results
+
+
+def sizeof(results: List) -> int:
+    """Estimates the bytes held by a list of doc ids, or of (doc id, score) pairs."""
+    size = sys.getsizeof(results)
+    for result in results:
+        size += sys.getsizeof(result)
+        if isinstance(result, tuple):
+            size += sum(map(sys.getsizeof, result))
+    return size
+
+
+class ResultCache:
+    """A bounded cache of query results, with least recently used
+    eviction and expiry."""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE,
+                 max_bytes: int = RESULT_CACHE_BYTES, ttl: float = RESULT_CACHE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: Dict[Hashable, _Entry] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0  # Seconds of computation saved by hits
+
+    def get(self, key: Hashable, compute: Callable[[], List]) -> List:
+        """Returns the cached results of a key, or computes and caches them."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry.expires > self.clock():
+                self.hits += 1
+                self.saved += entry.cost
+                self.entries.move_to_end(key)
+                return list(entry.results)
+            self._remove(key)
+        self.misses += 1
+        start = self.clock()
+        results = compute()
+        self.put(key, results, self.clock() - start)
+        return results
+
+    def put(self, key: Hashable, results: List, cost: float = 0.0) -> None:
+        """Caches the results of a key, which took `cost` seconds to compute."""
+        if key in self.entries:
+            self._remove(key)
+        entry = _Entry(list(results), sizeof(results), self.clock() + self.ttl, cost)
+        if entry.size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.bytes += entry.size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key: Hashable) -> None:
+        self.bytes -= self.entries.pop(key).size
+
+    def clear(self) -> None:
+        """Drops every entry, keeping the statistics."""
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'bytes': self.bytes, 'hits': self.hits,
+                'misses': self.misses, 'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'saved_secs': self.saved}
@@ -0,0 +1,335 @@
+"""
+Incrementally updated indexes made of segments.
+
+A SegmentedIndex lives in a directory of immutable binary segments (a
+`diskindex` index and title store each), listed in a manifest:
+
+    segments.json: {"next": <number of the next segment>,
+                    "segments": [{"name": "seg_<n>", "deleted": [<doc ids>]}]}
+
+New and updated pages are first held in a small in-memory segment. It is
+written out as a new on-disk segment once it holds `flush_pages` pages,
+or on commit(). Deleting or updating a page never rewrites a segment: its
+doc id is recorded as deleted from the segments holding it (a tombstone),
+and lookups skip it. A live doc id is therefore in exactly one segment.
+
+Segments are compacted by a tiered merge policy. A segment's tier is the
+number of times `merge_factor` fits between the flush size and its size,
+and once `merge_factor` segments share a tier they are merged into one
+segment of the next tier, leaving out their deleted documents. Merges run
+on a background thread, and the merged segment replaces its sources
+atomically, with the deletions made during the merge carried over.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, Set, Tuple
+
+import diskindex
+from postings import PostingsBuilder, PostingsIndex
+
+# Number of pages held in memory before they are written out as a segment
+FLUSH_PAGES = 1000
+# Number of segments of a tier merged together
+MERGE_FACTOR = 10
+
+MANIFEST = 'segments.json'
+
+
+class Segment(NamedTuple):
+    name: str
+    index: diskindex.MappedIndex
+    titles: diskindex.MappedTitles
+    deleted: Set[int]  # The doc ids deleted from the segment since it was written
+
+
+class SegmentedIndex(Mapping):
+    """An inverted index of on-disk segments and an in-memory segment,
+    which pages can be added to and deleted from."""
+
+    def __init__(self, directory: str, flush_pages: int = FLUSH_PAGES,
+                 merge_factor: int = MERGE_FACTOR, background_merges: bool = True):
+        self.directory = directory
+        self.flush_pages = flush_pages
+        self.merge_factor = merge_factor
+        self.pages: Dict[str, Tuple[str, List[str]]] = dict()  # Doc id to title and terms
+        self._memory = None  # The PostingsIndex of `pages`, built on lookup
+        self._doc_stats = None
+        # Guards changes to the list of segments and their deletions
+        self._lock = threading.RLock()
+        self._merger = ThreadPoolExecutor(1) if background_merges else None
+        self._merges: List[Future] = []
+        self._merging: Set[str] = set()  # Names of the segments being merged
+
+        os.makedirs(directory, exist_ok=True)
+        manifest = {'next': 0, 'segments': []}
+        if os.path.exists(self._path(MANIFEST)):
+            with open(self._path(MANIFEST)) as f:
+                manifest = json.load(f)
+        self._next = manifest['next']
+        self.segments: Tuple[Segment, ...] = tuple(
+            self._open_segment(entry['name'], set(entry['deleted']))
+            for entry in manifest['segments'])
+        self._remove_unlisted_files()
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def _open_segment(self, name: str, deleted: Set[int]) -> Segment:
+        return Segment(name, diskindex.MappedIndex(self._path(name + '.index')),
+                       diskindex.MappedTitles(self._path(name + '.titles')), deleted)
+
+    def _remove_unlisted_files(self) -> None:
+        """Removes the files of segments left out of the manifest, such as
+        those of a merge interrupted by a crash."""
+        names = {segment.name for segment in self.segments}
+        for filename in os.listdir(self.directory):
+            name, ext = os.path.splitext(filename)
+            if ext in ('.index', '.titles') and name not in names:
+                os.remove(self._path(filename))
+
+    def _write_manifest(self) -> None:
+        with self._lock:
+            manifest = {'next': self._next, 'segments': [
+                {'name': segment.name, 'deleted': sorted(segment.deleted)}
+                for segment in self.segments]}
+            tmp_path = self._path(MANIFEST + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self._path(MANIFEST))
+
+    def _new_segment_name(self) -> str:
+        with self._lock:
+            self._next += 1
+            return 'seg_{}'.format(self._next - 1)
+
+    # Updates
+
+    def add(self, doc_id: str, title: str, terms: Iterable[str]) -> None:
+        """Adds a page, replacing any page with the same doc id."""
+        self._delete_from_segments(doc_id)
+        self.pages[doc_id] = (title, list(terms))
+        self._changed()
+        if len(self.pages) >= self.flush_pages:
+            self.flush()
+
+    def delete(self, doc_id: str) -> None:
+        """Deletes a page, if it is in the index."""
+        self._delete_from_segments(doc_id)
+        self.pages.pop(doc_id, None)
+        self._changed()
+
+    def _delete_from_segments(self, doc_id: str) -> None:
+        with self._lock:
+            for segment in self.segments:
+                if doc_id in segment.titles:
+                    segment.deleted.add(int(doc_id))
+
+    def _changed(self) -> None:
+        self._memory = None
+        self._doc_stats = None
+
+    def flush(self) -> None:
+        """Writes the in-memory segment out as an on-disk segment."""
+        if not self.pages:
+            return
+        name = self._new_segment_name()
+        memory = self.memory
+        diskindex.write_index(self._path(name + '.index'), memory, memory.doc_stats)
+        diskindex.write_titles(self._path(name + '.titles'),
+                               {doc_id: title for doc_id, (title, _) in self.pages.items()})
+        with self._lock:
+            self.segments += (self._open_segment(name, set()),)
+            self.pages = dict()
+            self._memory = None
+            self._write_manifest()
+        self.maybe_merge()
+
+    def commit(self) -> None:
+        """Flushes the in-memory segment and records the deletions, so
+        that every change so far survives a restart."""
+        self.flush()
+        self._write_manifest()
+
+    # Merges
+
+    def _tier(self, segment: Segment) -> int:
+        # In integers, as a float log puts exact powers of the merge factor a tier low
+        size = (len(segment.titles) - len(segment.deleted)) // self.flush_pages
+        tier = 0
+        while size >= self.merge_factor:
+            size //= self.merge_factor
+            tier += 1
+        return tier
+
+    def maybe_merge(self) -> None:
+        """Merges the segments of the lowest tier holding at least
+        `merge_factor` segments not already being merged, in the background
+        unless background merges are disabled."""
+        with self._lock:
+            tiers = dict()
+            for segment in self.segments:
+                if segment.name not in self._merging:
+                    tiers.setdefault(self._tier(segment), []).append(segment)
+            full = [tier for tier, segments in tiers.items() if len(segments) >= self.merge_factor]
+            if not full:
+                return
+            sources = tiers[min(full)][:self.merge_factor]
+            self._merging.update(segment.name for segment in sources)
+            # The deletions as of now; later ones are carried over afterwards
+            snapshot = [(segment, frozenset(segment.deleted)) for segment in sources]
+        if self._merger is None:
+            self._merge(snapshot)
+        else:
+            self._merges.append(self._merger.submit(self._merge, snapshot))
+
+    def _merge(self, snapshot: List[Tuple[Segment, frozenset]]) -> None:
+        name = self._new_segment_name()
+        sources = [segment for segment, _ in snapshot]
+        deleted = [segment_deleted for _, segment_deleted in snapshot]
+        diskindex.merge_indexes(self._path(name + '.index'),
+                                [self._path(s.name + '.index') for s in sources], deleted)
+        diskindex.merge_titles(self._path(name + '.titles'),
+                               [self._path(s.name + '.titles') for s in sources], deleted)
+        with self._lock:
+            merged = self._open_segment(name, set())
+            for segment, segment_deleted in snapshot:
+                merged.deleted.update(segment.deleted - segment_deleted)
+            names = {segment.name for segment in sources}
+            # The merged segment takes the place of the first of its sources
+            position = min(i for i, segment in enumerate(self.segments) if segment.name in names)
+            segments = [segment for segment in self.segments if segment.name not in names]
+            segments.insert(position, merged)
+            self.segments = tuple(segments)
+            self._merging -= names
+            self._write_manifest()
+        for segment in sources:
+            os.remove(self._path(segment.name + '.index'))
+            os.remove(self._path(segment.name + '.titles'))
+        self.maybe_merge()
+
+    def wait_for_merges(self) -> None:
+        """Blocks until the merges started so far, and those they trigger, are done."""
+        while self._merges:
+            self._merges.pop(0).result()
+
+    def close(self) -> None:
+        """Commits, and waits for the background merges to finish."""
+        self.commit()
+        self.wait_for_merges()
+        if self._merger is not None:
+            self._merger.shutdown()
+
+    # Lookups
+
+    @property
+    def memory(self) -> PostingsIndex:
+        """The postings of the in-memory segment."""
+        if self._memory is None:
+            builder = PostingsBuilder()
+            for doc_id, (_, terms) in self.pages.items():
+                builder.add(doc_id, terms)
+            self._memory = builder.build()
+        return self._memory
+
+    def _live(self) -> List[Tuple[Mapping, Set[int]]]:
+        """Returns the index of every segment and the doc ids deleted
+        from it, the in-memory segment last."""
+        live = [(segment.index, segment.deleted) for segment in self.segments]
+        if self.pages:
+            live.append((self.memory, set()))
+        return live
+
+    @property
+    def doc_stats(self) -> diskindex.DocStats:
+        """The lengths and norms of the live documents."""
+        if self._doc_stats is None:
+            live = self._live()
+            self._doc_stats = diskindex.DocStats.merge(
+                [index.doc_stats for index, _ in live], [deleted for _, deleted in live])
+        return self._doc_stats
+
+    def doc_freq(self, term: str) -> int:
+        return len(self.term_freqs(term)[0])
+
+    def doc_ids(self, term: str) -> List[int]:
+        return self.term_freqs(term)[0]
+
+    def term_freqs(self, term: str) -> Tuple[List[int], List[int]]:
+        """Returns the sorted ids of the live documents of the term's
+        postings and the number of positions in each."""
+        postings = []
+        for index, deleted in self._live():
+            if term in index:
+                doc_ids, term_freqs = index.term_freqs(term)
+                postings.append([(doc_id, term_freq) for doc_id, term_freq
+                                 in zip(doc_ids, term_freqs) if doc_id not in deleted])
+        merged = postings[0] if len(postings) == 1 else list(heapq.merge(*postings))
+        return [doc_id for doc_id, _ in merged], [term_freq for _, term_freq in merged]
+
+    def term_bounds(self, term: str) -> diskindex.TermBounds:
+        """Returns bounds of the weight of the term, from the bounds of
+        each segment. They bound deleted documents too, so are not tight."""
+        bounds = []
+        for index, _ in self._live():
+            if term in index:
+                if isinstance(index, diskindex.MappedIndex):
+                    bounds.append(index.term_bounds(term))
+                else:
+                    bounds.append(index.doc_stats.term_bounds(index[term]))
+        return diskindex.TermBounds(max(b.max_tf_norm for b in bounds),
+                                    max(b.max_tf for b in bounds),
+                                    min(b.min_length for b in bounds))
+
+    def __getitem__(self, term: str) -> Dict[str, List[int]]:
+        postings = dict()
+        found = False
+        for index, deleted in self._live():
+            if term in index:
+                found = True
+                for doc_id, positions in index[term].items():
+                    if int(doc_id) not in deleted:
+                        postings[doc_id] = positions
+        if not found:
+            raise KeyError(term)
+        return postings
+
+    def __contains__(self, term) -> bool:
+        return any(term in index for index, _ in self._live())
+
+    def __iter__(self) -> Iterator[str]:
+        terms = heapq.merge(*[sorted(index) for index, _ in self._live()])
+        return (term for term, _ in itertools.groupby(terms))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class SegmentedTitles(Mapping):
+    """The titles of the live documents of a SegmentedIndex."""
+
+    def __init__(self, index: SegmentedIndex):
+        self.index = index
+
+    def __getitem__(self, doc_id: str) -> str:
+        if doc_id in self.index.pages:
+            return self.index.pages[doc_id][0]
+        for segment in self.index.segments:
+            if doc_id in segment.titles and int(doc_id) not in segment.deleted:
+                return segment.titles[doc_id]
+        raise KeyError(doc_id)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.index.pages
+        for segment in self.index.segments:
+            for doc_id in segment.titles:
+                if int(doc_id) not in segment.deleted:
+                    yield doc_id
+
+    def __len__(self) -> int:
+        return len(self.index.pages) + sum(len(segment.titles) - len(segment.deleted)
+                                           for segment in self.index.segments)
@@ -0,0 +1,204 @@
+"""
+An asyncio query server for `core.Index`.
+
+Clients send one JSON request per line, and get one JSON response per
+line, in the order searches complete:
+
+    {"id": 1, "query": "first 2001", "k": 10}
+    {"id": 1, "results": ["1", "0", "3"]}
+
+"k" is optional; without it, every match is returned sorted by doc id.
+Failed requests get {"id": ..., "error": "..."} instead of results.
+
+Searches run on a pool of worker processes, each of which reads the
+index once when it starts (binary indexes are memory-mapped, so the
+workers share their pages). Requests beyond `max_pending` in flight
+are rejected at once with the error "overloaded", rather than queued.
+
+Serve an index on a TCP port or a Unix socket, for example:
+
+    python server.py index.bin titles.bin --port 8158
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List
+
+from core import Index
+
+# Number of requests which may be in flight before new ones are rejected
+MAX_PENDING = 256
+# Longest request line accepted, in bytes
+MAX_LINE = 1 << 16
+
+OVERLOADED = 'overloaded'
+
+# The index searched by each worker process
+_worker_index = None
+
+
+def _init_worker(index_filepath: str, title_filepath: str, stopwords: List[str]) -> None:
+    global _worker_index  # pylint: disable=global-statement
+    # Ctrl-C reaches the whole process group; let the server shut workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_index = Index(stopwords)
+    _worker_index.read(index_filepath, title_filepath)
+
+
+def _search(query_string: str, k: int = None) -> List[str]:
+    return _worker_index.search(query_string, k)
+
+
+class QueryServer:
+    """Serves searches of an index over line-delimited JSON."""
+
+    def __init__(self, index_filepath: str, title_filepath: str, stopwords: List[str] = (),
+                 workers: int = None, max_pending: int = MAX_PENDING):
+        self.executor: Executor = ProcessPoolExecutor(
+            workers or os.cpu_count(), initializer=_init_worker,
+            initargs=(index_filepath, title_filepath, list(stopwords)))
+        self.max_pending = max_pending
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+        self.server = None
+        self.clients = set()  # The task serving each connection
+
+    def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.ensure_future(self._serve_client(reader, writer))
+        self.clients.add(task)
+        task.add_done_callback(self.clients.discard)
+
+    async def start(self, host: str = None, port: int = None, path: str = None) -> None:
+        """Starts listening on a Unix socket if `path` is given, on a TCP
+        port otherwise."""
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._accept, path, limit=MAX_LINE)
+        else:
+            self.server = await asyncio.start_server(self._accept, host, port, limit=MAX_LINE)
+
+    async def close(self) -> None:
+        """Stops listening, drops the connections and shuts the worker
+        pool down."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in self.clients:
+            task.cancel()
+        if self.clients:
+            await asyncio.wait(self.clients)
+        self.executor.shutdown()
+
+    async def _serve_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+        # Requests of a client are served concurrently, so responses are
+        # written whole under a lock
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # A line longer than MAX_LINE
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(self._serve_request(line, writer, lock))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _serve_request(self, line: bytes, writer: asyncio.StreamWriter,
+                             lock: asyncio.Lock) -> None:
+        response = await self.handle(line)
+        async with lock:
+            try:
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                pass  # The client is gone
+
+    async def handle(self, line: bytes) -> Dict:
+        """Returns the response to a request line."""
+        request = None
+        try:
+            request = json.loads(line.decode('utf-8'))
+            query_string = request['query']
+            k = request.get('k')
+            # JSON true and false are ints to isinstance, but not valid values of k
+            valid_k = k is None or (isinstance(k, int) and not isinstance(k, bool))
+            if not isinstance(query_string, str) or not valid_k:
+                raise TypeError('"query" must be a string and "k" an integer')
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            request_id = request.get('id') if isinstance(request, dict) else None
+            return {'id': request_id, 'error': 'bad request: {}'.format(e)}
+        response = {'id': request.get('id')}
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            response['error'] = OVERLOADED
+            return response
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            response['results'] = await loop.run_in_executor(
+                self.executor, _search, query_string, k)
+            self.served += 1
+        except Exception as e:  # pylint: disable=broad-except
+            # Malformed queries fail in the parser or QueryFactory
+            response['error'] = '{}: {}'.format(type(e).__name__, e)
+        finally:
+            self.pending -= 1
+        return response
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('index', help='index file written by Index.write')
+    parser.add_argument('titles', help='title file written by Index.write')
+    parser.add_argument('--stopwords', help='file of stopwords, one per line')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8158)
+    parser.add_argument('--unix', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, help='number of search processes')
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                        help='requests in flight beyond which new ones are rejected')
+    args = parser.parse_args(argv)
+
+    stopwords = []
+    if args.stopwords:
+        with open(args.stopwords) as f:
+            stopwords = [line.rstrip('\n') for line in f]
+    server = QueryServer(args.index, args.titles, stopwords, args.workers, args.max_pending)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(server.start(args.host, args.port, args.unix))
+    try:
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    except NotImplementedError:  # Not on Windows
+        pass
+    print('Serving on {}'.format(args.unix or '{}:{}'.format(args.host, args.port)))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.close())
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
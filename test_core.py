@@ -1,8 +1,19 @@
+import asyncio
+import io
+import json
 from typing import List
 
 import pytest
 
-from core import Index
+import diskindex
+import intcodecs
+from core import Analyzer, BM25, Index, Scorer, TfIdf, intersect, union
+from postings import PostingsBuilder, PostingsIndex
+from loadgen import generate_load
+from querycache import ResultCache
+from segments import Segment, SegmentedIndex
+from server import QueryServer
+from wildcard import PermutermIndex
 
 
 @pytest.fixture
@@ -26,3 +37,343 @@ def test_free_text_query(small_index):
 def test_boolean_query(small_index):
     assert small_index.search('2001 OR first') == ['0', '1', '2', '3']
     assert small_index.search('2001 AND first') == []
+
+
+def test_nested_boolean_query(small_index):
+    assert small_index.search('united AND (2001 OR flight)') == ['0', '2']
+    assert small_index.search('(first AND moon) OR encyclopedia') == ['1', '3']
+    assert small_index.search('first AND states AND powered') == ['2']
+
+
+def test_streaming_parse_matches_any_chunk_size(small_index):
+    for chunk_size in (1, 5, 64):
+        index = Index([])
+        index.parse('data/part1/small.dat', chunk_size)
+        assert index.title_index == small_index.title_index
+        assert index.inverted_index == small_index.inverted_index
+
+
+def test_iter_pages_handles_split_tags():
+    collection = '<collection><page>a</page>\n<page>b</page><page>c'
+    pages = list(Index._iter_pages(io.StringIO(collection), 3))
+    assert pages == ['<page>a', '<page>b', '<page>c']
+
+
+def test_compact_postings(small_index, tmp_path):
+    postings = small_index['2001']
+    assert isinstance(small_index.inverted_index, PostingsIndex)
+    assert sorted(postings) == ['0', '3'] and len(postings) == 2
+    assert '1' not in postings and 'missing' not in postings
+    assert postings == {doc_id: positions for doc_id, positions in postings.items()}
+    assert small_index.term_freqs('first') == ([1, 2], [2, 1])
+
+    index_fp, title_fp = str(tmp_path / 'index.json'), str(tmp_path / 'titles.json')
+    small_index.write(index_fp, title_fp)
+    index = Index([])
+    index.read(index_fp, title_fp)
+    assert isinstance(index.inverted_index, PostingsIndex)
+    assert index.inverted_index == small_index.inverted_index
+    assert index.doc_stats.lengths == small_index.doc_stats.lengths
+
+
+def test_postings_builder_repeated_doc(tmp_path):
+    builder = PostingsBuilder()
+    builder.add('7', ['a', 'b', 'a'])
+    builder.add('3', ['b'])
+    builder.add('7', ['c', 'a'])
+    index = builder.build()
+    assert index.documents == ['3', '7']
+    assert dict(index['a']) == {'7': [0, 1, 2]}
+    assert dict(index['b']) == {'3': [0], '7': [1]}
+    assert index.term_freqs('a') == ([7], [3])
+    assert index.doc_stats.lengths == [1, 5]
+
+    index_fp = str(tmp_path / 'index.bin')
+    diskindex.write_index(index_fp, index, index.doc_stats)
+    mapped = diskindex.MappedIndex(index_fp)
+    assert {term: mapped[term] for term in mapped} == {term: dict(index[term]) for term in index}
+
+
+def test_result_cache(small_index):
+    cache = small_index.result_cache
+    assert small_index.search('first 2001') == ['0', '1', '2', '3']
+    # The same terms in another order and form hit the cache
+    assert small_index.search('2001  First') == ['0', '1', '2', '3']
+    assert small_index.search('united AND (2001 OR flight)') == ['0', '2']
+    assert small_index.search('(flights OR 2001) AND United') == ['0', '2']
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 2
+    # Different query types or k do not
+    assert small_index.search('"first 2001"') == []
+    assert small_index.search('first 2001', k=1) == ['1']
+    assert cache.stats()['misses'] == 4
+
+    results = small_index.search('2001')
+    results.append('5')
+    assert small_index.search('2001') == ['0', '3']
+    small_index.parse('data/part1/small.dat')
+    assert cache.stats()['size'] == 0
+
+
+def test_search_many(small_index):
+    queries = ['first 2001', '2001 First', '"first powered"', 'united AND (2001 OR flight)',
+               'fir*', 'first 2001']
+    for k in (None, 2):
+        expected = [small_index.search(query, k) for query in queries]
+        small_index.result_cache.clear()
+        assert small_index.search_many(queries, k) == expected
+        small_index.result_cache.clear()
+        assert small_index.search_many(queries, k, workers=2) == expected
+
+
+def test_result_cache_eviction():
+    now = [0.0]
+    cache = ResultCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    for key in ('a', 'b', 'a', 'c'):
+        cache.get(key, lambda: [key])
+    assert list(cache.entries) == ['a', 'c'] and cache.hits == 1
+    now[0] = 10.0
+    assert cache.get('a', lambda: ['new']) == ['new'] and cache.misses == 4
+
+    cache = ResultCache(max_bytes=1000)
+    cache.get('small', lambda: ['0'])
+    cache.get('large', lambda: [str(i) for i in range(100)])
+    assert list(cache.entries) == ['small'] and cache.bytes <= 1000
+
+
+def test_binary_index_round_trip(small_index, tmp_path):
+    index_fp, title_fp = str(tmp_path / 'index.bin'), str(tmp_path / 'titles.bin')
+    small_index.write(index_fp, title_fp, binary=True)
+    index = Index([])
+    index.read(index_fp, title_fp)
+    assert dict(index.inverted_index.items()) == small_index.inverted_index
+    assert dict(index.title_index.items()) == small_index.title_index
+    assert index['2001'] == small_index['2001']
+    assert index['missing'] == {}
+    assert index.search('2001 OR first') == ['0', '1', '2', '3']
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+@pytest.mark.parametrize('name', sorted(intcodecs.CODECS))
+def test_codecs(name, use_numpy, monkeypatch):
+    if not use_numpy:
+        monkeypatch.setattr(intcodecs, 'numpy', None)
+    elif intcodecs.numpy is None:
+        pytest.skip('NumPy is not installed')
+    codec = intcodecs.get_codec(name)
+    values = [1] * 300 + [0, 5, 2 ** 40, 7] + list(range(200)) + [3] * 5
+    doc_ids = sorted(set(i * i % 100003 for i in range(1000)))
+    for n in (0, 1, 127, 128, 129, len(values)):
+        assert codec.decode(codec.encode(values[:n]), n) == values[:n]
+        assert codec.decode_sorted(codec.encode_sorted(doc_ids[:n]), n) == doc_ids[:n]
+
+
+@pytest.mark.parametrize('codec', sorted(intcodecs.CODECS))
+def test_binary_index_codecs(small_index, tmp_path, codec):
+    index_fp, title_fp = str(tmp_path / 'index.bin'), str(tmp_path / 'titles.bin')
+    small_index.write(index_fp, title_fp, binary=True, codec=codec)
+    index = Index([])
+    index.read(index_fp, title_fp)
+    assert index.inverted_index.codec.name == codec
+    assert dict(index.inverted_index.items()) == small_index.inverted_index
+    assert index.term_freqs('first') == small_index.term_freqs('first')
+    assert index.search('first united 2001', k=10) == small_index.search('first united 2001', k=10)
+
+
+@pytest.mark.parametrize('codec', sorted(intcodecs.CODECS))
+def test_blocked_postings_lookup(codec):
+    codec = intcodecs.get_codec(codec)
+    postings = {str(3 * i + 1): list(range(i % 5 + 1)) for i in range(1000)}
+    doc_stats = diskindex.DocStats(sorted(map(int, postings)), [5] * 1000, [1] * 1000)
+    block = diskindex.encode_postings(postings, doc_stats.term_bounds(postings), codec)
+    assert diskindex.decode_postings(block, codec=codec) == postings
+    blocked = diskindex.BlockedPostings(block, codec)
+    assert blocked.num_blocks == 8
+    # Docs 382 and 385 end the first block and start the second
+    doc_ids = [0, 1, 4, 5, 382, 383, 385, 2998, 3000]
+    assert blocked.lookup(doc_ids) == [None, 1, 2, None, 3, None, 4, 5, None]
+
+
+def test_parallel_build_matches_serial(small_index, tmp_path):
+    serial_fps = str(tmp_path / 'serial.index'), str(tmp_path / 'serial.titles')
+    small_index.write(*serial_fps, binary=True)
+    parallel_fps = str(tmp_path / 'parallel.index'), str(tmp_path / 'parallel.titles')
+    index = Index([])
+    index.build('data/part1/small.dat', *parallel_fps, workers=2, segment_pages=1)
+    for serial_fp, parallel_fp in zip(serial_fps, parallel_fps):
+        with open(serial_fp, 'rb') as f1, open(parallel_fp, 'rb') as f2:
+            assert f1.read() == f2.read()
+    assert index.search('2001') == ['0', '3']
+
+
+def test_parallel_build_merges_repeated_doc_ids(tmp_path):
+    with open('data/part1/small.dat') as f:
+        collection = f.read().replace('<id>2</id>', '<id>0</id>')
+    collection_fp = str(tmp_path / 'repeated.dat')
+    with open(collection_fp, 'w') as f:
+        f.write(collection)
+    serial = Index([])
+    serial.parse(collection_fp)
+    serial_fps = str(tmp_path / 'serial.index'), str(tmp_path / 'serial.titles')
+    serial.write(*serial_fps, binary=True)
+    parallel_fps = str(tmp_path / 'parallel.index'), str(tmp_path / 'parallel.titles')
+    index = Index([])
+    index.build(collection_fp, *parallel_fps, workers=2, segment_pages=1)
+    for serial_fp, parallel_fp in zip(serial_fps, parallel_fps):
+        with open(serial_fp, 'rb') as f1, open(parallel_fp, 'rb') as f2:
+            assert f1.read() == f2.read()
+    assert index.search('flight') == ['0']
+    assert index.title_index['0'] == 'Wright brothers'
+
+
+def test_segment_tiers(tmp_path):
+    index = SegmentedIndex(str(tmp_path), flush_pages=10, merge_factor=10)
+    tiers = {size: index._tier(Segment('seg', None, [''] * size, set()))
+             for size in (0, 9, 10, 99, 100, 999, 1000)}
+    assert tiers == {0: 0, 9: 0, 10: 0, 99: 0, 100: 1, 999: 1, 1000: 2}
+    index.close()
+
+
+def test_segmented_index_updates(small_index, tmp_path):
+    index = Index([])
+    index.open_segments(str(tmp_path), flush_pages=1, merge_factor=2)
+    index.update('data/part1/small.dat')
+    index.inverted_index.wait_for_merges()
+    assert len(index.inverted_index.segments) < 4
+    assert dict(index.title_index.items()) == small_index.title_index
+    for query in ('2001', 'first', '2001 OR first', '"first powered"'):
+        assert index.search(query) == small_index.search(query)
+    assert index.search('first united 2001', k=10) == small_index.search('first united 2001', k=10)
+
+    index.delete(['3'])
+    assert index.search('2001') == ['0']
+    assert '3' not in index.title_index
+    index.update('data/part1/small.dat')  # Adds page 3 back, and replaces the others
+    index.inverted_index.close()
+    reopened = Index([])
+    reopened.open_segments(str(tmp_path), flush_pages=1, merge_factor=2)
+    assert reopened.search('2001') == ['0', '3']
+    assert reopened.search('first united 2001', k=10) == \
+        small_index.search('first united 2001', k=10)
+    reopened.inverted_index.close()
+
+
+def test_stem_cache(tmp_path):
+    analyzer = Analyzer(stem_cache_size=2)
+    assert list(analyzer.get_terms('running runs running')) == ['run', 'run', 'run']
+    assert analyzer.stem_cache.stats()['hits'] == 1
+    assert analyzer.stem_cache.stats()['misses'] == 2
+    list(analyzer.get_terms('ponies'))
+    assert list(analyzer.stem_cache.stems) == ['running', 'ponies']
+
+    stems_fp = str(tmp_path / 'stems.json')
+    analyzer.stem_cache.write(stems_fp)
+    warm = Analyzer()
+    warm.stem_cache.read(stems_fp)
+    assert list(warm.get_terms('ponies')) == ['poni']
+    assert warm.stem_cache.stats()['misses'] == 0
+
+
+def test_get_terms_many_matches_get_terms():
+    analyzer = Analyzer(['the', 'of'])
+    streams = ['The United States of America', '', 'running, RUNS; the 2001 runner']
+    assert analyzer.get_terms_many(streams) == [list(analyzer.get_terms(s)) for s in streams]
+
+
+def test_phrase_query(small_index):
+    assert small_index.search('"united states"') == ['0', '1', '2']
+    assert small_index.search('"states united"') == []
+    assert small_index.search('"the first powered flight"') == ['2']
+    assert small_index.search('"first"') == ['1', '2']
+
+
+def test_intersect():
+    assert intersect([1, 4, 9], [2, 3, 5, 10], 1) == [1, 4, 9]
+    assert intersect([1, 4, 9], [3, 5], 1) == [4]
+    evens = list(range(0, 1000, 2))
+    assert intersect([2, 3, 500, 998], evens, 2) == [2, 500]
+    assert intersect(evens, [4, 7, 501], -1) == [8, 502]
+    assert union([[1, 3], [2, 3, 8], []]) == [1, 2, 3, 8]
+
+
+def test_permuterm_index():
+    permuterms = PermutermIndex(['bar', 'barn', 'abba', 'ab', 'cab', 'baba'])
+    assert permuterms.match('ba*') == ['baba', 'bar', 'barn']
+    assert permuterms.match('*ba') == ['abba', 'baba']
+    assert permuterms.match('ab*ba') == ['abba']
+    assert permuterms.match('*a*') == ['ab', 'abba', 'baba', 'bar', 'barn', 'cab']
+    assert permuterms.match('b*a*a') == ['baba']
+    assert permuterms.match('*r*n') == ['barn']
+    assert permuterms.match('ab') == ['ab']
+    assert permuterms.match('a') == []
+
+
+def test_wildcard_query(small_index):
+    assert small_index.search('encyclo*') == ['3']
+    assert small_index.search('*ight') == ['2']
+    assert small_index.search('k*r*k') == ['0']
+    assert small_index.search('fir* AND *oon') == ['1']
+
+
+def test_ranked_search(small_index):
+    # 'first' appears twice in doc 1, once in doc 2 which has as many terms
+    assert small_index.search('first', k=10) == ['1', '2']
+    assert small_index.search('first 2001', k=1) == ['1']
+    assert Scorer(small_index, BM25()).search('first', k=1)[0][0] == '1'
+    assert small_index.search('united AND first', k=10) == ['1', '2']
+    assert small_index.search('"first powered"', k=10) == ['2']
+    assert small_index.search('missing', k=10) == []
+
+
+def test_max_score_pruning(small_index):
+    queries = ['first united 2001', 'united states first', 'kubrick 2001 encyclopedia flight']
+    for model in (TfIdf(), BM25()):
+        pruned, exhaustive = Scorer(small_index, model), Scorer(small_index, model, prune=False)
+        for query in queries:
+            for k in (1, 2, 10):
+                assert pruned.search(query, k) == exhaustive.search(query, k)
+        assert pruned.evaluated <= exhaustive.evaluated
+
+
+def test_ranked_search_binary_index(small_index, tmp_path):
+    index_fp, title_fp = str(tmp_path / 'index.bin'), str(tmp_path / 'titles.bin')
+    small_index.write(index_fp, title_fp, binary=True)
+    index = Index([])
+    index.read(index_fp, title_fp)
+    for model in (TfIdf(), BM25()):
+        assert Scorer(index, model).search('first united 2001') == \
+            Scorer(small_index, model).search('first united 2001')
+
+
+def test_query_server(small_index, tmp_path):
+    index_fp, title_fp = str(tmp_path / 'index.bin'), str(tmp_path / 'titles.bin')
+    small_index.write(index_fp, title_fp, binary=True)
+    path = str(tmp_path / 'server.sock')
+
+    async def session():
+        server = QueryServer(index_fp, title_fp, workers=1)
+        await server.start(path=path)
+        try:
+            reader, writer = await asyncio.open_unix_connection(path)
+            for request in ({'id': 1, 'query': '2001 OR first'}, {'id': 2, 'query': 'first', 'k': 1},
+                            {'id': 3, 'query': ''}, {'query': 2},
+                            {'id': 4, 'query': 'first', 'k': '1'},
+                            {'id': 5, 'query': 'first', 'k': True}):
+                writer.write(json.dumps(request).encode() + b'\n')
+            responses = [json.loads(await reader.readline()) for _ in range(6)]
+            writer.close()
+            report = await generate_load(['first 2001', '"first powered"'], 20, 4, path=path)
+        finally:
+            await server.close()
+        return sorted(responses, key=lambda r: str(r['id'])), report
+
+    loop = asyncio.new_event_loop()
+    try:
+        responses, report = loop.run_until_complete(session())
+    finally:
+        loop.close()
+    assert responses[0] == {'id': 1, 'results': ['0', '1', '2', '3']}
+    assert responses[1] == {'id': 2, 'results': ['1']}
+    assert 'error' in responses[2] and 'error' in responses[5]
+    for response_id, response in zip((4, 5), responses[3:5]):
+        assert response['id'] == response_id and response['error'].startswith('bad request')
+    assert report.requests == 20 and report.errors == 0 and report.rejected == 0
@@ -0,0 +1,82 @@
+"""
+Wildcard term lookup with a permuterm index.
+
+A permuterm index holds every rotation of every term followed by an
+end-of-term marker '$' ("bar" gives "bar$", "ar$b", "r$ba" and "$bar").
+A pattern with a single wildcard, "a*b", matches the terms with a
+rotation starting with "b$a", and so is answered by a range scan of the
+sorted rotations. Patterns with several wildcards scan the range of
+their most selective part and check the candidates against the pattern.
+
+Rather than storing the rotations themselves, which would multiply the
+size of the dictionary by the average term length, the index is a
+sorted array of (term id, rotation offset) pairs.
+"""
+
+import re
+from array import array
+from typing import Iterable, List
+
+END = '$'
+
+
+class PermutermIndex:
+    """Matches wildcard patterns against a fixed set of terms"""
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms = sorted(terms)
+        entries = sorted(((term_id, offset)
+                          for term_id, term in enumerate(self.terms)
+                          for offset in range(len(term) + 1)),
+                         key=lambda entry: self._rotation(*entry))
+        self.term_ids = array('I', (term_id for term_id, _ in entries))
+        self.offsets = array('I', (offset for _, offset in entries))
+
+    def _rotation(self, term_id: int, offset: int) -> str:
+        term = self.terms[term_id] + END
+        return term[offset:] + term[:offset]
+
+    def _lower_bound(self, key: str) -> int:
+        """Returns the index of the first rotation not less than `key`."""
+        lo, hi = 0, len(self.term_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._rotation(self.term_ids[mid], self.offsets[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _scan(self, prefix: str) -> Iterable[int]:
+        """Returns the ids of the terms with a rotation starting with the
+        non-empty `prefix`."""
+        # Every rotation starting with the prefix sorts before its successor
+        successor = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self.term_ids[self._lower_bound(prefix):self._lower_bound(successor)]
+
+    def match(self, pattern: str) -> List[str]:
+        """Returns the sorted terms matching a pattern in which '*'
+        matches any (possibly empty) sequence of characters."""
+        parts = pattern.split('*')
+        if len(parts) == 1:
+            i = self._lower_bound(pattern + END)
+            found = i < len(self.term_ids) and self.offsets[i] == 0 and \
+                self.terms[self.term_ids[i]] == pattern
+            return [pattern] if found else []
+
+        # Scan the rotations for the longest part of the pattern that is
+        # either its end and its start joined by the marker, or a middle part
+        key = parts[-1] + END + parts[0]
+        for part in parts[1:-1]:
+            if len(part) > len(key):
+                key = part
+        term_ids = set(self._scan(key))
+        matches = [self.terms[term_id] for term_id in term_ids]
+        if len(parts) > 2:
+            regex = re.compile('.*'.join(map(re.escape, parts)))
+            matches = [term for term in matches if regex.fullmatch(term)]
+        return sorted(matches)
+
+    def __len__(self) -> int:
+        """Returns the number of rotations in the index."""
+        return len(self.term_ids)